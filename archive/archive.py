@@ -24,9 +24,13 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import asyncio
 import os
 import io
+import gzip
 import json
+import time
+import zipfile
 from collections import defaultdict
 import discord
 from discord.ext import commands
@@ -39,6 +43,17 @@ from cogs.utils.dataIO import dataIO
 
 PATH = os.path.join("data", "archive")
 JSON = os.path.join(PATH, "settings.json")
+CHANNELS_PATH = os.path.join(PATH, "channels")
+BUNDLES_PATH = os.path.join(PATH, "bundles")
+
+# messages per compressed chunk file
+CHUNK_SIZE = 1000
+# channels fetched at the same time; discord.py waits out history rate limits
+ARCHIVE_CONCURRENCY = 4
+# seconds between progress message edits
+PROGRESS_INTERVAL = 10
+# Discord upload limit for bundles
+UPLOAD_LIMIT = 8 * 1024 * 1024
 
 
 def nested_dict():
@@ -46,6 +61,205 @@ def nested_dict():
     return defaultdict(nested_dict)
 
 
+def message_dict(message):
+    """Serializable dict of a message."""
+    msg = {
+        "id": message.id,
+        "timestamp": message.timestamp.isoformat(),
+        "author_id": message.author.id,
+        "author_name": message.author.name,
+        "content": message.content,
+        "embeds": message.embeds,
+        "channel_id": message.channel.id,
+        "channel_name": message.channel.name,
+        "server_id": message.server.id,
+        "server_name": message.server.name,
+        "mention_everyone": message.mention_everyone,
+        "mentions_id": [m.id for m in message.mentions],
+        "mentions_name": [m.name for m in message.mentions],
+        "reactions": [],
+        "attachments": []
+    }
+    for reaction in message.reactions:
+        r = {
+            'custom_emoji': reaction.custom_emoji,
+            'count': reaction.count
+        }
+        if reaction.custom_emoji:
+            # <:emoji_name:emoji_id>
+            r['emoji'] = '<:{}:{}>'.format(
+                reaction.emoji.name,
+                reaction.emoji.id)
+        else:
+            r['emoji'] = reaction.emoji
+        msg['reactions'].append(r)
+
+    for attach in message.attachments:
+        msg['attachments'].append(attach['url'])
+    return msg
+
+
+class ArchiveProgress:
+    """Message and channel counters of an archive run."""
+
+    def __init__(self, channels=0):
+        """Init."""
+        self.channels = channels
+        self.channels_done = 0
+        self.messages = 0
+        self.started = time.monotonic()
+
+    @property
+    def rate(self):
+        elapsed = time.monotonic() - self.started
+        if elapsed <= 0:
+            return 0
+        return self.messages / elapsed
+
+    def __str__(self):
+        return "{}/{} channels, {:,} messages, {:.1f} messages/s".format(
+            self.channels_done, self.channels, self.messages, self.rate)
+
+
+def make_bundle(path, archives, channel_names):
+    """Write chunk files and a manifest of channel archives into a zip file."""
+    manifest = []
+    with zipfile.ZipFile(path, 'w') as z:
+        for archive in archives:
+            for chunk in archive.index["chunks"]:
+                z.write(
+                    os.path.join(archive.path, chunk),
+                    arcname=os.path.join(archive.channel_id, chunk))
+            manifest.append({
+                "channel_id": archive.channel_id,
+                "channel_name": channel_names.get(archive.channel_id),
+                "count": archive.count,
+                "order": archive.index.get("order"),
+                "chunks": archive.index["chunks"]
+            })
+        z.writestr("manifest.json", json.dumps(manifest, indent=4))
+    return path
+
+
+class ChannelArchive:
+    """On-disk archive of one channel.
+
+    Messages are written as they arrive from logs_from into gzipped JSON
+    Lines chunks of CHUNK_SIZE messages under data/archive/channels.
+    Only the index (chunk names, count, oldest message id, completion) is
+    kept in settings, and it is checkpointed after every chunk so that an
+    interrupted full archive can resume where it stopped.
+    """
+
+    def __init__(self, settings, server_id, channel_id):
+        """Init."""
+        self.settings = settings
+        self.channel_id = channel_id
+        self.path = os.path.join(CHANNELS_PATH, server_id, channel_id)
+        index = settings.setdefault("index", {})
+        index = index.setdefault(server_id, {})
+        self.index = index.setdefault(channel_id, {})
+        self.index.setdefault("chunks", [])
+        self.index.setdefault("count", 0)
+
+    @property
+    def count(self):
+        return self.index["count"]
+
+    @property
+    def complete(self):
+        return self.index.get("complete", False)
+
+    def checkpoint(self):
+        self.index["updated"] = dt.datetime.utcnow().isoformat()
+        dataIO.save_json(JSON, self.settings)
+
+    def reset(self):
+        """Remove archived chunks."""
+        for chunk in self.index["chunks"]:
+            try:
+                os.remove(os.path.join(self.path, chunk))
+            except FileNotFoundError:
+                pass
+        self.index.clear()
+        self.index.update(chunks=[], count=0)
+
+    def _new_chunk(self):
+        os.makedirs(self.path, exist_ok=True)
+        name = "{:05d}.jsonl.gz".format(len(self.index["chunks"]))
+        self.index["chunks"].append(name)
+        return gzip.open(os.path.join(self.path, name), 'wt', encoding='utf-8')
+
+    def _write(self, f, msg):
+        """Write message dict, rotating chunks. Return the open chunk."""
+        if f is None or self.index["count"] % CHUNK_SIZE == 0:
+            if f is not None:
+                f.close()
+                self.checkpoint()
+            f = self._new_chunk()
+        f.write(json.dumps(msg) + '\n')
+        self.index["count"] += 1
+        self.index["last_id"] = msg["id"]
+        return f
+
+    def import_messages(self, messages):
+        """Archive a list of message dicts sorted oldest first."""
+        self.reset()
+        self.index["order"] = "asc"
+        f = None
+        for msg in messages:
+            f = self._write(f, msg)
+        if f is not None:
+            f.close()
+        self.index["complete"] = True
+
+    async def fetch(self, bot, channel, count=1000, after=None, resume=False, progress=None):
+        """Stream channel messages to disk. Return number of messages written.
+
+        Without after, messages are walked from newest to oldest; with resume,
+        the walk continues before the oldest message already archived. With
+        after, messages are walked from oldest to newest.
+        """
+        before = None
+        if resume and not self.complete and self.index.get("order") == "desc":
+            if self.index.get("last_id"):
+                before = discord.Object(self.index["last_id"])
+            count -= self.count
+        else:
+            self.reset()
+            self.index["order"] = "asc" if after is not None else "desc"
+
+        written = 0
+        f = None
+        try:
+            if count > 0:
+                async for message in bot.logs_from(
+                        channel, limit=count, before=before, after=after, reverse=after is not None):
+                    f = self._write(f, message_dict(message))
+                    written += 1
+                    if progress is not None:
+                        progress.messages += 1
+        finally:
+            if f is not None:
+                f.close()
+            self.checkpoint()
+
+        # only reached when the walk was not interrupted
+        self.index["complete"] = True
+        self.checkpoint()
+        return written
+
+    def messages(self):
+        """Yield archived messages oldest first, one chunk in memory at a time."""
+        desc = self.index.get("order") == "desc"
+        chunks = self.index["chunks"]
+        for chunk in (reversed(chunks) if desc else chunks):
+            with gzip.open(os.path.join(self.path, chunk), 'rt', encoding='utf-8') as f:
+                lines = f.readlines()
+            for line in (reversed(lines) if desc else lines):
+                yield json.loads(line)
+
+
 class Archive:
     """Archive activity.
 
@@ -59,6 +273,23 @@ class Archive:
         self.settings = nested_dict()
         self.settings.update(dataIO.load_json(JSON))
         self.units = {"minute": 60, "hour": 3600, "day": 86400, "week": 604800, "month": 2592000}
+        self.migrate()
+
+    def migrate(self):
+        """Move message lists stored in settings by older versions to chunk files."""
+        migrated = False
+        for server_id, server_settings in list(self.settings.items()):
+            if server_id in ["index", "channel_listen"] or not isinstance(server_settings, dict):
+                continue
+            for channel_id, messages in list(server_settings.items()):
+                if isinstance(messages, list):
+                    ChannelArchive(self.settings, server_id, channel_id).import_messages(messages)
+                    server_settings.pop(channel_id)
+                    migrated = True
+            if not server_settings:
+                self.settings.pop(server_id)
+        if migrated:
+            dataIO.save_json(JSON, self.settings)
 
     @commands.group(pass_context=True, no_pm=True)
     async def archive(self, ctx):
@@ -75,69 +306,17 @@ class Archive:
 
         await self.bot.say("Channel logged.")
 
-    async def save_channel(self, channel: discord.Channel, count=1000, before=None, after=None, reverse=False):
+    async def save_channel(self, channel: discord.Channel, count=1000, after=None):
         """Save channel messages."""
-        server = channel.server
-        if server.id not in self.settings:
-            self.settings[server.id] = {}
-
-        channel_messages = []
-
-        async for message in self.bot.logs_from(
-                channel, limit=count, before=before, after=after, reverse=reverse):
-            msg ={
-                'author_id': message.author.id,
-                'content': message.content,
-                'timestamp': message.timestamp.isoformat(),
-                'id': message.id,
-                'reactions': []
-            }
-            for reaction in message.reactions:
-                r = {
-                    'custom_emoji': reaction.custom_emoji,
-                    'count': reaction.count
-                }
-                if reaction.custom_emoji:
-                    # <:emoji_name:emoji_id>
-                    r['emoji'] = '<:{}:{}>'.format(
-                        reaction.emoji.name,
-                        reaction.emoji.id)
-                else:
-                    r['emoji'] = reaction.emoji
-                msg['reactions'].append(r)
-            channel_messages.append(msg)
-
-        channel_messages = sorted(
-            channel_messages, key=lambda x: x['timestamp'])
-
-        self.settings[server.id][channel.id] = channel_messages
-        dataIO.save_json(JSON, self.settings)
+        archive = ChannelArchive(self.settings, channel.server.id, channel.id)
+        return await archive.fetch(self.bot, channel, count=count, after=after)
 
     async def log_channel(self, ctx, channel: discord.Channel):
         """Write channel messages from a channel."""
         server = ctx.message.server
-
-        channel_messages = self.settings[server.id][channel.id]
-        for message in channel_messages:
-            author_id = message['author_id']
-            author = server.get_member(author_id)
-            author_mention = author_id
-            if author is not None:
-                author_mention = author.mention
-            content = message['content']
-            timestamp = message['timestamp']
-            message_id = message['id']
-
-            description = '{}: {}'.format(author_mention, content)
-
-            em = discord.Embed(
-                title=channel.name,
-                description=description)
-
-            for reaction in message['reactions']:
-                em.add_field(name=reaction['emoji'], value=reaction['count'])
-
-            em.set_footer(text='{} - ID: {}'.format(timestamp, message_id))
+        archive = ChannelArchive(self.settings, server.id, channel.id)
+        for message in archive.messages():
+            em = self.message_embed(server, channel, message)
             await self.bot.say(embed=em)
 
     @checks.serverowner_or_permissions()
@@ -200,30 +379,54 @@ class Archive:
 
     @checks.serverowner_or_permissions()
     @archiveserver.command(name="full", pass_context=True, no_pm=True)
-    async def archiveserver_full(self, ctx, server_name):
-        """Archive all messages from a server. Return as JSON."""
+    async def archiveserver_full(self, ctx, server_name, count=10000):
+        """Archive messages from all channels of a server to disk.
+
+        Up to count messages per channel. Channels already archived are
+        skipped and interrupted channels resume from the last checkpoint.
+        """
         server = discord.utils.get(self.bot.servers, name=server_name)
         if server is None:
             await self.bot.say("Server not found.")
             return
-        log = {}
-        for channel in server.channels:
-            await self.bot.type()
-            log[channel.id] = {
-                "id": channel.id,
-                "name": channel.name,
-                "messages": await self.channel_messages(channel, count=10000)
-            }
-
-        filename = "server_archive-{}.json".format(server.id)
-        with io.StringIO() as f:
-            json.dump(log, f, indent=4)
-            f.seek(0)
-            await ctx.bot.send_file(
-                ctx.message.channel,
-                f,
-                filename=filename
-            )
+        channels = [c for c in server.channels if c.type == discord.ChannelType.text]
+        archives = [ChannelArchive(self.settings, server.id, c.id) for c in channels]
+        progress = ArchiveProgress(channels=len(channels))
+        semaphore = asyncio.Semaphore(ARCHIVE_CONCURRENCY)
+
+        async def fetch(channel, archive):
+            async with semaphore:
+                if not archive.complete:
+                    try:
+                        await archive.fetch(self.bot, channel, count=count, resume=True, progress=progress)
+                    except discord.Forbidden:
+                        pass
+            progress.channels_done += 1
+
+        status = await self.bot.say(
+            "Archiving {}. Re-run to resume if interrupted.\n{}".format(server.name, progress))
+        task = asyncio.ensure_future(
+            asyncio.gather(*[fetch(c, a) for c, a in zip(channels, archives)]))
+        while not task.done():
+            await asyncio.wait([task], timeout=PROGRESS_INTERVAL)
+            await self.bot.edit_message(status, "Archiving {}.\n{}".format(server.name, progress))
+        task.result()
+
+        await self.send_bundle(
+            ctx, "server_archive-{}".format(server.id),
+            [a for a in archives if a.count], {c.id: c.name for c in channels})
+
+    async def send_bundle(self, ctx, name, archives, channel_names):
+        """Zip channel archives and upload, or report the path if too large."""
+        os.makedirs(BUNDLES_PATH, exist_ok=True)
+        path = os.path.join(
+            BUNDLES_PATH, "{}-{}.zip".format(name, dt.datetime.utcnow().strftime("%Y%m%d%H%M%S")))
+        await self.bot.loop.run_in_executor(None, make_bundle, path, archives, channel_names)
+
+        if os.path.getsize(path) <= UPLOAD_LIMIT:
+            await self.bot.send_file(ctx.message.channel, path)
+        else:
+            await self.bot.say("Archive bundle is too large to upload. Saved to `{}`".format(path))
 
     @checks.serverowner_or_permissions()
     @archiveserver.command(name="listen", pass_context=True, no_pm=True)
@@ -271,124 +474,25 @@ class Archive:
         channel = discord.utils.get(server.channels, id=settings["log_channel_id"])
         if channel is None:
             return
-        msg = {
-            'author_id': message.author.id,
-            'content': message.content,
-            'timestamp': message.timestamp.isoformat(),
-            'id': message.id,
-            'reactions': [],
-            'attachments': []
-        }
-        for reaction in message.reactions:
-            r = {
-                'custom_emoji': reaction.custom_emoji,
-                'count': reaction.count
-            }
-            if reaction.custom_emoji:
-                # <:emoji_name:emoji_id>
-                r['emoji'] = '<:{}:{}>'.format(
-                    reaction.emoji.name,
-                    reaction.emoji.id)
-            else:
-                r['emoji'] = reaction.emoji
-            msg['reactions'].append(r)
-
-        for attach in message.attachments:
-            msg['attachments'].append(attach['url'])
+        msg = message_dict(message)
         em = self.message_embed(message.server, message.channel, msg)
         await self.bot.send_message(channel, embed=em)
 
 
-    async def channel_messages(self, channel: discord.Channel,
-            count=1000, before=None, after=None, reverse=False):
-        messages = []
-
-        async for message in self.bot.logs_from(
-                channel, limit=count, before=before, after=after, reverse=reverse):
-            msg = {
-                "timestamp": message.timestamp.isoformat(),
-                "author_id": message.author.id,
-                "author_name": message.author.name,
-                "content": message.content,
-                "embeds": message.embeds,
-                "channel_id": message.channel.id,
-                "channel_name": message.channel.name,
-                "server_id": message.server.id,
-                "server_name": message.server.name,
-                "mention_everyone": message.mention_everyone,
-                "mentions_id": [m.id for m in message.mentions],
-                "mentions_name": [m.name for m in message.mentions],
-                "reactions": [],
-                "attachments": []
-            }
-            for reaction in message.reactions:
-                r = {
-                    'custom_emoji': reaction.custom_emoji,
-                    'count': reaction.count
-                }
-                if reaction.custom_emoji:
-                    # <:emoji_name:emoji_id>
-                    r['emoji'] = '<:{}:{}>'.format(
-                        reaction.emoji.name,
-                        reaction.emoji.id)
-                else:
-                    r['emoji'] = reaction.emoji
-                msg['reactions'].append(r)
-
-            for attach in message.attachments:
-                msg['attachments'].append(attach['url'])
-                messages.append(msg)
-
-        messages = sorted(messages, key=lambda x: x['timestamp'])
-        return messages
-
-
     async def log_server_channel(
             self, ctx, server: discord.Server, channel: discord.Channel,
-            count=1000, before=None, after=None, reverse=False):
+            count=1000, after=None):
         """Save channel messages."""
-        channel_messages = []
-
         await self.bot.say("Logging messages.")
 
-        async for message in self.bot.logs_from(
-                channel, limit=count, before=before, after=after, reverse=reverse):
-            msg ={
-                'author_id': message.author.id,
-                'content': message.content,
-                'timestamp': message.timestamp.isoformat(),
-                'id': message.id,
-                'reactions': [],
-                'attachments': []
-            }
-            for reaction in message.reactions:
-                r = {
-                    'custom_emoji': reaction.custom_emoji,
-                    'count': reaction.count
-                }
-                if reaction.custom_emoji:
-                    # <:emoji_name:emoji_id>
-                    r['emoji'] = '<:{}:{}>'.format(
-                        reaction.emoji.name,
-                        reaction.emoji.id)
-                else:
-                    r['emoji'] = reaction.emoji
-                msg['reactions'].append(r)
-
-            for attach in message.attachments:
-                msg['attachments'].append(attach['url'])
-            channel_messages.append(msg)
-
-        channel_messages = sorted(
-            channel_messages, key=lambda x: x['timestamp'])
-
-        self.settings[server.id][channel.id] = channel_messages
-        dataIO.save_json(JSON, self.settings)
+        archive = ChannelArchive(self.settings, server.id, channel.id)
+        progress = ArchiveProgress(channels=1)
+        await archive.fetch(self.bot, channel, count=count, after=after, progress=progress)
+        progress.channels_done = 1
+        await self.bot.say(str(progress))
 
-        # write out
-        for message in channel_messages:
-            em = self.message_embed(server, channel, message)
-            await self.bot.say(embed=em)
+        await self.send_bundle(
+            ctx, "channel_archive-{}".format(channel.id), [archive], {channel.id: channel.name})
 
     def message_embed(self, server, channel, message):
         """Return message as a Discord embed."""
@@ -410,7 +514,7 @@ class Archive:
         for reaction in message['reactions']:
             em.add_field(name=reaction['emoji'], value=reaction['count'])
 
-        for attach in message['attachments']:
+        for attach in message.get('attachments', []):
             em.set_image(url=attach)
 
         em.set_footer(text='{} - ID: {}'.format(timestamp, message_id))
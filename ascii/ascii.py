@@ -24,7 +24,9 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import asyncio
 import random
+from functools import partial
 
 import discord
 from discord import Message
@@ -95,7 +97,20 @@ class Ascii:
         if url is None:
             await send_cmd_help(ctx)
             return
-        output = ascii.loadFromUrl(url, columns=columns, color=False)
+        imgutil = self.bot.get_cog("ImgUtil")
+        try:
+            if imgutil is not None:
+                # shared worker: capped download, decoded in a process pool
+                output = await imgutil.worker.img2txt(url, columns)
+            else:
+                output = await self.bot.loop.run_in_executor(
+                    None, partial(ascii.loadFromUrl, url, columns=columns, color=False))
+        except asyncio.TimeoutError:
+            await self.bot.say("Timed out processing image.")
+            return
+        except Exception as e:
+            await self.bot.say("Cannot process image: {}".format(e))
+            return
         for page in pagify(output, shorten_by=24):
             await self.bot.say(box(page))
 
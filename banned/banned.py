@@ -23,7 +23,11 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import os
+import asyncio
 import datetime as dt
+import logging
+import time
+from collections import defaultdict
 import aiohttp
 
 import discord
@@ -38,9 +42,16 @@ from oauth2client.service_account import ServiceAccountCredentials
 
 import gspread
 from fuzzywuzzy import fuzz
+from oauth2client.client import Error as OAuth2Error
+
+logger = logging.getLogger(__name__)
 
 PATH = os.path.join("data", "banned")
 JSON = os.path.join(PATH, "settings.json")
+# local copy of each server’s ban list
+CACHE_JSON = os.path.join(PATH, "banlist.json")
+# seconds between sheet refreshes
+REFRESH_INTERVAL = dt.timedelta(minutes=15).total_seconds()
 
 CREDENTIALS_FILENAME = "sheets-credentials.json"
 CREDENTIALS_JSON = os.path.join(PATH, CREDENTIALS_FILENAME)
@@ -78,6 +89,47 @@ class Player:
         self.banned_date = banned_date
 
 
+def normalize_tag(tag):
+    """Uppercase tag with leading #."""
+    tag = str(tag).strip().upper().replace('O', '0')
+    if not tag.startswith('#'):
+        tag = '#{}'.format(tag)
+    return tag
+
+
+def normalize_ign(ign):
+    """Casefolded IGN with whitespace collapsed."""
+    return ' '.join(str(ign).split()).casefold()
+
+
+class BanList:
+    """Local copy of a ban sheet with tag and IGN indexes."""
+
+    def __init__(self, records=None, updated=None):
+        """Init."""
+        self.records = records or []
+        self.updated = updated
+        self.by_tag = {}
+        self.by_ign = defaultdict(list)
+        for record in self.records:
+            self.by_tag[normalize_tag(record['PlayerTag'])] = record
+            self.by_ign[normalize_ign(record['IGN'])].append(record)
+
+    def tag(self, tag):
+        """Return record by player tag."""
+        return self.by_tag.get(normalize_tag(tag))
+
+    def ign(self, ign):
+        """Return records with the same normalised IGN."""
+        return self.by_ign.get(normalize_ign(ign), [])
+
+    def to_dict(self):
+        return {
+            "records": self.records,
+            "updated": self.updated
+        }
+
+
 class Banned:
     """Manage people who are banned from the RACF.
 
@@ -88,6 +140,13 @@ class Banned:
         """Constructor."""
         self.bot = bot
         self.settings = dataIO.load_json(JSON)
+        self.banlists = self.load_banlists()
+        self._credentials = None
+        self._client = None
+        self.task = self.bot.loop.create_task(self.refresh_task())
+
+    def __unload(self):
+        self.task.cancel()
 
     def check_server_settings(self, server):
         """check server settings. Init if necessary."""
@@ -131,6 +190,7 @@ class Banned:
         async with aiohttp.get(url) as cred:
             with open(SERVICE_KEY_JSON, "wb") as f:
                 f.write(await cred.read())
+        self._client = None
 
         await self.bot.say(
             "Attachment received and saved as {}".format(SERVICE_KEY_JSON))
@@ -149,6 +209,8 @@ class Banned:
         self.settings[server.id]["SHEET_ID"] = id
         await self.bot.say("Saved Google Spreadsheet ID.")
         dataIO.save_json(JSON, self.settings)
+        self.banlists.pop(server.id, None)
+        await self.refresh(server.id)
 
     @setbanned.command(name="info", pass_context=True)
     async def setbanned_info(self, ctx):
@@ -225,25 +287,92 @@ class Banned:
         if ctx.invoked_subcommand is None:
             await send_cmd_help(ctx)
 
-    def get_sheet(self, ctx) -> gspread.Worksheet:
-        """Return values from spreadsheet."""
-        server = ctx.message.server
-
-        credentials = ServiceAccountCredentials.from_json_keyfile_name(
-            SERVICE_KEY_JSON, scopes=SCOPES)
-        spreadsheetId = self.settings[server.id]["SHEET_ID"]
-        gc = gspread.authorize(credentials)
-        sh = gc.open_by_key(spreadsheetId)
+    def load_banlists(self):
+        """Local copies of ban lists by server id."""
+        try:
+            return {
+                server_id: BanList(**data)
+                for server_id, data in dataIO.load_json(CACHE_JSON).items()}
+        except (OSError, ValueError, TypeError, AttributeError):
+            logger.exception("Cannot read ban list cache %s, starting empty.", CACHE_JSON)
+            return {}
+
+    def save_banlists(self):
+        """Write local copies of ban lists."""
+        try:
+            dataIO.save_json(CACHE_JSON, {k: v.to_dict() for k, v in self.banlists.items()})
+        except (OSError, ValueError):
+            logger.exception("Cannot write ban list cache %s.", CACHE_JSON)
+
+    def get_client(self) -> gspread.Client:
+        """Return authorised client, logging in again only when the token expired."""
+        if self._client is None:
+            self._credentials = ServiceAccountCredentials.from_json_keyfile_name(
+                SERVICE_KEY_JSON, scopes=SCOPES)
+            self._client = gspread.authorize(self._credentials)
+        elif self._credentials.access_token_expired:
+            self._client.login()
+        return self._client
+
+    def get_sheet(self, sheet_id) -> gspread.Worksheet:
+        """Return first worksheet of spreadsheet."""
+        sh = self.get_client().open_by_key(sheet_id)
         worksheet = sh.get_worksheet(0)
 
         return worksheet
 
-    def get_players(self, ctx):
-        """Return lisst of players as dictionary."""
-        sheet = self.get_sheet(ctx)
+    def fetch_records(self, sheet_id):
+        """Return list of players as dictionary. Blocking."""
+        sheet = self.get_sheet(sheet_id)
         records = sheet.get_all_records(default_blank="-")
         return records
 
+    async def refresh(self, server_id):
+        """Replace local copy of server’s ban list from the sheet.
+
+        Keeps the previous copy if the sheet cannot be read.
+        """
+        sheet_id = self.settings.get(server_id, {}).get("SHEET_ID")
+        if not sheet_id or not os.path.exists(SERVICE_KEY_JSON):
+            return None
+        try:
+            records = await self.bot.loop.run_in_executor(
+                None, self.fetch_records, sheet_id)
+        except (gspread.exceptions.GSpreadException, OAuth2Error, OSError, ValueError):
+            logger.exception("Cannot fetch ban list of server %s, keeping local copy.", server_id)
+            return self.banlists.get(server_id)
+        banlist = BanList(records=records, updated=time.time())
+        self.banlists[server_id] = banlist
+        self.save_banlists()
+        return banlist
+
+    async def refresh_task(self):
+        """Refresh ban lists periodically."""
+        try:
+            while self == self.bot.get_cog("Banned"):
+                for server_id in list(self.settings.keys()):
+                    await self.refresh(server_id)
+                await asyncio.sleep(REFRESH_INTERVAL)
+        except asyncio.CancelledError:
+            pass
+
+    async def get_banlist(self, ctx) -> BanList:
+        """Return local copy of ban list, fetching only if there is none."""
+        server = ctx.message.server
+        banlist = self.banlists.get(server.id)
+        if banlist is None:
+            banlist = await self.refresh(server.id)
+        if banlist is None:
+            await self.bot.say("Ban list is not available.")
+        return banlist
+
+    async def get_players(self, ctx):
+        """Return list of players as dictionary."""
+        banlist = await self.get_banlist(ctx)
+        if banlist is None:
+            return []
+        return banlist.records
+
     @banned.command(name="list", pass_context=True)
     async def banned_list(self, ctx):
         """List banned players.
@@ -253,7 +382,7 @@ class Banned:
 
         Optional arguments.
         """
-        players = self.get_players(ctx)
+        players = await self.get_players(ctx)
         players = sorted(players, key=lambda x: x['IGN'])
 
         out = [
@@ -280,14 +409,10 @@ class Banned:
     @banned.command(name="tag", pass_context=True)
     async def banned_tag(self, ctx, tag):
         """Show banned player by player tag."""
-        if not tag.startswith('#'):
-            tag = '#{}'.format(tag)
-        players = self.get_players(ctx)
-        player = None
-        for p in players:
-            if p['PlayerTag'] == tag:
-                player = p
-                break
+        banlist = await self.get_banlist(ctx)
+        if banlist is None:
+            return
+        player = banlist.tag(tag)
         if player is None:
             await self.bot.say('Cannot find player with that tag.')
             return
@@ -297,17 +422,20 @@ class Banned:
     @banned.command(name="ign", pass_context=True, aliases=['name'])
     async def banned_ign(self, ctx, *, ign):
         """Find player by IGN."""
-        players = self.get_players(ctx)
-        player = None
+        banlist = await self.get_banlist(ctx)
+        if banlist is None:
+            return
+        players = banlist.records
 
         # find exact match
-        for p in players:
-            if p['IGN'] == ign:
-                player = p
-                break
-
-        if player is not None:
+        matches = banlist.ign(ign)
+        for player in matches:
             await self.bot.say(embed=self.player_embed(ctx, player))
+        if len(matches):
+            return
+
+        if not len(players):
+            await self.bot.say('Ban list is empty.')
             return
 
         # find fuzzy match
@@ -368,6 +496,8 @@ def check_file():
     defaults = {}
     if not dataIO.is_valid_json(JSON):
         dataIO.save_json(JSON, defaults)
+    if not dataIO.is_valid_json(CACHE_JSON):
+        dataIO.save_json(CACHE_JSON, {})
 
 
 def setup(bot):
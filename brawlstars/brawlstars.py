@@ -38,6 +38,7 @@ import yaml
 from cogs.utils import checks
 from cogs.utils.chat_formatting import bold
 from cogs.utils.chat_formatting import inline
+from cogs.utils.chat_formatting import pagify
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 from random import choice
@@ -232,6 +233,9 @@ class BrawlStars:
         return True
 
     def get_emoji(self, name):
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(str(name).replace('-', '').replace('.', ''))
         for emoji in self.bot.get_all_emojis():
             if emoji.name == str(str(name).replace('-', '').replace('.', '')):
                 return '<:{}:{}>'.format(emoji.name, emoji.id)
@@ -843,44 +847,38 @@ class BrawlStarsAudit:
     def __init__(self, cog: BrawlStars = None):
         """Init."""
         self.cog = cog
-
-    async def exec_add_roles(self, d_member, roles, channel=None):
-        try:
-            await self.cog.bot.add_roles(d_member, *roles)
-        except Exception as e:
-            pass
-        else:
-            if channel is not None:
-                await self.cog.bot.send_message(
-                    channel,
-                    "Add {} to {}".format(
-                        ", ".join(
-                            [r.name for r in roles]
-                        ),
-                        d_member
-                    )
-                )
-
-    async def exec_remove_roles(self, d_member, roles, channel=None):
-        try:
-            await self.cog.bot.remove_roles(d_member, *roles)
-        except Exception as e:
-            pass
-        else:
-            if channel is not None:
-                await self.cog.bot.send_message(
-                    channel,
-                    "Remove {} from {}".format(
-                        ", ".join(
-                            [r.name for r in roles]
-                        ),
-                        d_member
-                    )
-                )
+        # batched role changes, or None to apply them directly
+        role_executor = cog.bot.get_cog("RoleExecutor")
+        self.batch = role_executor.batch() if role_executor is not None else None
+
+    async def add_roles(self, member, *roles):
+        """Queue roles to add, or add them now if the RoleExecutor cog is not loaded."""
+        if self.batch is not None:
+            self.batch.add_roles(member, *roles)
+            return
+        roles = [r for r in roles if r is not None]
+        if roles:
+            try:
+                await self.cog.bot.add_roles(member, *roles)
+            except discord.DiscordException:
+                pass
+
+    async def remove_roles(self, member, *roles):
+        """Queue roles to remove, or remove them now if the RoleExecutor cog is not loaded."""
+        if self.batch is not None:
+            self.batch.remove_roles(member, *roles)
+            return
+        roles = [r for r in roles if r is not None]
+        if roles:
+            try:
+                await self.cog.bot.remove_roles(member, *roles)
+            except discord.DiscordException:
+                pass
 
     async def run(self, server: discord.Server = None, exec=False, status_channel=None):
         """Run audit against server."""
         results = dict()
+        out = []
         # Fetch club info
         clubs = await self.cog._get_clubs(server.id)
         for r, club_tag, in zip(clubs.results, clubs.club_tags):
@@ -928,17 +926,17 @@ class BrawlStarsAudit:
                 user = server.get_member(member_id)
                 if user is not None:
                     if bs_member_role in user.roles:
-                        await self.cog.bot.send_message(status_channel, "{} is not in our clubs".format(user))
+                        out.append("{} is not in our clubs".format(user))
                         if exec:
-                            await self.exec_remove_roles(user, bs_member_roles, channel=status_channel)
+                            await self.remove_roles(user, *bs_member_roles)
 
             for member_id in member_ids:
                 user = server.get_member(member_id)
                 if user is not None:
                     if bs_member_role not in user.roles:
-                        await self.cog.bot.send_message(status_channel, "{} is in our clubs".format(user))
+                        out.append("{} is in our clubs".format(user))
                         if exec:
-                            await self.exec_add_roles(user, [bs_member_role], channel=status_channel)
+                            await self.add_roles(user, bs_member_role)
 
         # clubs
         for club_tag, club in results.items():
@@ -958,21 +956,17 @@ class BrawlStarsAudit:
                 user = server.get_member(user_id)
                 if user is not None:
                     if club_role not in user.roles:
-                        await self.cog.bot.send_message(
-                            status_channel,
-                            "{} is in {}".format(user, club.get('name')))
+                        out.append("{} is in {}".format(user, club.get('name')))
                         if exec:
-                            await self.exec_add_roles(user, [club_role], channel=status_channel)
+                            await self.add_roles(user, club_role)
 
             for user_id in non_club_member_ids:
                 user = server.get_member(user_id)
                 if user is not None:
                     if club_role in user.roles:
-                        await self.cog.bot.send_message(
-                            status_channel,
-                            "{} is not in {}".format(user, club.get('name')))
+                        out.append("{} is not in {}".format(user, club.get('name')))
                         if exec:
-                            await self.exec_remove_roles(user, [club_role], channel=status_channel)
+                            await self.remove_roles(user, club_role)
 
         # add visitor for those who don’t have normal roles
         # if exec:
@@ -982,11 +976,17 @@ class BrawlStarsAudit:
         #         try:
         #             user_role_names = [r.name for r in user.roles]
         #             if len(set(user_role_names) & set(membership_role_names)) == 0:
-        #                 await self.exec_add_roles(user, [visitor_role], channel=status_channel)
+        #                 await self.add_roles(user, visitor_role)
         #         except Exception as e:
         #             await self.cog.bot.send_emssage(status_channel, "Error auditing {}".format(user))
 
-        # print_json(results)
+        if status_channel is not None and out:
+            for page in pagify("\n".join(out)):
+                await self.cog.bot.send_message(status_channel, page)
+
+        if exec and self.batch is not None:
+            await self.batch.run_and_report(channel=status_channel)
+
         await self.cog.bot.send_message(status_channel, "Audit finished")
 
 
@@ -23,16 +23,130 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
 FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
+import asyncio
 import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
 
+import numpy as np
 from cogs.utils.chat_formatting import box
+from cogs.utils.chat_formatting import pagify
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 from py_expression_eval import Parser
 
+try:
+    import resource
+except ImportError:
+    # not available on Windows: only the timeout applies
+    resource = None
+
 PATH = os.path.join("data", "calc")
 JSON = os.path.join(PATH, "settings.json")
 
+# limits of the evaluation worker process
+CPU_SECONDS = 2
+MEMORY_BYTES = 256 * 1024 * 1024
+TIMEOUT = 5
+# max rows in range tables
+MAX_ROWS = 100
+
+# numpy replacements for parser operators and functions, for range mode
+NUMPY_FUNCTIONS = {
+    'sin': np.sin,
+    'cos': np.cos,
+    'tan': np.tan,
+    'asin': np.arcsin,
+    'acos': np.arccos,
+    'atan': np.arctan,
+    'sqrt': np.sqrt,
+    'log': np.log,
+    'abs': np.abs,
+    'ceil': np.ceil,
+    'floor': np.floor,
+    'round': np.round,
+    'exp': np.exp,
+    'pow': np.power,
+    '^': np.power,
+    '%': np.mod,
+}
+
+
+def address_space():
+    """Virtual memory size of the current process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        return None
+
+
+def set_limits():
+    """Limit CPU time and memory of the current (worker) process.
+
+    Both are limits on the whole process, so they are set as headroom
+    above current usage.
+    """
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = int(usage.ru_utime + usage.ru_stime) + CPU_SECONDS
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, hard))
+
+    size = address_space()
+    if size is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (size + MEMORY_BYTES, hard))
+
+
+@lru_cache(maxsize=256)
+def compile_expression(text):
+    """Parsed expression, cached in the worker process."""
+    return Parser().parse(text)
+
+
+@lru_cache(maxsize=64)
+def compile_numpy_expression(text):
+    """Parsed expression evaluating on numpy arrays, cached in the worker process."""
+    parser = Parser()
+    for ops in [parser.ops1, parser.ops2, parser.functions]:
+        for name in ops:
+            if name in NUMPY_FUNCTIONS:
+                ops[name] = NUMPY_FUNCTIONS[name]
+    return parser.parse(text)
+
+
+def evaluate(text):
+    """Evaluate expression. Runs in worker process."""
+    set_limits()
+    return compile_expression(text).evaluate({})
+
+
+def simplify(text):
+    """Simplify expression. Runs in worker process."""
+    set_limits()
+    return compile_expression(text).simplify({}).toString()
+
+
+def evaluate_range(text, variable, start, stop, step):
+    """Evaluate expression over a range of variable values. Runs in worker process.
+
+    :return: list of (x, y)
+    """
+    set_limits()
+    # clamp before arange so a huge range is never built
+    if step > 0:
+        stop = min(stop, start + step * MAX_ROWS)
+    else:
+        stop = max(stop, start + step * MAX_ROWS)
+    x = np.arange(start, stop, step, dtype=float)[:MAX_ROWS]
+    with np.errstate(all='ignore'):
+        y = compile_numpy_expression(text).evaluate({variable: x})
+    y = np.broadcast_to(np.asarray(y, dtype=float), x.shape)
+    return list(zip(x.tolist(), y.tolist()))
+
 
 class Calc:
     """Simple Calculator"""
@@ -41,6 +155,26 @@ class Calc:
         """Init."""
         self.bot = bot
         self.config = dataIO.load_json(JSON)
+        self.pool = None
+
+    def __unload(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+    async def run(self, func, *args):
+        """Run func in the worker process.
+
+        The pool is replaced if the worker was killed or timed out.
+        """
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=1)
+        try:
+            return await asyncio.wait_for(
+                self.bot.loop.run_in_executor(self.pool, func, *args), TIMEOUT)
+        except (asyncio.TimeoutError, BrokenProcessPool):
+            self.pool.shutdown(wait=False)
+            self.pool = None
+            raise
 
     @commands.group(pass_context=True)
     async def calcset(self, ctx):
@@ -90,9 +224,14 @@ class Calc:
 
         await self.bot.say(box(input))
 
-        parser = Parser()
         try:
-            out = parser.parse(input).evaluate({})
+            out = await self.run(evaluate, input)
+        except asyncio.TimeoutError:
+            await self.bot.say(":warning: Calculation took too long.")
+            return
+        except (BrokenProcessPool, MemoryError):
+            await self.bot.say(":warning: Calculation exceeded its memory or CPU limit.")
+            return
         except ZeroDivisionError:
             await self.bot.say(":warning: Zero division error")
             return
@@ -102,9 +241,43 @@ class Calc:
         except FloatingPointError:
             await self.bot.say(":warning: floating point error.")
             return
+        except Exception as err:
+            await self.bot.say(':warning:' + str(err))
+            return
 
         await self.bot.say(box(out))
 
+    @commands.command(name="calcrange", pass_context=True)
+    async def calcrange(self, ctx, start: float, stop: float, step: float, *, expression):
+        """Tabulate an expression of x over a range.
+
+        Values of x go from start up to (not including) stop.
+        At most 100 rows.
+
+        Example:
+        !calcrange 1 14 1 100 * 1.1 ^ (x - 1)
+        """
+        if step == 0:
+            await self.bot.say(":warning: Step cannot be zero.")
+            return
+        try:
+            rows = await self.run(evaluate_range, expression, 'x', start, stop, step)
+        except asyncio.TimeoutError:
+            await self.bot.say(":warning: Calculation took too long.")
+            return
+        except (BrokenProcessPool, MemoryError):
+            await self.bot.say(":warning: Calculation exceeded its memory or CPU limit.")
+            return
+        except Exception as err:
+            await self.bot.say(':warning:' + str(err))
+            return
+
+        await self.bot.say(box(expression))
+        out = ["{:>12} {:>16}".format("x", "y")]
+        out.extend("{:>12g} {:>16g}".format(x, y) for x, y in rows)
+        for page in pagify("\n".join(out), shorten_by=24):
+            await self.bot.say(box(page))
+
     @commands.group(pass_context=True)
     async def calcfunc(self, ctx):
         """Calculating functions"""
@@ -118,11 +291,13 @@ class Calc:
             await self.bot.send_cmd_help(ctx)
             return
         try:
-            parser = Parser()
-            exp = parser.parse(expression)
-            out = exp.simplify({}).toString()
+            out = await self.run(simplify, expression)
             await self.bot.say(box(expression))
             await self.bot.say(box(out))
+        except asyncio.TimeoutError:
+            await self.bot.say(":warning: Calculation took too long.")
+        except (BrokenProcessPool, MemoryError):
+            await self.bot.say(":warning: Calculation exceeded its memory or CPU limit.")
         except Exception as err:
             await self.bot.say(':warning:' + str(err))
 
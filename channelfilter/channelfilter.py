@@ -25,6 +25,7 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import os
+import re
 from collections import defaultdict
 
 import discord
@@ -48,11 +49,31 @@ class ChannelFilter:
         """Init."""
         self.bot = bot
         self.settings = dataIO.load_json(JSON)
+        # channel id -> (combined pattern, word by lowercase word)
+        self._patterns = {}
 
     def init_server_settings(self, server):
         self.settings[server.id] = {}
+        self._patterns.clear()
         dataIO.save_json(JSON, self.settings)
 
+    def channel_pattern(self, server, channel):
+        """Return combined regex of filtered words in channel, or None.
+
+        Compiled once per channel and dropped whenever its words change.
+        """
+        if channel.id not in self._patterns:
+            channel_settings = self.settings.get(server.id, {}).get(channel.id)
+            if not isinstance(channel_settings, dict) or not len(channel_settings):
+                self._patterns[channel.id] = None
+            else:
+                words = {word.lower(): word for word in channel_settings.keys()}
+                # longest first so overlapping words report the longer one
+                pattern = re.compile("|".join(
+                    re.escape(w) for w in sorted(words, key=len, reverse=True)))
+                self._patterns[channel.id] = (pattern, words)
+        return self._patterns[channel.id]
+
     def get_server_settings(self, server):
         """Return server settings."""
         if server.id not in self.settings:
@@ -74,6 +95,7 @@ class ChannelFilter:
         channel_settings[word.lower()] = {
             'reason': reason
         }
+        self._patterns.pop(channel.id, None)
         dataIO.save_json(JSON, self.settings)
 
     def edit_word(self, server, channel, word, reason=None):
@@ -82,12 +104,14 @@ class ChannelFilter:
         channel_settings[word.lower()] = {
             'reason': reason
         }
+        self._patterns.pop(channel.id, None)
         dataIO.save_json(JSON, self.settings)
 
     def remove_word(self, server, channel, word):
         """Remove word from filter."""
         channel_settings = self.get_channel_settings(server, channel)
         success = channel_settings.pop(word, None)
+        self._patterns.pop(channel.id, None)
         dataIO.save_json(JSON, self.settings)
         if success is None:
             return False
@@ -187,20 +211,24 @@ class ChannelFilter:
             if author.server_permissions.manage_server:
                 return
 
-            channel_settings = self.get_channel_settings(server, channel)
-            if not isinstance(channel_settings, dict):
+            compiled = self.channel_pattern(server, channel)
+            if compiled is None:
+                return
+
+            pattern, words = compiled
+            match = pattern.search(message.content.lower())
+            if match is None:
                 return
 
-            for word in channel_settings.keys():
-                if word.lower() in message.content.lower():
-                    reason = channel_settings[word].get('reason', 'that')
-                    await self.bot.send_message(
-                        channel,
-                        "{} {}.".format(
-                            author.mention,
-                            reason
-                        ))
-                    await self.bot.delete_message(message)
+            word = words[match.group(0)]
+            reason = self.settings[server.id][channel.id][word].get('reason', 'that')
+            await self.bot.send_message(
+                channel,
+                "{} {}.".format(
+                    author.mention,
+                    reason
+                ))
+            await self.bot.delete_message(message)
 
 
 def check_folder():
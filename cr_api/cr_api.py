@@ -32,6 +32,8 @@ from collections import defaultdict
 import aiohttp
 import async_timeout
 from __main__ import send_cmd_help
+from cogs.utils.chat_formatting import box
+from cogs.utils.chat_formatting import pagify
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 
@@ -39,6 +41,8 @@ PATH = os.path.join("data", "cr_api")
 JSON = os.path.join(PATH, "settings.json")
 
 CHESTS = dataIO.load_json(os.path.join(PATH, 'chests.json'))
+# player profiles fetched at once for clan reports
+PROFILE_CONCURRENCY = 5
 
 
 def nested_dict():
@@ -46,6 +50,60 @@ def nested_dict():
     return defaultdict(nested_dict)
 
 
+class ChestCycle:
+    """Chest cycle with a precomputed next-occurrence table.
+
+    For every chest type, offsets[key][i] is the distance from cycle
+    position i to the next chest of that type (0 if it is at i), so
+    looking up the next chest of a type is a single index.
+    """
+
+    def __init__(self, chests):
+        """Init."""
+        self.chests = list(chests or [])
+        self.size = len(self.chests)
+        self.offsets = {}
+        for key in set(self.chests):
+            offsets = [0] * self.size
+            # sweep the cycle twice backwards so the wrap-around is covered
+            distance = None
+            for i in reversed(range(2 * self.size)):
+                p = i % self.size
+                if self.chests[p] == key:
+                    distance = 0
+                elif distance is not None:
+                    distance += 1
+                if i < self.size:
+                    offsets[p] = distance
+            self.offsets[key] = offsets
+
+    def chest(self, pos):
+        """Chest type at cycle position."""
+        if not self.size:
+            return None
+        return self.chests[pos % self.size]
+
+    def next_index(self, key, pos):
+        """Distance from pos to next chest of type key."""
+        offsets = self.offsets.get(key)
+        if offsets is None:
+            return None
+        return offsets[pos % self.size]
+
+    def upcoming(self, pos, count):
+        """Next count chests from pos, ignoring special chests."""
+        if not self.size:
+            return []
+        start = pos % self.size
+        chests = self.chests[start:start + count]
+        while len(chests) < count:
+            chests.extend(self.chests[:count - len(chests)])
+        return chests
+
+
+CHEST_CYCLE = ChestCycle(CHESTS)
+
+
 class SCTag:
     """SuperCell tags."""
 
@@ -106,6 +164,7 @@ class CRPlayerModel:
         self.data = data
         self.is_cache = is_cache
         self.CHESTS = CHESTS
+        self.CHEST_CYCLE = CHEST_CYCLE
 
     @property
     def tag(self):
@@ -387,13 +446,40 @@ class CRPlayerModel:
             return "Legendary"
         elif pos == self.chest_cycle.get("epicPos"):
             return "Epic"
-        return self.CHESTS[pos % len(self.CHESTS)]
+        return self.CHEST_CYCLE.chest(pos)
+
+    @property
+    def special_chests(self):
+        """Special chests by absolute position."""
+        special = {}
+        if self.chest_cycle is not None:
+            for key, name in (
+                    ("epicPos", "Epic"),
+                    ("legendaryPos", "Legendary"),
+                    ("superMagicalPos", "SuperMagical")):
+                pos = self.chest_cycle.get(key)
+                if pos is not None:
+                    special[pos] = name
+        return special
 
     def chests(self, count):
         """Next n chests."""
-        if self.chest_cycle_position is not None:
-            return [self.chest_by_position(self.chest_cycle_position + i) for i in range(count)]
-        return []
+        pos = self.chest_cycle_position
+        if pos is None:
+            return []
+        chests = self.CHEST_CYCLE.upcoming(pos, count)
+        for special_pos, name in self.special_chests.items():
+            if 0 <= special_pos - pos < count:
+                chests[special_pos - pos] = name
+        return chests
+
+    @staticmethod
+    def upcoming_chests(players, count):
+        """Next n chests for each player.
+
+        Return dict of player tag to list of chests.
+        """
+        return {player.tag: player.chests(count) for player in players}
 
     def chest_index(self, key):
         """Chest incdex by chest key."""
@@ -423,14 +509,10 @@ class CRPlayerModel:
 
     def chest_first_index(self, key):
         """First index of chest by key."""
-        if self.CHESTS is not None:
-            pos = self.chest_cycle_position
-            if pos is not None:
-                start_pos = pos % len(self.CHESTS)
-                chests = self.CHESTS[start_pos:]
-                chests.extend(self.CHESTS)
-                return chests.index(key)
-        return None
+        pos = self.chest_cycle_position
+        if pos is None:
+            return None
+        return self.CHEST_CYCLE.next_index(key, pos)
 
     @property
     def chest_magical_index(self):
@@ -718,6 +800,9 @@ class CRClanMemberModel:
         Goes through all servers the bot is on to find the emoji.
         """
         name = 'league{}'.format(self.league)
+        emoji_index = bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(name)
         for server in bot.servers:
             for emoji in server.emojis:
                 if emoji.name == name:
@@ -992,6 +1077,42 @@ class ClashRoyaleAPI:
         data = await self.clans_json(tags)
         return [CRClanModel(c) for c in data]
 
+    async def clan_chests(self, tag, count):
+        """Next chests of all clan members.
+
+        Return list of (player model, chests), skipping profiles which failed to load.
+        """
+        clan = await self.clan_model(tag)
+        semaphore = asyncio.Semaphore(PROFILE_CONCURRENCY)
+
+        async def fetch(member_tag):
+            async with semaphore:
+                return await self.profile_model(member_tag)
+
+        players = await asyncio.gather(*[fetch(t) for t in clan.member_tags])
+        players = [p for p in players if p.data and p.chest_cycle_position is not None]
+        chests = CRPlayerModel.upcoming_chests(players, count)
+        return [(p, chests[p.tag]) for p in players]
+
+    @crapi.command(name="clanchests", pass_context=True)
+    async def crapi_clanchests(self, ctx, tag, count=5):
+        """Next chests of all clan members."""
+        count = max(1, min(count, 20))
+        await self.bot.type()
+        try:
+            results = await self.clan_chests(tag, count)
+        except (AttributeError, TypeError):
+            await self.bot.say("Cannot load clan {}.".format(tag))
+            return
+        out = []
+        for player, chests in sorted(results, key=lambda x: x[0].name.lower()):
+            out.append("{:<15.15} {}".format(player.name, ", ".join(chests)))
+        if not out:
+            await self.bot.say("No chest data found.")
+            return
+        for page in pagify("\n".join(out), shorten_by=24):
+            await self.bot.say(box(page))
+
 
 def check_folder():
     """Check folder."""
@@ -22,21 +22,25 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import asyncio
 import datetime as dt
+import io
 import itertools
 import math
 import os
+from collections import defaultdict
 from random import choice
 
 import aiohttp
 import discord
+import numpy as np
 from box import Box
 from cogs.utils import checks
-from cogs.utils.chat_formatting import inline, box
+from cogs.utils.chat_formatting import inline, box, pagify
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 from trueskill import Rating
-from trueskill import TrueSkill, rate_1vs1, quality_1vs1
+from trueskill import TrueSkill, rate_1vs1, global_env
 
 PATH = os.path.join("data", "crladder")
 JSON = os.path.join(PATH, "settings.json")
@@ -52,6 +56,14 @@ BETA = SIGMA / 2
 TAU = BETA / 100
 DRAW_PROBABILITY = 0.01
 
+# seconds between battle log ingestion runs
+INGEST_INTERVAL = dt.timedelta(minutes=10).total_seconds()
+# battle logs fetched at the same time
+INGEST_CONCURRENCY = 5
+# seconds between writes of changed settings
+FLUSH_INTERVAL = 30
+CRPROFILE_JSON = os.path.join("data", "crprofile", "settings.json")
+
 env = TrueSkill(
     mu=MU,
     sigma=SIGMA,
@@ -93,6 +105,85 @@ def win_probability(rA: Rating, rB: Rating):
     return env.cdf(delta_mu / rsss)
 
 
+def erfc(x):
+    """Complementary error function over numpy arrays.
+
+    Chebyshev approximation from Numerical Recipes, as used by the
+    trueskill fallback backend; fractional error below 1.2e-7.
+    """
+    z = np.abs(x)
+    t = 1. / (1. + z / 2.)
+    r = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (
+        0.37409196 + t * (0.09678418 + t * (-0.18628806 + t * (
+            0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+                -0.82215223 + t * 0.17087277)))))))))
+    return np.where(x >= 0., r, 2. - r)
+
+
+class RatingsTable:
+    """Pairwise win probabilities and match qualities of series players.
+
+    win_probability[i, j] is the chance player i beats player j.
+    quality[i, j] is the 1v1 match quality (drawing chance) of i vs j.
+    """
+
+    def __init__(self, players):
+        """Init.
+
+        :param players: list of Player instances.
+        """
+        self.players = players
+        self.index = {str(p.discord_id): i for i, p in enumerate(players)}
+        mu = np.array([p.rating.mu for p in players], dtype=float)
+        sigma = np.array([p.rating.sigma for p in players], dtype=float)
+
+        delta_mu = mu[:, None] - mu[None, :]
+        variance = sigma[:, None] ** 2 + sigma[None, :] ** 2
+        # same as win_probability: env.cdf(delta_mu / rsss)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.win_probability = 0.5 * erfc(-delta_mu / np.sqrt(variance) / math.sqrt(2))
+
+        # same as quality_1vs1, which uses the global environment
+        beta_2 = 2 * global_env().beta ** 2
+        denominator = beta_2 + variance
+        self.quality = np.sqrt(beta_2 / denominator) * np.exp(-delta_mu ** 2 / (2 * denominator))
+        np.fill_diagonal(self.quality, np.nan)
+
+    def __len__(self):
+        return len(self.players)
+
+    def player_index(self, member):
+        index = self.index.get(str(member.id))
+        if index is None:
+            raise NoSuchPlayer
+        return index
+
+    def best_opponents(self, member, count=5):
+        """Indices of opponents with the highest match quality, best first."""
+        i = self.player_index(member)
+        quality = np.nan_to_num(self.quality[i])
+        quality[i] = -1
+        return [j for j in np.argsort(-quality, kind='stable')[:count] if j != i]
+
+    def round_robin(self):
+        """Pair players greedily by highest match quality.
+
+        :return: list of (i, j) pairs and index of unpaired player or None.
+        """
+        n = len(self)
+        rows, cols = np.triu_indices(n, k=1)
+        order = np.argsort(-self.quality[rows, cols], kind='stable')
+        paired = np.zeros(n, dtype=bool)
+        pairs = []
+        for k in order:
+            i, j = rows[k], cols[k]
+            if not paired[i] and not paired[j]:
+                paired[i] = paired[j] = True
+                pairs.append((i, j))
+        unpaired = [i for i in range(n) if not paired[i]]
+        return pairs, unpaired[0] if unpaired else None
+
+
 class LadderException(Exception):
     pass
 
@@ -336,6 +427,27 @@ class Settings:
         if "servers" not in self.model:
             self.model["servers"] = {}
 
+        self.dirty = False
+        # id of series players list -> (list, length, players by discord id, players by tag)
+        self._player_index = {}
+        # server id -> member id -> names of active series
+        self._member_series = {}
+        # crprofile settings fallback: (mtime, players by server)
+        self._crprofile = None
+
+    def mark_dirty(self, server=None):
+        """Flag settings for the next flush and drop member series map."""
+        self.dirty = True
+        if server is None:
+            self._member_series.clear()
+        else:
+            self._member_series.pop(server.id, None)
+
+    def flush(self):
+        """Save settings if they changed since the last save."""
+        if self.dirty:
+            self.save()
+
     def save(self):
         """Save settings to file."""
         # preprocess rating if found
@@ -348,6 +460,7 @@ class Settings:
                             "sigma": float(player.rating.sigma)
                         }
         dataIO.save_json(JSON, self.model)
+        self.dirty = False
 
     @property
     def auth(self):
@@ -357,7 +470,7 @@ class Settings:
     @auth.setter
     def auth(self, value):
         self.model['auth'] = value
-        self.save()
+        self.mark_dirty()
 
     def legacy_update(self):
         """Update players from dict to list."""
@@ -367,7 +480,7 @@ class Settings:
                 for player_id, player in series['players'].items():
                     player_list.append(player.copy())
                 series['players'] = player_list
-        self.save()
+        self.mark_dirty()
 
     def server_model(self, server):
         """Return model by server."""
@@ -378,7 +491,7 @@ class Settings:
         """Create server settings if required."""
         if server.id not in self.model['servers']:
             self.model['servers'][server.id] = self.server_default
-        self.save()
+            self.mark_dirty(server)
 
     def get_all_series(self, server):
         """Get all series."""
@@ -392,13 +505,28 @@ class Settings:
             return series
 
     def get_series_names_by_member(self, server, member):
-        names = []
-        for series_name, series in self.server_model(server)["series"].items():
-            if series.get('status') == 'active':
-                for player in series['players']:
-                    if str(player['discord_id']) == str(member.id):
-                        names.append(series_name)
-        return names
+        if server.id not in self._member_series:
+            member_series = defaultdict(list)
+            for series_name, series in self.server_model(server)["series"].items():
+                if series.get('status') == 'active':
+                    for discord_id in self.player_index(series)[0]:
+                        member_series[discord_id].append(series_name)
+            self._member_series[server.id] = member_series
+        return list(self._member_series[server.id].get(str(member.id), []))
+
+    def player_index(self, series):
+        """Return players of series by discord id and by tag."""
+        players = series['players']
+        cached = self._player_index.get(id(players))
+        if cached is None or cached[0] is not players or cached[1] != len(players):
+            by_id = {}
+            by_tag = {}
+            for player in players:
+                by_id[str(player['discord_id'])] = player
+                if player.get('tag'):
+                    by_tag[normalize_tag(player['tag'])] = player
+            cached = self._player_index[id(players)] = (players, len(players), by_id, by_tag)
+        return cached[2], cached[3]
 
     def get_series(self, server, name=None, member=None):
         if name is not None:
@@ -426,25 +554,18 @@ class Settings:
         """
         series = self.get_series(server, name=name)
         series['status'] = status
-        self.save()
+        self.mark_dirty(server)
 
     def get_player(self, server, name, member: discord.Member):
         """Check player settings."""
         self.check_server(server)
-        try:
-            series = self.get_series(server, name=name)
-            for player in series['players']:
-                if player['discord_id'] == member.id:
-                    return player
-        except NoSuchSeries:
-            raise NoSuchSeries
-        else:
-            return None
+        series = self.get_series(server, name=name)
+        return self.player_index(series)[0].get(str(member.id))
 
     def init_server(self, server):
         """Initialize server settings to default"""
         self.model[server.id] = self.server_default
-        self.save()
+        self.mark_dirty(server)
 
     def create(self, server, name):
         """Create new series by name."""
@@ -452,7 +573,7 @@ class Settings:
         if name in series:
             raise SeriesExist
         series[name] = self.series_default.copy()
-        self.save()
+        self.mark_dirty(server)
 
     def remove_series(self, server, name):
         """Remove series."""
@@ -463,7 +584,8 @@ class Settings:
         else:
             all_series = self.get_all_series(server)
             all_series.pop(name)
-            self.save()
+            self._player_index.pop(id(series['players']), None)
+            self.mark_dirty(server)
 
     def add_player(self, server, name, player: discord.Member, player_tag=None):
         """Add a player to a series."""
@@ -473,16 +595,21 @@ class Settings:
             return False
         else:
             series["players"].append(Player(discord_id=player.id, tag=player_tag).to_dict())
-            self.save()
+            self.mark_dirty(server)
             return True
 
     def get_player_tag(self, server, player: discord.Member):
         """Search crprofile cog for Clash Royale player tag."""
-        cps = Box(
-            dataIO.load_json(os.path.join("data", "crprofile", "settings.json")),
-            default_box=True, default_box_attr=None)
-        cps_players = cps.servers[server.id].players
-        player_tag = cps_players.get(player.id)
+        crprofile = self.bot.get_cog("CRProfile")
+        if crprofile is not None:
+            cps_servers = crprofile.model.settings["servers"]
+        else:
+            # read file only when it changed since last read
+            mtime = os.path.getmtime(CRPROFILE_JSON)
+            if self._crprofile is None or self._crprofile[0] != mtime:
+                self._crprofile = (mtime, dataIO.load_json(CRPROFILE_JSON).get("servers", {}))
+            cps_servers = self._crprofile[1]
+        player_tag = cps_servers.get(server.id, {}).get("players", {}).get(player.id)
         if player_tag is None:
             raise CannotFindPlayer
         else:
@@ -490,33 +617,31 @@ class Settings:
 
     def verify_player(self, series, member: discord.Member):
         """Verify player is in series."""
-        for player in series['players']:
-            if player['discord_id'] == member.id:
-                return True
-        return False
-
-    async def find_battles(self, series, member1: discord.Member, member2: discord.Member):
+        return str(member.id) in self.player_index(series)[0]
+
+    async def fetch_battles(self, session, tag):
+        """Battle log of player as Battle instances."""
+        url = 'http://api.royaleapi.com/player/{}?keys=battles'.format(tag)
+        async with session.get(url, headers={'auth': self.auth}) as resp:
+            if resp.status != 200:
+                raise APIError(resp)
+            response = await resp.json()
+        return [Battle(battle) for battle in response.get('battles', [])]
+
+    async def find_battles(self, series, member1: discord.Member, member2: discord.Member, session=None):
         """Find battle by member1 vs member2."""
-        player1, player2 = None, None
-        for player in series['players']:
-            if player['discord_id'] == member1.id:
-                player1 = player
-            if player['discord_id'] == member2.id:
-                player2 = player
-
-        url = 'http://api.royaleapi.com/player/{}?keys=battles'.format(player1['tag'])
-        response = {}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers={'auth': self.auth}) as resp:
-                if resp.status != 200:
-                    raise APIError(resp)
-                else:
-                    response = await resp.json()
+        players = self.player_index(series)[0]
+        player1 = players.get(str(member1.id))
+        player2 = players.get(str(member2.id))
+
+        if session is None:
+            async with aiohttp.ClientSession() as session:
+                all_battles = await self.fetch_battles(session, player1['tag'])
+        else:
+            all_battles = await self.fetch_battles(session, player1['tag'])
 
-        all_battles = response.get('battles')
         battles = []
-        for battle in all_battles:
-            b = Battle(battle)
+        for b in all_battles:
             add_this = True
             if not b.valid_type:
                 add_this = False
@@ -528,7 +653,6 @@ class Settings:
         return battles
 
     def is_battle_saved(self, server, name, battle: Battle):
-        self.save()
         series = self.get_series(server, name=name)
         keys = [k for k in series['matches'].keys()]
         is_in = str(battle.timestamp) in keys
@@ -544,21 +668,107 @@ class Settings:
                       player2_old_rating=player2_old_rating, battle=battle)
 
         series['matches'][str(battle.timestamp)] = match.to_dict()
-        self.save()
+        self.mark_dirty()
+
+    async def ingest_series(self, session, series):
+        """Rate new battles between series players from their battle logs.
+
+        Battle logs are fetched concurrently, deduped by timestamp against
+        saved matches and rated in chronological order. Does not save.
+
+        Ratings are read after the fetches complete and written back without
+        awaiting, so results reported while fetching are not overwritten.
+
+        :return: number of new matches.
+        """
+        tags = {normalize_tag(p['tag']) for p in series['players'] if p.get('tag')}
+        semaphore = asyncio.Semaphore(INGEST_CONCURRENCY)
+
+        async def fetch(tag):
+            async with semaphore:
+                try:
+                    return await self.fetch_battles(session, tag)
+                except (APIError, aiohttp.ClientError, asyncio.TimeoutError):
+                    return []
+
+        battle_logs = await asyncio.gather(*[fetch(tag) for tag in tags])
+
+        players = {
+            normalize_tag(p['tag']): Player.from_dict(p)
+            for p in series['players'] if p.get('tag')}
+        battles = {}
+        for battle in itertools.chain.from_iterable(battle_logs):
+            key = str(battle.timestamp)
+            if not battle.valid_type or key in series['matches'] or key in battles:
+                continue
+            if normalize_tag(battle.team_tag) in players and normalize_tag(battle.opponent_tag) in players:
+                battles[key] = battle
+
+        for battle in sorted(battles.values(), key=lambda b: int(b.timestamp)):
+            self.rate_battle(
+                series,
+                players[normalize_tag(battle.team_tag)],
+                players[normalize_tag(battle.opponent_tag)],
+                battle.winner, battle=battle)
+
+        if len(battles):
+            self.write_ratings(series, players.values())
+        return len(battles)
+
+    def rate_battle(self, series, player1: Player, player2: Player, winner, battle=None):
+        """Update player ratings by result, and record match if battle is given."""
+        player1_old_rating = env.create_rating(mu=player1.rating.mu, sigma=player1.rating.sigma)
+        player2_old_rating = env.create_rating(mu=player2.rating.mu, sigma=player2.rating.sigma)
+        if winner < 0:
+            player2.rating, player1.rating = rate_1vs1(player2.rating, player1.rating)
+        else:
+            player1.rating, player2.rating = rate_1vs1(player1.rating, player2.rating, drawn=winner == 0)
+        if battle is not None:
+            match = Match(player1=player1, player2=player2, player1_old_rating=player1_old_rating,
+                          player2_old_rating=player2_old_rating, battle=battle)
+            series['matches'][str(battle.timestamp)] = match.to_dict()
+        return player1_old_rating, player2_old_rating
+
+    def write_ratings(self, series, players):
+        """Write ratings of Player instances back to series. Does not save."""
+        ratings = {p.tag: p.rating for p in players}
+        for p in series['players']:
+            rating = ratings.get(normalize_tag(p['tag']))
+            if rating is not None:
+                p['rating'] = {
+                    "mu": float(rating.mu),
+                    "sigma": float(rating.sigma)
+                }
+
+    def recompute_series(self, series):
+        """Replay all saved matches in chronological order from initial ratings."""
+        players = {
+            normalize_tag(p['tag']): Player(discord_id=p['discord_id'], tag=p['tag'])
+            for p in series['players'] if p.get('tag')}
+        matches = sorted(series['matches'].items(), key=lambda x: int(x[0]))
+        for timestamp, match in matches:
+            p1 = players.get(normalize_tag(match['player1']['tag']))
+            p2 = players.get(normalize_tag(match['player2']['tag']))
+            if p1 is None or p2 is None:
+                continue
+            winner = match['player1']['crowns'] - match['player2']['crowns']
+            old1, old2 = self.rate_battle(series, p1, p2, winner)
+            for key, player, old in [('player1', p1, old1), ('player2', p2, old2)]:
+                match[key]['old_rating'] = {"mu": old.mu, "sigma": old.sigma}
+                match[key]['new_rating'] = {"mu": player.rating.mu, "sigma": player.rating.sigma}
+        self.write_ratings(series, players.values())
+        return len(matches)
 
     def update_player_rating(self, server, name, player):
         series = self.get_series(server, name=name)
-        update_player = None
-        for p in series['players']:
-            if p['tag'] == player.tag:
-                update_player = p
+        update_player = self.player_index(series)[1].get(normalize_tag(player.tag))
         if update_player is None:
             return False
         update_player['rating'] = {
             "mu": float(player.rating.mu),
             "sigma": float(player.rating.sigma)
         }
-        self.save()
+        self.mark_dirty()
         return True
 
 
@@ -576,6 +786,69 @@ class CRLadder:
         """Init."""
         self.bot = bot
         self.settings = Settings(bot)
+        self.session = aiohttp.ClientSession(loop=self.bot.loop)
+        self.task = self.bot.loop.create_task(self.ingest_task())
+        self.flush_task = self.bot.loop.create_task(self.flush_settings_task())
+        # (server id, series name) -> (ratings signature, RatingsTable)
+        self._tables = {}
+
+    def ratings_table(self, server, name) -> RatingsTable:
+        """Ratings table of series, recomputed only when ratings changed."""
+        series = self.settings.get_series_by_name(server, name)
+        players = [Player.from_dict(p) for p in series['players']]
+        signature = tuple((p.discord_id, p.rating.mu, p.rating.sigma) for p in players)
+        key = (server.id, name)
+        cached = self._tables.get(key)
+        if cached is None or cached[0] != signature:
+            cached = self._tables[key] = (signature, RatingsTable(players))
+        return cached[1]
+
+    def player_name(self, server, player):
+        member = server.get_member(str(player.discord_id))
+        return str(member) if member is not None else str(player.discord_id)
+
+    def __unload(self):
+        self.task.cancel()
+        self.flush_task.cancel()
+        self.settings.flush()
+        self.session.close()
+
+    async def flush_settings_task(self):
+        """Write changed settings periodically."""
+        try:
+            while self == self.bot.get_cog("CRLadder"):
+                self.settings.flush()
+                await asyncio.sleep(FLUSH_INTERVAL)
+        except asyncio.CancelledError:
+            pass
+
+    async def ingest(self):
+        """Ingest battles of all active series and save once.
+
+        :return: number of new matches.
+        """
+        count = 0
+        for server_id, server in self.settings.model['servers'].items():
+            for name, series in server['series'].items():
+                if series.get('status') == 'active':
+                    count += await self.settings.ingest_series(self.session, series)
+        if count:
+            self.settings.mark_dirty()
+            self.settings.flush()
+        return count
+
+    async def ingest_task(self):
+        """Ingest battles periodically."""
+        try:
+            while self == self.bot.get_cog("CRLadder"):
+                if self.settings.model.get('auth'):
+                    try:
+                        await self.ingest()
+                    except Exception:
+                        pass
+                await asyncio.sleep(INGEST_INTERVAL)
+        except asyncio.CancelledError:
+            pass
 
     @commands.group(pass_context=True)
     async def crladderset(self, ctx):
@@ -598,6 +871,28 @@ class CRLadder:
         self.settings.legacy_update()
         await self.bot.say("Updated old DB to new.")
 
+    @checks.mod_or_permissions()
+    @crladderset.command(name="ingest", pass_context=True)
+    async def crladderset_ingest(self, ctx):
+        """Rate new battles of all active series now."""
+        await self.bot.type()
+        count = await self.ingest()
+        await self.bot.say("Added {} new matches.".format(count))
+
+    @checks.mod_or_permissions()
+    @crladderset.command(name="recompute", pass_context=True)
+    async def crladderset_recompute(self, ctx, name):
+        """Recompute ladder ratings from match history."""
+        server = ctx.message.server
+        try:
+            series = self.settings.get_series_by_name(server, name)
+        except NoSuchSeries:
+            await self.bot.say("Cannot find series named {}".format(name))
+            return
+        count = self.settings.recompute_series(series)
+        self.settings.mark_dirty()
+        await self.bot.say("Recomputed ratings of {} from {} matches.".format(name, count))
+
     @checks.mod_or_permissions()
     @crladderset.command(name="create", pass_context=True)
     async def crladderset_create(self, ctx, name):
@@ -832,6 +1127,9 @@ class CRLadder:
 
     def bot_emoji(self, name):
         """Emoji by name."""
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(name)
         for emoji in self.bot.get_all_emojis():
             if emoji.name == name:
                 return '<:{}:{}>'.format(emoji.name, emoji.id)
@@ -876,7 +1174,7 @@ class CRLadder:
                 await self.bot.say("{} is not registered is this series.".format(member))
                 return
             try:
-                battles = await self.settings.find_battles(series, author, member)
+                battles = await self.settings.find_battles(series, author, member, session=self.session)
             except APIError as e:
                 print(e.response)
                 await self.bot.say("Error fetching results from API. Please try again later.")
@@ -978,9 +1276,7 @@ class CRLadder:
                         value="This battle is not saved because it has already been registered.",
                         inline=False
                     )
-                await self.bot.say(embed=em)
-
-                # save battle
+                # save battle before awaiting so a concurrent ingest cannot interleave
                 if save_battle:
                     self.settings.save_battle(
                         player1=p_author, player2=p_member, player1_old_rating=p_author_rating_old,
@@ -988,6 +1284,9 @@ class CRLadder:
                     )
                     updated = self.settings.update_player_rating(server, name, p_author)
                     updated = self.settings.update_player_rating(server, name, p_member)
+
+                await self.bot.say(embed=em)
+                if save_battle:
                     await self.bot.say("Elo updated.")
 
     @crladder.command(name="winprob", aliases=['w'], pass_context=True)
@@ -1002,35 +1301,22 @@ class CRLadder:
             pm1 = member1
             pm2 = member2
         try:
-            series = self.settings.get_series_by_name(server, name)
-            if series is None:
-                raise NoSuchSeries
-            p1 = None
-            p2 = None
-            for player in series['players']:
-                if str(player['discord_id']) == pm1.id:
-                    p1 = player
-                if str(player['discord_id']) == pm2.id:
-                    p2 = player
-            if p1 is None:
-                raise NoSuchPlayer
-            if p2 is None:
-                raise NoSuchPlayer
+            table = self.ratings_table(server, name)
+            i = table.player_index(pm1)
+            j = table.player_index(pm2)
         except NoSuchSeries:
             await self.bot.say("No series with that name on this server.")
         except NoSuchPlayer:
             await self.bot.say("Player not found.")
         else:
-            p1_rating = env.create_rating(mu=p1['rating']['mu'], sigma=p1['rating']['sigma'])
-            p2_rating = env.create_rating(mu=p2['rating']['mu'], sigma=p2['rating']['sigma'])
             await self.bot.say(
                 box(
                     "Winning probabilities for series {}:\n"
                     "{: >6.1%} {}\n"
                     "{: >6.1%} {}".format(
                         name,
-                        win_probability(p1_rating, p2_rating), pm1,
-                        win_probability(p2_rating, p1_rating), pm2,
+                        table.win_probability[i, j], pm1,
+                        table.win_probability[j, i], pm2,
                     ), lang='py')
             )
 
@@ -1046,34 +1332,89 @@ class CRLadder:
             pm1 = member1
             pm2 = member2
         try:
-            series = self.settings.get_series_by_name(server, name)
-            if series is None:
-                raise NoSuchSeries
-            p1 = None
-            p2 = None
-            for player in series['players']:
-                if str(player['discord_id']) == pm1.id:
-                    p1 = player
-                if str(player['discord_id']) == pm2.id:
-                    p2 = player
-            if p1 is None:
-                raise NoSuchPlayer
-            if p2 is None:
-                raise NoSuchPlayer
+            table = self.ratings_table(server, name)
+            i = table.player_index(pm1)
+            j = table.player_index(pm2)
         except NoSuchSeries:
             await self.bot.say("No series with that name on this server.")
         except NoSuchPlayer:
             await self.bot.say("Player not found.")
         else:
-            p1_rating = env.create_rating(mu=p1['rating']['mu'], sigma=p1['rating']['sigma'])
-            p2_rating = env.create_rating(mu=p2['rating']['mu'], sigma=p2['rating']['sigma'])
             await self.bot.say(
                 "If {} plays against {}, "
                 "there is a {:.1%} chance to draw.".format(
-                    pm1, pm2, quality_1vs1(p1_rating, p2_rating)
+                    pm1, pm2, table.quality[i, j]
                 )
             )
 
+    @crladder.command(name="opponent", aliases=['o'], pass_context=True)
+    async def crladder_opponent(self, ctx, name, member: discord.Member = None, count=5):
+        """Best next opponents by match quality."""
+        server = ctx.message.server
+        if member is None:
+            member = ctx.message.author
+        try:
+            table = self.ratings_table(server, name)
+            i = table.player_index(member)
+        except NoSuchSeries:
+            await self.bot.say("No series with that name on this server.")
+            return
+        except NoSuchPlayer:
+            await self.bot.say("Player not found.")
+            return
+
+        out = ["Best opponents for {} in series {}:".format(member, name)]
+        out.append("{: >7} {: >7}".format("Quality", "Win"))
+        for j in table.best_opponents(member, count=count):
+            out.append("{: >7.1%} {: >7.1%} {}".format(
+                table.quality[i, j], table.win_probability[i, j],
+                self.player_name(server, table.players[j])))
+        await self.bot.say(box('\n'.join(out), lang='py'))
+
+    @crladder.command(name="probtable", pass_context=True)
+    async def crladder_probtable(self, ctx, name):
+        """Win probabilities of all players in a series as CSV.
+
+        Row player’s chance to beat column player.
+        """
+        server = ctx.message.server
+        try:
+            table = self.ratings_table(server, name)
+        except NoSuchSeries:
+            await self.bot.say("No series with that name on this server.")
+            return
+
+        names = [self.player_name(server, p).replace(',', ' ') for p in table.players]
+        out = [','.join([''] + names)]
+        for player_name, row in zip(names, table.win_probability):
+            out.append(','.join([player_name] + ['{:.3f}'.format(v) for v in row]))
+        fp = io.BytesIO('\n'.join(out).encode('utf-8'))
+        await self.bot.send_file(
+            ctx.message.channel, fp, filename="crladder-{}.csv".format(name),
+            content="Win probabilities for series {}.".format(name))
+
+    @crladder.command(name="roundrobin", pass_context=True)
+    async def crladder_roundrobin(self, ctx, name):
+        """Suggest pairings with the highest match quality."""
+        server = ctx.message.server
+        try:
+            table = self.ratings_table(server, name)
+        except NoSuchSeries:
+            await self.bot.say("No series with that name on this server.")
+            return
+
+        pairs, unpaired = table.round_robin()
+        out = ["Suggested pairings for series {}:".format(name)]
+        for i, j in pairs:
+            out.append("{: >6.1%} {} vs {}".format(
+                table.quality[i, j],
+                self.player_name(server, table.players[i]),
+                self.player_name(server, table.players[j])))
+        if unpaired is not None:
+            out.append("Bye: {}".format(self.player_name(server, table.players[unpaired])))
+        for page in pagify('\n'.join(out), shorten_by=24):
+            await self.bot.say(box(page, lang='py'))
+
 
 def check_folder():
     """Check folder."""
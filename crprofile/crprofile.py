@@ -32,9 +32,11 @@ import math
 import os
 import re
 import socket
+import time
 import urllib.request
 from collections import OrderedDict
 from collections import defaultdict
+from collections import namedtuple
 from datetime import timedelta
 from random import choice
 
@@ -56,11 +58,14 @@ DATA_UPDATE_INTERVAL = timedelta(minutes=30).seconds
 
 API_FETCH_TIMEOUT = 10
 
+VERIFY_CACHE_TTL = timedelta(minutes=10).seconds
+
 BOTCOMMANDER_ROLES = ["Bot Commander"]
 
 CREDITS = 'Selfish + SML'
 
 CARDS = None
+CARDS_BY_NAME = None
 
 
 def grouper(n, iterable, fillvalue=None):
@@ -101,14 +106,16 @@ def get_card_rarity(card):
     rarity = card.get('rarity')
     if rarity is not None:
         return rarity
-    global CARDS
-    if CARDS is None:
-        with urllib.request.urlopen("https://royaleapi.github.io/cr-api-data/json/cards.json") as r:
-            CARDS = json.loads(r.read().decode())
-    for c in CARDS:
-        if c.get('name') == card.get('name'):
-            return c.get('rarity')
-    return None
+    global CARDS, CARDS_BY_NAME
+    if CARDS_BY_NAME is None:
+        if CARDS is None:
+            with urllib.request.urlopen("https://royaleapi.github.io/cr-api-data/json/cards.json") as r:
+                CARDS = json.loads(r.read().decode())
+        CARDS_BY_NAME = {c.get('name'): c for c in CARDS}
+    c = CARDS_BY_NAME.get(card.get('name'))
+    if c is None:
+        return None
+    return c.get('rarity')
 
 
 def normalized_card_level(card):
@@ -156,6 +163,8 @@ class Constants:
         else:
             Constants.__instance = self
         self._cards = None
+        self._cards_by_id = None
+        self._cards_by_name = None
         self._alliance_badges = None
         self._rarities = None
         self._arenas = None
@@ -201,13 +210,13 @@ class Constants:
         return None
 
     def get_card(self, id=None, name=None):
-        for card in self.cards:
-            if id is not None:
-                if card.get('id') == id:
-                    return card
-            if name is not None:
-                if card.get('name') == name:
-                    return card
+        if self._cards_by_name is None:
+            self._cards_by_id = {card.get('id'): card for card in self.cards}
+            self._cards_by_name = {card.get('name'): card for card in self.cards}
+        if id is not None and id in self._cards_by_id:
+            return self._cards_by_id[id]
+        if name is not None:
+            return self._cards_by_name.get(name)
         return None
 
     def get_arena(self, id=None):
@@ -218,6 +227,64 @@ class Constants:
         return None
 
 
+CardInfo = namedtuple('CardInfo', ['rarity', 'type', 'elixir', 'emoji_name', 'sort_key'])
+
+
+class CardTables:
+    """Card and upgrade lookup tables, built once from Constants."""
+
+    __instance = None
+
+    SORT_RARITIES = {
+        'common': 1,
+        'rare': 2,
+        'epic': 3,
+        'legendary': 4
+    }
+    SORT_TYPE = dict(
+        Troop=1,
+        Building=2,
+        Spell=3,
+    )
+
+    def __init__(self):
+        constants = Constants.get_instance()
+        # rarity name -> (level count, upgrade material count by level)
+        self.upgrade_requirements = {
+            r['name']: (r['level_count'], tuple(r['upgrade_material_count']))
+            for r in constants.rarities
+        }
+        # card key -> CardInfo
+        self.cards = {
+            c['key']: self.card_info(c)
+            for c in constants.cards
+        }
+
+    @staticmethod
+    def get_instance():
+        if CardTables.__instance is None:
+            CardTables.__instance = CardTables()
+        return CardTables.__instance
+
+    @classmethod
+    def card_info(cls, card):
+        """CardInfo from card dict."""
+        rarity = card.get('rarity')
+        card_type = card.get('type')
+        elixir = card.get('elixir', 0)
+        return CardInfo(
+            rarity=rarity,
+            type=card_type,
+            elixir=elixir,
+            emoji_name=card.get('key', '').replace('-', ''),
+            sort_key=(
+                cls.SORT_RARITIES.get((rarity or '').lower(), 0),
+                cls.SORT_TYPE.get(card_type, 0),
+                elixir or 0
+            )
+        )
+
+
 class BotEmoji:
     """Emojis available in bot."""
 
@@ -245,11 +312,26 @@ class BotEmoji:
 
     def name(self, name):
         """Emoji by name."""
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(name)
         for emoji in self.bot.get_all_emojis():
             if emoji.name == name:
                 return '<:{}:{}>'.format(emoji.name, emoji.id)
         return ''
 
+    def tags(self):
+        """Emoji name -> emoji message string of all emojis, in one pass."""
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            emojis = emoji_index.index.values()
+        else:
+            emojis = self.bot.get_all_emojis()
+        tags = {}
+        for emoji in emojis:
+            tags.setdefault(emoji.name, '<:{}:{}>'.format(emoji.name, emoji.id))
+        return tags
+
     def key(self, key):
         """Chest emojis by api key name or key.
 
@@ -903,56 +985,37 @@ class CRPlayerModel:
         return self.info_data.get("cards")
 
     def card_collection(self, bot_emoji):
-
-        sort_rarities = {
-            'common': 1,
-            'rare': 2,
-            'epic': 3,
-            'legendary': 4
-        }
-        sort_type = dict(
-            Troop=1,
-            Building=2,
-            Spell=3,
-        )
-        cards = self.cards
-        cards = sorted(
-            cards, key=lambda x: (
-                sort_rarities[x.get('rarity', '').lower()] or 0,
-                sort_type.get(x.get('type'), 0),
-                x.get('elixir', 0)
-            )
-        )
+        card_infos = CardTables.get_instance().cards
+        tags = bot_emoji.tags()
 
         out = []
-        for card in cards.copy():
-            key = card.get('key')
-            key = key.replace('-', '')
-            card['emoji'] = bot_emoji.name(key)
+        for card in self.cards:
+            info = card_infos.get(card.get('key'))
+            if info is None:
+                info = CardTables.card_info(card)
+            emoji = tags.get(info.emoji_name, '')
+            card['emoji'] = emoji
 
             out.append({
-                'emoji': bot_emoji.name(key),
+                'emoji': emoji,
                 'level': card['level'],
                 'count': card['count'],
-                'rarity': card['rarity'],
-                'elixir': card['elixir'],
-                'type': card.get('type'),
-                'type_sort': sort_type.get(card.get('type')),
+                'rarity': card.get('rarity') or info.rarity,
+                'elixir': card.get('elixir', info.elixir),
+                'type': card.get('type', info.type),
+                'type_sort': CardTables.SORT_TYPE.get(card.get('type', info.type)),
+                'sort_key': info.sort_key,
             })
 
+        out.sort(key=lambda x: x['sort_key'])
         return out
 
     def upgrades(self, rarity, count, level):
-        rarities = Constants.get_instance().rarities
-        data = None
-        for r in rarities:
-            if rarity == r['name']:
-                data = r
-                break
+        level_count, upgrade_material_count = CardTables.get_instance().upgrade_requirements[rarity]
 
-        is_max = level == data['level_count']
+        is_max = level == level_count
 
-        upgrade_req = data["upgrade_material_count"][level - 1]
+        upgrade_req = upgrade_material_count[level - 1]
 
         if is_max:
             percent = 100
@@ -996,6 +1059,32 @@ class Settings:
         self.settings = nested_dict()
         self.settings.update(dataIO.load_json(filepath))
         self.session = session
+        # server id -> player tag -> [member ids]
+        self._tag_index = {}
+        # member id -> (expiry, player tag)
+        self._verify_cache = {}
+
+    def _server_tag_index(self, server):
+        """Tag -> member ids index for server, built on first use."""
+        index = self._tag_index.get(server.id)
+        if index is None:
+            index = defaultdict(list)
+            try:
+                players = self.settings["servers"][server.id]["players"]
+            except KeyError:
+                players = {}
+            for member_id, player_tag in players.items():
+                index[player_tag].append(member_id)
+            self._tag_index[server.id] = index
+        return index
+
+    def _unindex(self, server, member_id, tag):
+        index = self._server_tag_index(server)
+        member_ids = index.get(tag)
+        if member_ids and member_id in member_ids:
+            member_ids.remove(member_id)
+            if not member_ids:
+                index.pop(tag, None)
 
     def init_server(self, server):
         """Initialized server settings.
@@ -1003,11 +1092,13 @@ class Settings:
         This will wipe all clan data and player data.
         """
         self.settings["servers"][server.id] = self.SERVER_DEFAULTS
+        self._tag_index.pop(server.id, None)
         self.save()
 
     def init_players(self, server):
         """Initialized clan settings."""
         self.settings["servers"][server.id]["players"] = {}
+        self._tag_index.pop(server.id, None)
         self.save()
 
     def check_server(self, server):
@@ -1034,8 +1125,16 @@ class Settings:
         if "players" not in self.settings["servers"][server.id]:
             self.settings["servers"][server.id]["players"] = {}
         players = self.settings["servers"][server.id]["players"]
+        # build the index before players changes so the new tag is not indexed twice
+        index = self._server_tag_index(server)
+        old_tag = players.get(member.id)
+        if old_tag is not None:
+            self._unindex(server, member.id, old_tag)
         players[member.id] = tag
         self.settings["servers"][server.id]["players"] = players
+        if member.id not in index[tag]:
+            index[tag].append(member.id)
+        self._verify_cache.pop(member.id, None)
         self.save()
 
     def rm_player_tag(self, server, member=None, tag=None):
@@ -1043,16 +1142,20 @@ class Settings:
         self.check_server(server)
         if member is not None:
             try:
-                self.settings["servers"][server.id]["players"].pop(member.id, None)
+                old_tag = self.settings["servers"][server.id]["players"].pop(member.id, None)
             except KeyError:
                 pass
+            else:
+                if old_tag is not None:
+                    self._unindex(server, member.id, old_tag)
+            self._verify_cache.pop(member.id, None)
             self.save()
         if tag is not None:
+            member_ids = self._server_tag_index(server).pop(tag, [])
             try:
-                players = self.settings["servers"][server.id]["players"].copy()
-                for member_id, player_tag in players.items():
-                    if player_tag == tag:
-                        self.settings["servers"][server.id]["players"].pop(member_id, None)
+                for member_id in member_ids:
+                    self.settings["servers"][server.id]["players"].pop(member_id, None)
+                    self._verify_cache.pop(member_id, None)
             except KeyError:
                 pass
             self.save()
@@ -1062,15 +1165,24 @@ class Settings:
 
     def tag2member(self, server, tag):
         """Return Discord member from player tag."""
-        try:
-            players = self.settings["servers"][server.id]["players"]
-            for member_id, player_tag in players.items():
-                if player_tag == tag:
-                    return server.get_member(member_id)
-        except KeyError:
-            pass
+        member_ids = self._server_tag_index(server).get(tag)
+        if member_ids:
+            return server.get_member(member_ids[0])
+
+        # fall back to the registry shared by RACFAudit
+        registry = self.shared_registry
+        if registry is not None:
+            player = registry.get(tag)
+            if player is not None:
+                return server.get_member(player.get('user_id'))
         return None
 
+    @property
+    def shared_registry(self):
+        """Player tag registry kept by the RACFAudit cog, if loaded."""
+        racfaudit = self.bot.get_cog("RACFAudit")
+        return getattr(racfaudit, 'registry', None)
+
     def server_settings(self, server):
         """Return server settings."""
         return self.settings["servers"][server.id]
@@ -1164,23 +1276,41 @@ class Settings:
         """Return player tag from member."""
         # first try to get from settings
         try:
-            players = self.settings["servers"][server.id]["players"]
-            for member_id, player_tag in players.items():
-                if member_id == member.id:
-                    return player_tag
+            player_tag = self.settings["servers"][server.id]["players"].get(member.id)
         except KeyError:
-            pass
+            player_tag = None
+        if player_tag is not None:
+            return player_tag
+
+        # then from the registry shared by RACFAudit
+        registry = self.shared_registry
+        if registry is not None:
+            tags = registry.tags_for_user(member.id)
+            if tags:
+                return tags[0]
 
         # if verified url is set, try to get from server
         if self.verify_url:
-            url = self.verify_url + "&discord_id=" + member.id
-            async with self.session.get(url) as resp:
-                data = await resp.json()
-            results = data.get('results', [])
-            if results:
-                return results[0].get('player_tag')
+            return await self.verified_tag(member)
         return None
 
+    async def verified_tag(self, member):
+        """Return player tag from verification endpoint, cached for VERIFY_CACHE_TTL."""
+        now = time.monotonic()
+        cached = self._verify_cache.get(member.id)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        url = self.verify_url + "&discord_id=" + member.id
+        async with self.session.get(url) as resp:
+            data = await resp.json()
+        results = data.get('results', [])
+        player_tag = None
+        if results:
+            player_tag = results[0].get('player_tag')
+        self._verify_cache[member.id] = (now + VERIFY_CACHE_TTL, player_tag)
+        return player_tag
+
     def emoji(self, name=None, key=None):
         """Chest emojis by api key name or key.
 
@@ -1200,6 +1330,9 @@ class Settings:
         if name is None:
             if key in emojis:
                 name = emojis[key]
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(name)
         for server in self.bot.servers:
             for emoji in server.emojis:
                 if emoji.name == name:
@@ -1258,6 +1391,7 @@ class Settings:
     def verify_url(self, value):
         """Verification endpoint."""
         self.settings['verify_url'] = value
+        self._verify_cache.clear()
         self.save()
 
     @property
@@ -1310,6 +1444,8 @@ class CRProfile:
         self.bot = bot
         self.bot_emoji = BotEmoji(bot)
         self.session = aiohttp.ClientSession()
+        # build card tables off the event loop
+        bot.loop.run_in_executor(None, CardTables.get_instance)
         self.model = Settings(bot, JSON, session=self.session)
 
     def __unload(self):
@@ -65,6 +65,9 @@ def clean_tag(tag):
 
 
 def get_emoji(bot, name):
+    emoji_index = bot.get_cog("EmojiIndex")
+    if emoji_index is not None:
+        return emoji_index.tag(name, default=name)
     for emoji in bot.get_all_emojis():
         if emoji.name == name:
             return '<:{}:{}>'.format(emoji.name, emoji.id)
@@ -175,11 +178,18 @@ class CWReady:
         tag = None
 
         # if tag is none, attempt to load from racf_audit
-        db = os.path.join("data", "racf_audit", "player_db.json")
-        players = dataIO.load_json(db)
-        for k, v in players.items():
-            if v.get('user_id') == member.id:
-                tag = v.get('tag')
+        racf_audit = self.bot.get_cog("RACFAudit")
+        if racf_audit is not None:
+            # includes tags still in the registry log
+            player = racf_audit.registry.get_by_user(member.id)
+            if player is not None:
+                tag = player.get('tag')
+        else:
+            db = os.path.join("data", "racf_audit", "player_db.json")
+            players = dataIO.load_json(db)
+            for k, v in players.items():
+                if v.get('user_id') == member.id:
+                    tag = v.get('tag')
 
         # try to get tag from verification URL
         verify_url = self.settings.get('verify_url')
@@ -475,7 +485,11 @@ class CWReady:
                         ))
                 league.update(dict(cards=cards))
 
-        total_card_count = len(await get_card_constants())
+        deck = self.bot.get_cog("Deck")
+        if deck is not None:
+            total_card_count = len(deck.card_constants.cards)
+        else:
+            total_card_count = len(await get_card_constants())
         maxed.update(dict(
             total=len(maxed['cards']),
             total_percent=len(maxed['cards']) / total_card_count
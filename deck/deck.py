@@ -24,12 +24,14 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 # force update skeleton dragons 2
+import asyncio
 import datetime
 import datetime as dt
 import io
 import os
 import re
 import string
+from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 
 import aiohttp
@@ -46,11 +48,13 @@ from discord.ext import commands
 SETTINGS_PATH = os.path.join("data", "deck", "settings.json")
 AKA_PATH = os.path.join("data", "deck", "cards_aka.yaml")
 CARDS_JSON_PATH = os.path.join("data", "deck", "cards.json")
+CARDS_META_PATH = os.path.join("data", "deck", "cards_meta.json")
 max_deck_per_user = 5
 
 PAGINATION_TIMEOUT = 20.0
 HELP_URL = "https://github.com/smlbiobot/SML-Cogs/wiki/Deck#usage"
 CARDS_JSON_URL = "https://royaleapi.github.io/cr-api-data/json/cards.json"
+CARDS_REFRESH_INTERVAL = int(dt.timedelta(hours=24).total_seconds())
 
 
 numbs = {
@@ -68,12 +72,104 @@ class BotEmoji:
 
     def name(self, name):
         """Emoji by name."""
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(name)
         for emoji in self.bot.get_all_emojis():
             if emoji.name == name:
                 return '<:{}:{}>'.format(emoji.name, emoji.id)
         return ''
 
 
+class CardConstants:
+    """Clash Royale card constants.
+
+    Loaded from the local cards.json so cold starts need no network and
+    refreshed from CARDS_JSON_URL using the stored ETag. Other cogs use it
+    through bot.get_cog("Deck").card_constants.
+    """
+
+    def __init__(self, path=CARDS_JSON_PATH, meta_path=CARDS_META_PATH, aka_path=AKA_PATH):
+        """Init."""
+        self.path = path
+        self.meta_path = meta_path
+        with open(aka_path) as f:
+            self.aka = yaml.load(f, Loader=yaml.FullLoader)
+        self.load(dataIO.load_json(path))
+
+    def load(self, cards):
+        """Set cards and rebuild indexes."""
+        self.cards = cards
+        self.by_key = {c["key"]: c for c in cards}
+        self.by_id = {c["id"]: c for c in cards}
+        self.by_name = {c["name"].lower(): c for c in cards}
+        self.by_rarity = defaultdict(list)
+        for c in cards:
+            self.by_rarity[c["rarity"]].append(c)
+
+        # alias -> card key
+        self.by_alias = {}
+        for c in cards:
+            self.by_alias[c["key"]] = c["key"]
+            self.by_alias[c["key"].replace('-', '')] = c["key"]
+        for k, v in self.aka.items():
+            for value in v:
+                self.by_alias[value] = k
+            self.by_alias[k.replace('-', '')] = k
+
+    def get(self, key=None, id=None, name=None, alias=None):
+        """Return card dict by key, id, name or alias."""
+        if key is not None:
+            return self.by_key.get(key)
+        if id is not None:
+            try:
+                return self.by_id.get(int(id))
+            except ValueError:
+                return None
+        if name is not None:
+            return self.by_name.get(name.lower())
+        if alias is not None:
+            return self.by_key.get(self.by_alias.get(alias))
+        return None
+
+    def rarity(self, key):
+        """Return rarity of card by key."""
+        card = self.by_key.get(key)
+        if card is None:
+            return None
+        return card["rarity"]
+
+    async def refresh(self, session=None):
+        """Fetch cards if changed upstream. Return True if updated."""
+        meta = {}
+        if dataIO.is_valid_json(self.meta_path):
+            meta = dataIO.load_json(self.meta_path)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+
+        close_session = session is None
+        if session is None:
+            session = aiohttp.ClientSession()
+        try:
+            async with session.get(CARDS_JSON_URL, headers=headers) as resp:
+                if resp.status != 200:
+                    return False
+                cards = await resp.json()
+                etag = resp.headers.get("ETag")
+        finally:
+            if close_session:
+                await session.close()
+
+        self.load(cards)
+        dataIO.save_json(self.path, cards)
+        dataIO.save_json(self.meta_path, {
+            "etag": etag,
+            "updated": dt.datetime.utcnow().isoformat()
+        })
+        return True
+
+
 class Deck:
     """Clash Royale Deck Builder."""
 
@@ -81,18 +177,7 @@ class Deck:
         """Init."""
         self.bot = bot
         self.settings = dataIO.load_json(SETTINGS_PATH)
-        self.cards = dataIO.load_json(CARDS_JSON_PATH)
-
-        # init card data
-        self.cards_abbrev = {}
-
-        with open(AKA_PATH) as f:
-            aka = yaml.load(f, Loader=yaml.FullLoader)
-
-        for k, v in aka.items():
-            for value in v:
-                self.cards_abbrev[value] = k
-            self.cards_abbrev[k.replace('-', '')] = k
+        self.card_constants = CardConstants()
 
         self.card_w = 302
         self.card_h = 363
@@ -107,26 +192,44 @@ class Deck:
         # pagination tracking
         self.track_pagination = None
 
-        self._cards_json = None
-
         # Used for Pillow blocking code
         self.threadex = ThreadPoolExecutor(max_workers=2)
 
+        self.task = self.bot.loop.create_task(self.refresh_cards_task())
+
+    def __unload(self):
+        """Remove task when unloaded."""
+        self.task.cancel()
+
+    async def refresh_cards_task(self):
+        """Refresh card constants periodically."""
+        try:
+            while True:
+                try:
+                    await self.card_constants.refresh()
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                    pass
+                await asyncio.sleep(CARDS_REFRESH_INTERVAL)
+        except asyncio.CancelledError:
+            pass
+
+    @property
+    def cards(self):
+        """List of card dicts."""
+        return self.card_constants.cards
+
+    @property
+    def cards_abbrev(self):
+        """Card alias -> card key."""
+        return self.card_constants.by_alias
+
     @property
     def valid_card_keys(self):
         """Valid card keys."""
-        return [card["key"] for card in self.cards]
+        return self.card_constants.by_key.keys()
 
     async def cards_json(self):
-        url = CARDS_JSON_URL
-        if self._cards_json is None:
-            import json
-            with open(CARDS_JSON_PATH) as f:
-                self._cards_json = json.load(f)
-            # async with aiohttp.ClientSession() as session:
-            #     async with session.get(url) as response:
-            #         self._cards_json = await response.json()
-        return self._cards_json
+        return self.card_constants.cards
 
     @commands.group(pass_context=True, no_pm=True)
     @checks.mod_or_permissions()
@@ -257,16 +360,16 @@ class Deck:
 
     async def card_decklink_to_key(self, decklink):
         """Decklink id to card."""
-        for card in self.cards:
-            if decklink == str(card["id"]):
-                return card["key"]
+        card = self.card_constants.get(id=decklink)
+        if card is not None:
+            return card["key"]
         return None
 
     async def card_key_to_decklink(self, key):
         """Card key to decklink id."""
-        for card in self.cards:
-            if key == card["key"]:
-                return str(card["id"])
+        card = self.card_constants.get(key=key)
+        if card is not None:
+            return str(card["id"])
         return None
 
     async def decklink_to_cards(self, url):
@@ -512,7 +615,7 @@ class Deck:
             names = [key]
             name = card["name"]
             for abbrev_k, abbrev_v in self.cards_abbrev.items():
-                if abbrev_v == key:
+                if abbrev_v == key and abbrev_k != key:
                     names.append(abbrev_k)
             rarity = card["rarity"]
             elixir = card["elixir"]
@@ -756,8 +859,9 @@ class Deck:
         # total card exclude mirror (0-elixir cards)
         card_count = 0
 
-        for card in self.cards:
-            if card["key"] in card_keys:
+        for key in card_keys:
+            card = self.card_constants.get(key=key)
+            if card is not None:
                 total_elixir += card["elixir"]
                 if card["elixir"]:
                     card_count += 1
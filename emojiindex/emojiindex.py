@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2019 SML
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+from discord.ext import commands
+from cogs.utils import checks
+
+
+class EmojiIndex:
+    """Name -> emoji index of all emojis available to the bot.
+
+    Other cogs look emojis up through bot.get_cog("EmojiIndex") instead of
+    scanning bot.get_all_emojis() on every call. The index is rebuilt
+    lazily after any server or emoji change. When several servers have an
+    emoji with the same name, the first one found wins, as with a scan.
+    """
+
+    def __init__(self, bot):
+        """Init."""
+        self.bot = bot
+        self._index = None
+
+    @property
+    def index(self):
+        """Emoji name -> discord.Emoji."""
+        if self._index is None:
+            index = {}
+            for emoji in self.bot.get_all_emojis():
+                index.setdefault(emoji.name, emoji)
+            self._index = index
+        return self._index
+
+    def invalidate(self):
+        """Rebuild on next lookup."""
+        self._index = None
+
+    def get(self, name):
+        """Return emoji by name, or None."""
+        return self.index.get(str(name))
+
+    def tag(self, name, default=''):
+        """Return emoji as a message string by name, or default."""
+        emoji = self.get(name)
+        if emoji is None:
+            return default
+        return '<:{}:{}>'.format(emoji.name, emoji.id)
+
+    @checks.is_owner()
+    @commands.command()
+    async def emojiindex(self):
+        """Rebuild emoji index and show its size."""
+        self.invalidate()
+        await self.bot.say("Indexed {} emojis.".format(len(self.index)))
+
+    async def on_ready(self):
+        self.invalidate()
+
+    async def on_server_join(self, server):
+        self.invalidate()
+
+    async def on_server_remove(self, server):
+        self.invalidate()
+
+    async def on_server_emojis_update(self, before, after):
+        self.invalidate()
+
+
+def setup(bot):
+    """Setup."""
+    n = EmojiIndex(bot)
+    bot.add_cog(n)
@@ -24,9 +24,14 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import asyncio
+import hashlib
 import io
 import os
+from collections import OrderedDict
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse
 
 import aiohttp
@@ -35,15 +40,186 @@ from __main__ import send_cmd_help
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 
+try:
+    import resource
+except ImportError:
+    # not available on Windows: only the timeout applies
+    resource = None
+
 PATH = os.path.join("data", "imgutil")
 JSON = os.path.join(PATH, "settings.json")
 
+# largest download accepted
+MAX_BYTES = 8 * 1024 * 1024
+# images are decoded / reduced to fit within this many pixels per side
+MAX_DIMENSION = 2048
+# seconds allowed for one transform
+TRANSFORM_TIMEOUT = 30
+TRANSFORM_WORKERS = 2
+# results kept by (url hash, operation)
+CACHE_SIZE = 32
+# limits of the transform worker processes
+CPU_SECONDS = TRANSFORM_TIMEOUT
+MEMORY_BYTES = 512 * 1024 * 1024
+
 
 def nested_dict():
     """Recursively nested defaultdict."""
     return defaultdict(nested_dict)
 
 
+class ImageWorkerError(Exception):
+    pass
+
+
+class ImageTooLarge(ImageWorkerError):
+    pass
+
+
+# address_space and set_limits are the calc cog's worker limits. They run in
+# the worker process, so they cannot be reached through bot.get_cog.
+def address_space():
+    """Virtual memory size of the current process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        return None
+
+
+def set_limits():
+    """Limit CPU time and memory of the current (worker) process.
+
+    Both are limits on the whole process, so they are set as headroom
+    above current usage.
+    """
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu = int(usage.ru_utime + usage.ru_stime) + CPU_SECONDS
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, hard))
+
+    size = address_space()
+    if size is not None:
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (size + MEMORY_BYTES, hard))
+
+
+def open_image(data, max_dimension=MAX_DIMENSION):
+    """Decode image bytes, reduced to fit within max_dimension.
+
+    JPEGs are decoded at reduced scale with draft, others are reduced after.
+    """
+    im = Image.open(io.BytesIO(data))
+    im.draft('RGB', (max_dimension, max_dimension))
+    if max(im.size) > max_dimension:
+        im.thumbnail((max_dimension, max_dimension))
+    return im
+
+
+def rotate_image(data, degree):
+    """Return image rotated counter-clockwise as JPEG bytes. Runs in worker process."""
+    set_limits()
+    im = open_image(data)
+    im = im.convert('RGB').rotate(float(degree), expand=True)
+    with io.BytesIO() as f:
+        im.save(f, "JPEG")
+        return f.getvalue()
+
+
+def image_to_ascii(data, columns):
+    """Return image as ascii art. Runs in worker process.
+
+    Same mapping as ascii.loadFromUrl without color, on the reduced image.
+    """
+    set_limits()
+    from ascii import asciify
+
+    im = open_image(data, max_dimension=max(columns * 8, 64)).convert('RGB')
+    rows = max(1, int(round(columns * im.size[1] / im.size[0])))
+    im = im.resize((columns, rows))
+    px = im.load()
+    lines = []
+    for y in range(rows):
+        lines.append(''.join(asciify.getRawChar(*px[x, y], 1) for x in range(columns)))
+    return '\n'.join(lines) + '\n'
+
+
+class ImageWorker:
+    """Download images with a byte cap and transform them in a process pool.
+
+    Shared with other cogs through the ImgUtil cog:
+    bot.get_cog("ImgUtil").worker
+    """
+
+    def __init__(self, loop, max_bytes=MAX_BYTES, workers=TRANSFORM_WORKERS, timeout=TRANSFORM_TIMEOUT):
+        """Init."""
+        self.loop = loop
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.workers = workers
+        self.pool = None
+        self.session = aiohttp.ClientSession(loop=loop)
+        self.cache = OrderedDict()
+
+    def close(self):
+        self.session.close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
+
+    async def download(self, url):
+        """Return image bytes, reading at most max_bytes."""
+        async with self.session.get(url, timeout=10) as resp:
+            if resp.status != 200:
+                raise ImageWorkerError("Download failed with status {}.".format(resp.status))
+            length = resp.headers.get('Content-Length')
+            if length is not None and int(length) > self.max_bytes:
+                raise ImageTooLarge("Image is larger than {:,} bytes.".format(self.max_bytes))
+            data = bytearray()
+            while True:
+                chunk = await resp.content.read(65536)
+                if not chunk:
+                    break
+                data.extend(chunk)
+                if len(data) > self.max_bytes:
+                    raise ImageTooLarge("Image is larger than {:,} bytes.".format(self.max_bytes))
+        return bytes(data)
+
+    async def run(self, url, func, *args):
+        """Return func(image bytes, *args) run in the process pool, cached.
+
+        The pool is replaced if a worker was killed or timed out.
+        """
+        key = (hashlib.sha1(url.encode('utf-8')).hexdigest(), func.__name__) + args
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+
+        data = await self.download(url)
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            result = await asyncio.wait_for(
+                self.loop.run_in_executor(self.pool, func, data, *args), self.timeout)
+        except (asyncio.TimeoutError, BrokenProcessPool):
+            # the job keeps its worker busy until the CPU limit stops it, so start a fresh pool
+            self.pool.shutdown(wait=False)
+            self.pool = None
+            raise
+
+        self.cache[key] = result
+        if len(self.cache) > CACHE_SIZE:
+            self.cache.popitem(last=False)
+        return result
+
+    async def rotate(self, url, degree):
+        return await self.run(url, rotate_image, float(degree))
+
+    async def img2txt(self, url, columns):
+        return await self.run(url, image_to_ascii, int(columns))
+
+
 class ImgUtil:
     """Image utility."""
 
@@ -52,6 +228,10 @@ class ImgUtil:
         self.bot = bot
         self.settings = nested_dict()
         self.settings.update(dataIO.load_json(JSON))
+        self.worker = ImageWorker(bot.loop)
+
+    def __unload(self):
+        self.worker.close()
 
     @commands.group(name="imgutil", aliases=["iu"], pass_context=True, no_pm=True)
     async def imgutil(self, ctx):
@@ -67,18 +247,25 @@ class ImgUtil:
         """
         a = urlparse(url)
         filename = os.path.basename(a.path)
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=10) as resp:
-                img = await resp.read()
-                im = Image.open(io.BytesIO(img))
-                im = im.rotate(float(degree), expand=True)
-
-                with io.BytesIO() as f:
-                    im.save(f, "JPEG")
-                    f.seek(0)
-                    message = await ctx.bot.send_file(
-                        ctx.message.channel, f,
-                        filename=filename, content="Rotated image:")
+        try:
+            img = await self.worker.rotate(url, degree)
+        except asyncio.TimeoutError:
+            await self.bot.say("Timed out processing image.")
+            return
+        except (BrokenProcessPool, MemoryError):
+            await self.bot.say("Image processing exceeded its limits.")
+            return
+        except ImageTooLarge as e:
+            await self.bot.say(str(e))
+            return
+        except (ImageWorkerError, aiohttp.ClientError, OSError, ValueError) as e:
+            await self.bot.say("Cannot process image: {}".format(e))
+            return
+
+        with io.BytesIO(img) as f:
+            message = await ctx.bot.send_file(
+                ctx.message.channel, f,
+                filename=filename, content="Rotated image:")
 
 
 def check_folder():
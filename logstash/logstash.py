@@ -24,12 +24,17 @@ DEALINGS IN THE SOFTWARE.
 
 import asyncio
 import logging
+import logging.handlers
 import os
+import queue
 import re
 import json
+import socket
+import threading
+from collections import Counter
 from datetime import timedelta
 
-import logstash
+from logstash.formatter import LogstashFormatterVersion1
 from __main__ import send_cmd_help
 from discord import Channel
 from discord import ChannelType
@@ -59,6 +64,13 @@ DB_PATH = os.path.join('data', 'logstash', 'logstash.db')
 PATH = os.path.join('data', 'logstash')
 JSON = os.path.join(PATH, 'settings.json')
 
+# max entities in one gauge record
+GAUGE_CHUNK_SIZE = 100
+# records waiting to be sent; further records are dropped
+QUEUE_SIZE = 10000
+# max records sent per write
+BATCH_SIZE = 100
+
 EMOJI_P = re.compile('\<\:.+?\:\d+\>')
 UEMOJI_P = re.compile(u'['
                       u'\U0001F300-\U0001F64F'
@@ -68,6 +80,218 @@ UEMOJI_P = re.compile(u'['
                       re.UNICODE)
 
 
+def chunks(items, size=GAUGE_CHUNK_SIZE):
+    """Split list into lists of at most size items."""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+class GaugeState:
+    """Hashed signatures of entities logged as gauges.
+
+    Used to emit only entities which changed since the last run.
+    """
+
+    def __init__(self):
+        """Init."""
+        # (kind, id) -> hash of signature
+        self.signatures = {}
+        self.seen = set()
+
+    def changed(self, kind, id, signature):
+        """Record signature of entity and return True if it changed."""
+        key = (kind, id)
+        self.seen.add(key)
+        value = hash(signature)
+        if self.signatures.get(key) == value:
+            return False
+        self.signatures[key] = value
+        return True
+
+    def finish(self):
+        """Forget entities not seen since last finish and return their keys."""
+        removed = [key for key in self.signatures if key not in self.seen]
+        for key in removed:
+            del self.signatures[key]
+        self.seen = set()
+        return removed
+
+    def reset(self):
+        self.signatures.clear()
+        self.seen = set()
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler which drops records instead of blocking when full."""
+
+    def __init__(self, queue):
+        """Init."""
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogstashTransport:
+    """Background writer sending queued records to Logstash in batches.
+
+    Runs in its own thread. Connects on first send and reconnects after
+    errors; a batch which fails to send is dropped and counted.
+    """
+
+    def __init__(self, host=HOST, port=PORT, protocol='udp', queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE):
+        """Init."""
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.batch_size = batch_size
+        self.formatter = LogstashFormatterVersion1()
+        self.handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self.sock = None
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self._stop = object()
+        self._thread = None
+
+    @property
+    def queue(self):
+        return self.handler.queue
+
+    @property
+    def stats(self):
+        return {
+            'queued': self.queue.qsize(),
+            'sent': self.sent,
+            'batches': self.batches,
+            'dropped': self.handler.dropped,
+            'failed': self.failed
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='logstash-transport', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Send remaining records and stop the writer."""
+        try:
+            self.queue.put(self._stop, timeout=timeout)
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.close()
+
+    def connect(self):
+        if self.protocol == 'tcp':
+            self.sock = socket.create_connection((self.host, self.port), timeout=5)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send(self, batch):
+        """Send formatted records."""
+        if self.sock is None:
+            self.connect()
+        if self.protocol == 'tcp':
+            self.sock.sendall(b''.join(line + b'\n' for line in batch))
+        else:
+            for line in batch:
+                self.sock.sendto(line, (self.host, self.port))
+
+    def run(self):
+        while True:
+            record = self.queue.get()
+            records = [record]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._stop in records
+            records = [r for r in records if r is not self._stop]
+
+            if len(records):
+                try:
+                    self.send([self.formatter.format(r) for r in records])
+                except Exception:
+                    self.failed += len(records)
+                    self.close()
+                else:
+                    self.sent += len(records)
+                    self.batches += 1
+            if stop:
+                return
+
+
+class LocalListener:
+    """Logstash stand-in collecting records sent to a local port.
+
+    with LocalListener('udp') as listener:
+        transport = LogstashTransport(port=listener.port, protocol='udp')
+        ...
+    listener.records  # decoded JSON records
+    """
+
+    def __init__(self, protocol='udp', host='127.0.0.1'):
+        """Init."""
+        self.protocol = protocol
+        self.records = []
+        if protocol == 'tcp':
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.bind((host, 0))
+            self.sock.listen(1)
+        else:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sock.bind((host, 0))
+        self.sock.settimeout(0.5)
+        self.port = self.sock.getsockname()[1]
+        self._running = False
+        self._thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        self._running = True
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._running = False
+        self._thread.join()
+        self.sock.close()
+
+    def run(self):
+        conn = None
+        buffer = b''
+        while self._running:
+            try:
+                if self.protocol == 'tcp':
+                    if conn is None:
+                        conn, _ = self.sock.accept()
+                        conn.settimeout(0.5)
+                    data = conn.recv(65536)
+                    if not data:
+                        conn.close()
+                        conn = None
+                        continue
+                    buffer += data
+                    *lines, buffer = buffer.split(b'\n')
+                else:
+                    lines = [self.sock.recv(65536)]
+            except socket.timeout:
+                continue
+            self.records.extend(json.loads(line.decode('utf-8')) for line in lines if line)
+        if conn is not None:
+            conn.close()
+
+
 class Logstash:
     """Send activity of Discord using Google Analytics."""
 
@@ -76,9 +300,14 @@ class Logstash:
         self.bot = bot
         self.settings = dataIO.load_json(JSON)
         self.extra = {}
+        self.gauges = GaugeState()
+        self.gauge_lock = asyncio.Lock()
         self.task = bot.loop.create_task(self.loop_task())
 
-        self.handler = logstash.LogstashHandler(HOST, PORT, version=1)
+        # records are sent by a writer thread so the event loop never blocks on the socket
+        self.transport = LogstashTransport(HOST, PORT)
+        self.transport.start()
+        self.handler = self.transport.handler
 
         self.logger = logging.getLogger('discord.logger')
         self.logger.setLevel(logging.INFO)
@@ -94,11 +323,10 @@ class Logstash:
         """
         self.logger.removeHandler(self.handler)
         logging.getLogger("red").removeHandler(self.handler)
+        self.transport.stop()
 
     async def loop_task(self):
         """Loop task."""
-        # pass
-        # disabled to see if it is causing memory problems
         await self.bot.wait_until_ready()
         self.extra = {
             'log_type': 'discord.logger',
@@ -106,7 +334,7 @@ class Logstash:
             'bot_id': self.bot.user.id,
             'bot_name': self.bot.user.name
         }
-        self.log_all_gauges()
+        await self.log_all_gauges()
         await asyncio.sleep(INTERVAL)
         if self is self.bot.get_cog('Logstash'):
             self.task = self.bot.loop.create_task(self.loop_task())
@@ -121,9 +349,15 @@ class Logstash:
     @logstash.command(name="all", pass_context=True)
     async def logstash_all(self):
         """Send all stats."""
-        self.log_all_gauges()
+        await self.log_all_gauges(full=True)
         await self.bot.say("Logged all.")
 
+    @logstash.command(name="stats", pass_context=True)
+    async def logstash_stats(self, ctx):
+        """Show transport counters."""
+        await self.bot.say(
+            "\n".join("{}: {:,}".format(k, v) for k, v in self.transport.stats.items()))
+
     @logstash.command(name="log", pass_context=True)
     async def logstash_log(self, ctx, key, *, json_str):
         """Log an arbitrary event with key an json input.
@@ -180,11 +414,11 @@ class Logstash:
 
     async def on_ready(self):
         """Bot ready."""
-        self.log_all_gauges()
+        await self.log_all_gauges()
 
     async def on_resume(self):
         """Bot resume."""
-        self.log_all_gauges()
+        await self.log_all_gauges()
 
     def get_message_sca(self, message: Message):
         """Return server, channel and author from message."""
@@ -452,16 +686,37 @@ class Logstash:
         extra.update(self.get_mentions_extra(after))
         self.log_discord_event('message.edit', extra)
 
-    def log_all_gauges(self):
-        """Log all gauge values."""
-        self.log_servers()
-        self.log_channels()
-        self.log_members()
-        self.log_voice()
-        self.log_players()
-        self.log_uptime()
-        self.log_server_roles()
-        self.log_server_channels()
+    async def log_all_gauges(self, full=False):
+        """Log all gauge values.
+
+        Only entities which changed since the last run are logged, unless full.
+        Yields to the event loop between chunks.
+        """
+        async with self.gauge_lock:
+            if full:
+                self.gauges.reset()
+            self.log_servers()
+            await asyncio.sleep(0)
+            await self.log_channels()
+            await self.log_members()
+            self.log_voice()
+            self.log_players()
+            self.log_uptime()
+            await self.log_server_roles()
+            await self.log_server_channels()
+            self.log_removed(self.gauges.finish())
+
+    def log_chunked(self, key, name, items, extra=None):
+        """Log list of items in records of at most GAUGE_CHUNK_SIZE items."""
+        item_chunks = list(chunks(items))
+        for index, item_chunk in enumerate(item_chunks):
+            chunk_extra = (extra or {}).copy()
+            chunk_extra.update({
+                name: item_chunk,
+                'chunk_index': index,
+                'chunk_count': len(item_chunks)
+            })
+            self.log_discord_gauge(key, extra=chunk_extra)
 
     def log_servers(self):
         """Log servers."""
@@ -474,13 +729,14 @@ class Logstash:
             'discord_gauge': event_key,
             'server_count': len(servers)
         })
-        servers_data = []
-        for server in servers:
-            servers_data.append(self.get_server_params(server))
-        extra['servers'] = servers_data
         self.logger.info(self.get_event_key(event_key), extra=extra)
 
-    def log_channels(self):
+        servers_data = [
+            self.get_server_params(server) for server in servers
+            if self.gauges.changed('server', server.id, (server.name,))]
+        self.log_chunked('servers.changed', 'servers', servers_data)
+
+    async def log_channels(self):
         """Log channels."""
         channels = list(self.bot.get_all_channels())
         extra = {
@@ -488,28 +744,41 @@ class Logstash:
         }
         self.log_discord_gauge('all_channels', extra=extra)
 
-        # individual channels
-        for channel in channels:
-            self.log_channel(channel)
+        # individual channels which changed
+        for index, channel in enumerate(channels):
+            signature = (channel.name, channel.position, channel.server.id, str(channel.type))
+            if self.gauges.changed('channel', channel.id, signature):
+                self.log_channel(channel)
+            if index % GAUGE_CHUNK_SIZE == 0:
+                await asyncio.sleep(0)
 
     def log_channel(self, channel: Channel):
         """Log one channel."""
         extra = {'channel': self.get_channel_params(channel)}
         self.log_discord_gauge('channel', extra=extra)
 
-    def log_members(self):
+    async def log_members(self):
         """Log members."""
-        members = list(self.bot.get_all_members())
-        unique = set(m.id for m in members)
+        member_count = 0
+        unique = set()
+        for index, member in enumerate(self.bot.get_all_members()):
+            member_count += 1
+            unique.add(member.id)
+            signature = (
+                member.name, member.display_name, member.bot, str(member.status),
+                member.game.name if member.game else None,
+                tuple(r.id for r in member.roles))
+            if self.gauges.changed('member', (member.server.id, member.id), signature):
+                self.log_member(member)
+            if index % GAUGE_CHUNK_SIZE == 0:
+                await asyncio.sleep(0)
+
         extra = {
-            'member_count': len(members),
+            'member_count': member_count,
             'unique_member_count': len(unique)
         }
         self.log_discord_gauge('all_members', extra=extra)
 
-        for member in members:
-            self.log_member(member)
-
     def log_member(self, member: Member):
         """Log member."""
         extra = {'member': self.get_member_params(member)}
@@ -527,47 +796,54 @@ class Logstash:
         """Log updtime."""
         pass
 
-    def log_server_roles(self):
+    async def log_server_roles(self):
         """Log server roles."""
         for server in self.bot.servers:
-            extra = {}
-            extra['server'] = self.get_server_params(server)
-            extra['roles'] = []
-
-            roles = server.role_hierarchy
-
             # count number of members with a particular role
-            for index, role in enumerate(roles):
-                count = sum([1 for m in server.members if role in m.roles])
+            counts = Counter(role.id for m in server.members for role in m.roles)
 
+            roles = []
+            for index, role in enumerate(server.role_hierarchy):
                 role_params = self.get_role_params(role)
-                role_params['count'] = count
+                role_params['count'] = counts[role.id]
                 role_params['hierachy_index'] = index
+                roles.append(role_params)
 
-                extra['roles'].append(role_params)
+            signature = tuple((r['id'], r['name'], r['count']) for r in roles)
+            if self.gauges.changed('server.roles', server.id, signature):
+                extra = {'server': self.get_server_params(server)}
+                self.log_chunked('server.roles', 'roles', roles, extra=extra)
+            await asyncio.sleep(0)
 
-            self.log_discord_gauge('server.roles', extra)
-
-    def log_server_channels(self):
+    async def log_server_channels(self):
         """Log server channels."""
         for server in self.bot.servers:
-            extra = {
-                'server': self.get_server_params(server),
-                'channels': {
-                    'text': [],
-                    'voice': []
-                }
+            channels = {
+                'text': [],
+                'voice': []
             }
-            channels = sorted(server.channels, key=lambda x:x.position)
-
-            for channel in channels:
+            for channel in sorted(server.channels, key=lambda x: x.position):
                 channel_params = self.get_server_channel_params(channel)
                 if channel.type == ChannelType.text:
-                    extra['channels']['text'].append(channel_params)
+                    channels['text'].append(channel_params)
                 elif channel.type == ChannelType.voice:
-                    extra['channels']['voice'].append(channel_params)
-
-            self.log_discord_gauge('server.channels', extra)
+                    channels['voice'].append(channel_params)
+
+            signature = tuple(
+                (c['id'], c['name'], c['position'])
+                for c in channels['text'] + channels['voice'])
+            if self.gauges.changed('server.channels', server.id, signature):
+                extra = {'server': self.get_server_params(server)}
+                for channel_type in ['text', 'voice']:
+                    self.log_chunked(
+                        'server.channels', 'channels.{}'.format(channel_type), channels[channel_type],
+                        extra=extra)
+            await asyncio.sleep(0)
+
+    def log_removed(self, keys):
+        """Log entities which no longer exist."""
+        removed = [{'kind': kind, 'id': str(id)} for kind, id in keys]
+        self.log_chunked('removed', 'removed', removed)
 
 
 def check_folder():
@@ -26,6 +26,7 @@ DEALINGS IN THE SOFTWARE.
 
 import argparse
 import asyncio
+import bisect
 import itertools
 import os
 from collections import defaultdict
@@ -66,6 +67,113 @@ def nested_dict():
     return defaultdict(nested_dict)
 
 
+def normalize_name(name):
+    """Casefolded name for member search."""
+    return str(name).casefold()
+
+
+class MemberIndex:
+    """Role and name indexes of server members.
+
+    Built once per server and kept current from member events.
+    """
+
+    def __init__(self, server):
+        """Init."""
+        self.server = server
+        # role id -> member ids
+        self.role_members = defaultdict(set)
+        # member id -> normalised display name / username
+        self.display_names = {}
+        self.usernames = {}
+        self._sorted_names = None
+        for member in server.members:
+            self.add(member)
+
+    def add(self, member):
+        for role in member.roles:
+            self.role_members[role.id].add(member.id)
+        self.display_names[member.id] = normalize_name(member.display_name)
+        self.usernames[member.id] = normalize_name(member.name)
+        self._sorted_names = None
+
+    def remove(self, member):
+        for member_ids in self.role_members.values():
+            member_ids.discard(member.id)
+        self.display_names.pop(member.id, None)
+        self.usernames.pop(member.id, None)
+        self._sorted_names = None
+
+    def update(self, before, after):
+        if before.roles != after.roles:
+            for role in before.roles:
+                self.role_members[role.id].discard(before.id)
+            for role in after.roles:
+                self.role_members[role.id].add(after.id)
+        if before.display_name != after.display_name or before.name != after.name:
+            self.display_names[after.id] = normalize_name(after.display_name)
+            self.usernames[after.id] = normalize_name(after.name)
+            self._sorted_names = None
+
+    def remove_role(self, role):
+        self.role_members.pop(role.id, None)
+
+    def role_name_members(self, role_name):
+        """Member ids with any role of that name (case-insensitive)."""
+        member_ids = set()
+        for role in self.server.roles:
+            if role.name.lower() == role_name:
+                member_ids |= self.role_members.get(role.id, set())
+        return member_ids
+
+    def query(self, plus, minus):
+        """Member ids with all of the plus role names and none of the minus."""
+        plus = list(plus)
+        if not len(plus):
+            return set()
+        member_ids = self.role_name_members(plus[0])
+        for role_name in plus[1:]:
+            member_ids = member_ids & self.role_name_members(role_name)
+        for role_name in minus:
+            member_ids = member_ids - self.role_name_members(role_name)
+        return member_ids
+
+    def no_role(self):
+        """Member ids without any role other than @everyone."""
+        with_roles = set()
+        for role_id, member_ids in self.role_members.items():
+            if role_id != self.server.id:
+                with_roles |= member_ids
+        return set(self.display_names) - with_roles
+
+    @property
+    def sorted_names(self):
+        if self._sorted_names is None:
+            names = [(name, member_id, True) for member_id, name in self.display_names.items()]
+            names += [(name, member_id, False) for member_id, name in self.usernames.items()]
+            self._sorted_names = sorted(names)
+        return self._sorted_names
+
+    def search(self, query, usernames=True):
+        """Member ids whose name contains query, prefix matches first."""
+        query = normalize_name(query)
+        results = []
+        names = self.sorted_names
+        index = bisect.bisect_left(names, (query,))
+        while index < len(names) and names[index][0].startswith(query):
+            name, member_id, is_display = names[index]
+            if (is_display or usernames) and member_id not in results:
+                results.append(member_id)
+            index += 1
+        found = set(results)
+        for member_id, name in self.display_names.items():
+            if member_id in found:
+                continue
+            if query in name or (usernames and query in self.usernames[member_id]):
+                results.append(member_id)
+        return results
+
+
 class MemberManagement:
     """Member Management plugin for Red Discord bot."""
 
@@ -74,6 +182,50 @@ class MemberManagement:
         self.bot = bot
         self.settings = nested_dict()
         self.settings.update(dataIO.load_json(JSON))
+        self.indexes = {}
+
+    def member_index(self, server) -> MemberIndex:
+        """Return member index of server, building it on first use."""
+        if server.id not in self.indexes:
+            self.indexes[server.id] = MemberIndex(server)
+        return self.indexes[server.id]
+
+    def members(self, server, member_ids):
+        """Return members by ids."""
+        members = [server.get_member(member_id) for member_id in member_ids]
+        return [m for m in members if m is not None]
+
+    async def on_member_join(self, member):
+        if member.server.id in self.indexes:
+            self.indexes[member.server.id].add(member)
+
+    async def on_member_remove(self, member):
+        if member.server.id in self.indexes:
+            self.indexes[member.server.id].remove(member)
+
+    async def on_member_update(self, before, after):
+        if after.server.id in self.indexes:
+            self.indexes[after.server.id].update(before, after)
+
+    async def on_server_role_delete(self, role):
+        if role.server.id in self.indexes:
+            self.indexes[role.server.id].remove_role(role)
+
+    async def on_server_remove(self, server):
+        self.indexes.pop(server.id, None)
+
+    async def on_ready(self):
+        # events may have been missed while disconnected: rebuild on next lookup
+        self.indexes.clear()
+
+    async def on_resumed(self):
+        self.indexes.clear()
+
+    async def on_server_join(self, server):
+        self.indexes.pop(server.id, None)
+
+    async def on_server_available(self, server):
+        self.indexes.pop(server.id, None)
 
     @commands.group(pass_context=True, no_pm=True)
     @checks.mod_or_permissions()
@@ -267,21 +419,14 @@ class MemberManagement:
 
         await self.bot.say('\n'.join(out))
 
+        index = self.member_index(server)
         if option_norole:
-            for m in server.members:
-                if len(m.roles) == 1:
-                    out_members.add(m)
+            out_members = set(self.members(server, index.no_role()))
         elif len(plus):
             # only output if argument is supplied
             # include roles with '+' flag
             # exclude roles with '-' flag
-            for m in server.members:
-                roles = set([r.name.lower() for r in m.roles])
-                if option_everyone:
-                    roles.add('@everyone')
-                exclude = len(roles & minus)
-                if not exclude and roles >= plus:
-                    out_members.add(m)
+            out_members = set(self.members(server, index.query(plus, minus)))
 
         # only role
         if option_only_role:
@@ -408,18 +553,12 @@ class MemberManagement:
         out.append("__List of roles on {}__".format(server.name))
         roles_to_list = self.get_server_roles(server, *roles)
 
-        out_roles = {}
-        for role in roles_to_list:
-            out_roles[role.id] = {'role': role, 'count': 0}
-        for member in server.members:
-            for role in member.roles:
-                if role in roles_to_list:
-                    out_roles[role.id]['count'] += 1
+        index = self.member_index(server)
         for role in server.role_hierarchy:
             if role in roles_to_list:
                 out.append(
                     "**{}** ({} members)".format(
-                        role.name, out_roles[role.id]['count']))
+                        role.name, len(index.role_members.get(role.id, set()))))
         for page in pagify("\n".join(out), shorten_by=12):
             await self.bot.say(page)
 
@@ -541,12 +680,7 @@ class MemberManagement:
             return
 
         server = ctx.message.server
-        results = []
-        for member in server.members:
-            for member_name in [member.display_name, member.name]:
-                if name.lower() in member_name.lower():
-                    results.append(member)
-                    break
+        results = self.members(server, self.member_index(server).search(name))
 
         if not len(results):
             await self.bot.say("Cannot find any users with that name.")
@@ -579,14 +713,13 @@ class MemberManagement:
             await self.bot.say("Cannot find the role **{}** on this server.".format(to_add_role_name))
             return
 
-        server_members = [member for member in server.members]
-        for member in server_members:
-            if with_role in member.roles:
-                if to_add_role not in member.roles:
-                    try:
-                        await ctx.invoke(self.changerole, member, to_add_role_name)
-                    except:
-                        pass
+        index = self.member_index(server)
+        member_ids = index.role_members.get(with_role.id, set()) - index.role_members.get(to_add_role.id, set())
+        for member in self.members(server, member_ids):
+            try:
+                await ctx.invoke(self.changerole, member, to_add_role_name)
+            except:
+                pass
 
     def get_server_role(self, server, role_name):
         """Find server role by name."""
@@ -659,10 +792,7 @@ class MemberManagement:
             await self.bot.say("Role not found.")
             return
         server = ctx.message.server
-        members = []
-        for member in server.members:
-            if role in member.roles:
-                members.append(member)
+        members = self.members(server, self.member_index(server).role_members.get(role.id, set()))
         if not members:
             await self.bot.say("No members with that role found")
             return
@@ -905,10 +1035,7 @@ class MemberManagement:
     @commands.command(no_pm=True, pass_context=True)
     async def searchmembers(self, ctx, *, query):
         server = ctx.message.server
-        ret = []
-        for m in server.members:
-            if query in m.display_name.lower():
-                ret.append(m)
+        ret = self.members(server, self.member_index(server).search(query, usernames=False))
 
         limit = 10
         await self.bot.say("Found {} members".format(len(ret)))
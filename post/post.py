@@ -108,11 +108,16 @@ class Post:
         if value is None:
             return None
 
+        emoji_index = self.bot.get_cog("EmojiIndex")
+
         def emoji_repl(matchobj):
             name = matchobj.group(1)
 
             s = ':{}:'.format(name)
 
+            if emoji_index is not None:
+                return emoji_index.tag(name, default=s)
+
             for emoji in self.bot.get_all_emojis():
                 if emoji.name == name:
                     s = '<:{}:{}>'.format(emoji.name, emoji.id)
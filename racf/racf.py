@@ -291,6 +291,9 @@ class UnknownServerError(Exception):
 
 
 def get_emoji(bot, name):
+    emoji_index = bot.get_cog("EmojiIndex")
+    if emoji_index is not None:
+        return emoji_index.tag(name, default=name)
     for emoji in bot.get_all_emojis():
         if emoji.name == name:
             return '<:{}:{}>'.format(emoji.name, emoji.id)
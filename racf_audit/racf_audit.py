@@ -57,6 +57,7 @@ PATH = os.path.join("data", "racf_audit")
 JSON = os.path.join(PATH, "settings.json")
 
 PLAYERS = os.path.join("data", "racf_audit", "player_db.json")
+PLAYERS_LOG = os.path.join("data", "racf_audit", "player_db.log")
 
 # RACF_SERVER_ID = '218534373169954816'
 RACF_SERVER_ID = '528327242875535372'
@@ -150,6 +151,135 @@ class CachedClanModels(RACFAuditException):
 AuditResult = namedtuple("AuditResult", "audit_results output error")
 
 
+class PlayerRegistry:
+    """Player tag <-> Discord user registry.
+
+    The snapshot is kept in player_db.json in the same format as before
+    (tag -> {tag, user_id, user_name}). Changes are appended to a JSON Lines
+    write-ahead log and folded into the snapshot by compact(), so setting a
+    tag does not rewrite the whole database. Both directions are indexed.
+    """
+
+    COMPACT_THRESHOLD = 500
+
+    def __init__(self, path, log_path, fallback_path=None):
+        """Init."""
+        self.path = path
+        self.log_path = log_path
+        self._players = {}
+        self._user_tags = defaultdict(set)
+        self._log_count = 0
+
+        load_path = path
+        if not os.path.exists(load_path) and fallback_path is not None:
+            load_path = fallback_path
+        if os.path.exists(load_path):
+            for tag, player in dataIO.load_json(load_path).items():
+                self._set(tag, player)
+
+        self._replay()
+
+        if load_path != path:
+            self.compact()
+
+    @property
+    def players(self):
+        """Player dictionary, tag -> player. Treat as read-only."""
+        return self._players
+
+    def _set(self, tag, player):
+        self._remove(tag)
+        self._players[tag] = player
+        self._user_tags[player.get('user_id')].add(tag)
+
+    def _remove(self, tag):
+        player = self._players.pop(tag, None)
+        if player is None:
+            return None
+        user_id = player.get('user_id')
+        tags = self._user_tags.get(user_id)
+        if tags is not None:
+            tags.discard(tag)
+            if not tags:
+                self._user_tags.pop(user_id, None)
+        return player
+
+    def _replay(self):
+        """Apply write-ahead log entries on top of the snapshot."""
+        if not os.path.exists(self.log_path):
+            return
+        with open(self.log_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # partially written last line
+                    continue
+                self._apply(entry)
+                self._log_count += 1
+
+    def _apply(self, entry):
+        op = entry.get('op')
+        if op == 'set':
+            self._set(entry['tag'], entry['player'])
+        elif op == 'rm':
+            self._remove(entry['tag'])
+
+    def _append(self, entry):
+        self._apply(entry)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._log_count += 1
+        if self._log_count >= self.COMPACT_THRESHOLD:
+            self.compact()
+
+    def compact(self):
+        """Write snapshot and truncate the log."""
+        dataIO.save_json(self.path, self._players)
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
+        self._log_count = 0
+
+    def get(self, tag):
+        """Return player by tag."""
+        return self._players.get(tag)
+
+    def tags_for_user(self, user_id):
+        """Return sorted list of tags associated with user id."""
+        return sorted(self._user_tags.get(user_id, []))
+
+    def get_by_user(self, user_id):
+        """Return first player associated with user id."""
+        tags = self.tags_for_user(user_id)
+        if tags:
+            return self._players.get(tags[0])
+        return None
+
+    def set(self, tag, user_id, user_name=None):
+        """Associate tag with user, replacing other tags of that user."""
+        for t in self.tags_for_user(user_id):
+            if t != tag:
+                self._append({'op': 'rm', 'tag': t})
+        self._append({
+            'op': 'set',
+            'tag': tag,
+            'player': {
+                "tag": tag,
+                "user_id": user_id,
+                "user_name": user_name
+            }
+        })
+
+    def remove(self, tag):
+        """Remove tag. Return True if it existed."""
+        if tag not in self._players:
+            return False
+        self._append({'op': 'rm', 'tag': tag})
+        return True
+
+
 class RACFClan:
     """RACF Clan."""
 
@@ -393,13 +523,10 @@ class RACFAudit:
         self.settings = dataIO.load_json(JSON)
         self._clan_roles = None
 
-        players_path = PLAYERS
-
-        if not os.path.exists(players_path):
-            players_path = os.path.join(PATH, "player_db_bak.json")
-
-        self._players = dataIO.load_json(players_path)
-        dataIO.save_json(PLAYERS, self._players)
+        self.registry = PlayerRegistry(
+            PLAYERS, PLAYERS_LOG,
+            fallback_path=os.path.join(PATH, "player_db_bak.json")
+        )
 
         with open('data/racf_audit/family_config.yaml') as f:
             self.config = yaml.load(f, Loader=yaml.FullLoader)
@@ -414,6 +541,7 @@ class RACFAudit:
                 self.task.cancel()
         except Exception:
             pass
+        self.registry.compact()
 
     async def loop_task(self):
         """Loop."""
@@ -422,6 +550,7 @@ class RACFAudit:
                 if self == self.bot.get_cog("RACFAudit"):
                     loop = asyncio.get_event_loop()
                     loop.create_task(self.run_audit_task())
+                    self.registry.compact()
 
                     interval = int(dt.timedelta(hours=4).total_seconds())
                     await asyncio.sleep(interval)
@@ -430,10 +559,8 @@ class RACFAudit:
 
     @property
     def players(self):
-        """Player dictionary, userid -> tag"""
-        return self._players
-        # players = dataIO.load_json(PLAYERS)
-        # return players
+        """Player dictionary, tag -> player. Read-only; write through self.registry."""
+        return self.registry.players
 
     @commands.group(aliases=["racfas"], pass_context=True, no_pm=True)
     # @checks.mod_or_permissions(manage_roles=True)
@@ -456,55 +583,29 @@ class RACFAudit:
     async def set_player_tag(self, tag, member: discord.Member, force=False):
         """Allow external programs to set player tags. (RACF)"""
         await asyncio.sleep(0)
-        players = self.players
         # clean tags
         tag = clean_tag(tag)
 
-        # ensure unique tag
-        tag_in_db = False
-        if tag in players.keys():
-            tag_in_db = True
-            if not force:
+        # ensure unique tag and unique user ids
+        if not force:
+            if self.registry.get(tag) is not None:
+                return False
+            if self.registry.tags_for_user(member.id):
                 return False
 
-        # ensure unique user ids
-        user_id_in_db = False
-        for k, v in players.items():
-            if v.get('user_id') == member.id:
-                user_id_in_db = True
-                if not force:
-                    return False
-
-        # if force override, remove the entries
-        if tag_in_db:
-            players.pop(tag, None)
-
-        if user_id_in_db:
-            _ks = None
-            for k, v in players.items():
-                if v.get('user_id') == member.id:
-                    if _ks is None:
-                        _ks = []
-                    _ks.append(k)
-            if _ks is not None:
-                for k in _ks:
-                    players.pop(k, None)
-
-        players[tag] = {
-            "tag": tag,
-            "user_id": member.id,
-            "user_name": member.display_name
-        }
-        dataIO.save_json(PLAYERS, players)
+        # if force override, remove the tag from its previous owner
+        self.registry.remove(tag)
+        self.registry.set(tag, member.id, user_name=member.display_name)
         return True
 
     async def get_player_tag(self, tag):
         await asyncio.sleep(0)
-        return self.players.get(tag)
+        return self.registry.get(tag)
 
     async def rm_player_tag(self, tag):
         """Remove player tag from settings."""
-        pass
+        await asyncio.sleep(0)
+        return self.registry.remove(clean_tag(tag))
 
     @racfauditset.command(name="auth", pass_context=True)
     @checks.is_owner()
@@ -620,11 +721,9 @@ class RACFAudit:
 
         tag = clean_tag(tag)
         user_id = None
-        for _key, m in self.players.items():
-            m_tag = m.get('tag')
-            if m_tag is not None and m_tag == tag:
-                user_id = m['user_id']
-                break
+        player = self.registry.get(tag)
+        if player is not None:
+            user_id = player.get('user_id')
 
         if user_id is None:
             await self.bot.say("Member not found.")
@@ -644,13 +743,11 @@ class RACFAudit:
         if not verified:
             return
 
-        found = False
-        for tag, m in self.players.items():
-            if m["user_id"] == member.id:
-                await self.bot.say("RACF Audit database: `{}` is associated to `#{}`".format(member, tag))
-                found = True
+        tags = self.registry.tags_for_user(member.id)
+        for tag in tags:
+            await self.bot.say("RACF Audit database: `{}` is associated to `#{}`".format(member, tag))
 
-        if not found:
+        if not tags:
             await self.bot.say("RACF Audit database: Member is not associated with any tags.")
 
     @racfaudit.command(name="rmtag", pass_context=True)
@@ -661,14 +758,10 @@ class RACFAudit:
         if not verified:
             return
 
-        tag = clean_tag(tag)
-        try:
-            self.players.pop(tag, None)
-        except KeyError:
-            await self.bot.say("Tag not found in DB.")
-        else:
-            dataIO.save_json(PLAYERS, self.players)
+        if await self.rm_player_tag(tag):
             await self.bot.say("Removed tag from DB.")
+        else:
+            await self.bot.say("Tag not found in DB.")
 
     @racfaudit.command(name="search", pass_context=True, no_pm=True)
     # @checks.mod_or_permissions(manage_roles=True)
@@ -1018,30 +1111,9 @@ class RACFAudit:
         await self.bot.send_message(channel, "**RACF Family Audit**")
         await self.bot.send_typing(channel)
 
-        async def exec_add_roles(d_member, roles, channel=None):
-            # print("add roles", d_member, [r.name for r in roles])
-            # await asyncio.sleep(0)
-            try:
-                await self.bot.add_roles(d_member, *roles)
-            except discord.DiscordException as e:
-                pass
-            else:
-                if channel is not None:
-                    await self.bot.send_message(channel,
-                                                "Add {} to {}".format(", ".join([r.name for r in roles]), d_member))
-
-        async def exec_remove_roles(d_member, roles, channel=None):
-            # print("remove roles", d_member, [r.name for r in roles])
-            # await asyncio.sleep(0)
-            try:
-                await self.bot.remove_roles(d_member, *roles)
-            except discord.DiscordException as e:
-                pass
-            else:
-                if channel is not None:
-                    await self.bot.send_message(channel,
-                                                "Remove {} from {}".format(", ".join([r.name for r in roles]),
-                                                                           d_member))
+        # batched role changes, or None to apply them directly
+        role_executor = self.bot.get_cog("RoleExecutor")
+        batch = role_executor.batch() if role_executor is not None else None
 
         # change clan roles
         for result in audit_results["no_clan_role"]:
@@ -1053,24 +1125,19 @@ class RACFAudit:
                 for rname in other_clan_role_names:
                     role = discord.utils.get(discord_member.roles, name=rname)
                     if role is not None:
-                        await exec_remove_roles(discord_member, [role], channel=channel)
+                        await self.remove_roles(batch, discord_member, role)
 
                 role = discord.utils.get(server.roles, name=clan_role_name)
                 if role is not None:
-                    await exec_add_roles(discord_member, [role], channel=channel)
+                    await self.add_roles(batch, discord_member, role)
             except KeyError:
                 pass
 
         # Add member role
         member_role = discord.utils.get(server.roles, name='Member')
         for discord_member in audit_results["no_member_role"]:
-            try:
-                if member_role is not None:
-                    await exec_add_roles(discord_member, [member_role], channel=channel)
-
-            except KeyError:
-                pass
-
+            if member_role is not None:
+                await self.add_roles(batch, discord_member, member_role)
 
         # remove member roles from people who are not in our clans
         for result in audit_results['not_in_our_clans']:
@@ -1098,30 +1165,52 @@ class RACFAudit:
             to_remove_roles = [discord.utils.get(server.roles, name=rname) for rname in to_remove_role_names]
             to_remove_roles = [r for r in to_remove_roles if r is not None]
             if len(to_remove_roles):
-                await exec_remove_roles(result, to_remove_roles, channel=channel)
-            # if visitor_role is not None:
-            #     await exec_add_roles(result, [visitor_role], channel=channel)
+                await self.remove_roles(batch, result, *to_remove_roles)
 
         # Remove clan roles from visitors
         member_role = discord.utils.get(server.roles, name='Member')
         server_members = list(server.members).copy()
         for user in server_members:
-            # not a member
-            if member_role not in user.roles:
-                user_role_names = [r.name for r in user.roles]
+            # not a member, taking roles queued above into account
+            user_roles = batch.projected_roles(user) if batch is not None else user.roles
+            if member_role not in user_roles:
+                user_role_names = [r.name for r in user_roles]
                 user_member_role_names = set(user_role_names) & set(MEMBER_ROLE_NAMES)
                 # union of user roles with member role names -> user has member roles which need to be removed
                 if user_member_role_names:
                     to_remove_roles = [discord.utils.get(server.roles, name=rname) for rname in user_member_role_names]
                     to_remove_roles = [r for r in to_remove_roles if r is not None]
                     if to_remove_roles:
-                        try:
-                            await exec_remove_roles(user, to_remove_roles, channel=channel)
-                        except Exception as e:
-                            pass
+                        await self.remove_roles(batch, user, *to_remove_roles)
 
+        if batch is not None:
+            await batch.run_and_report(channel=channel)
         await self.bot.send_message(channel, "Audit finished.")
 
+    async def add_roles(self, batch, member, *roles):
+        """Queue roles to add, or add them now if the RoleExecutor cog is not loaded."""
+        if batch is not None:
+            batch.add_roles(member, *roles)
+            return
+        roles = [r for r in roles if r is not None]
+        if roles:
+            try:
+                await self.bot.add_roles(member, *roles)
+            except discord.DiscordException:
+                pass
+
+    async def remove_roles(self, batch, member, *roles):
+        """Queue roles to remove, or remove them now if the RoleExecutor cog is not loaded."""
+        if batch is not None:
+            batch.remove_roles(member, *roles)
+            return
+        roles = [r for r in roles if r is not None]
+        if roles:
+            try:
+                await self.bot.remove_roles(member, *roles)
+            except discord.DiscordException:
+                pass
+
     async def search_player(self, tag=None, user_id=None):
         """Search for players.
 
@@ -1129,14 +1218,12 @@ class RACFAudit:
         {'tag': '200CYRVCU', 'user_id': '295317904633757696', 'user_name': 'Ryann'}
         """
         if tag is not None:
-            for key, player in self.players.items():
-                if player.get('tag') == tag:
-                    return player
+            player = self.registry.get(tag)
+            if player is not None:
+                return player
 
         if user_id is not None:
-            for key, player in self.players.items():
-                if player.get('user_id') == user_id:
-                    return player
+            return self.registry.get_by_user(user_id)
 
         return None
 
@@ -1710,10 +1797,10 @@ class RACFAudit:
 
             # discord user
             discord_users = []
-            tag2discord = {v.get('tag'): v.get('user_id') for k, v in self.players.items()}
             for member_tag in member_tags:
-                if member_tag in tag2discord:
-                    discord_id = tag2discord.get(member_tag)
+                player = self.registry.get(member_tag)
+                if player is not None:
+                    discord_id = player.get('user_id')
                     discord_user = server.get_member(discord_id)
                     if discord_user is not None:
                         discord_users.append(discord_user)
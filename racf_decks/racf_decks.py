@@ -41,6 +41,22 @@ PATH = os.path.join("data", "racf_decks")
 JSON = os.path.join(PATH, "settings.json")
 
 DELAY = int(dt.timedelta(minutes=5).total_seconds() * 0.97)
+MIN_DELAY = int(dt.timedelta(minutes=1).total_seconds())
+MAX_DELAY = int(dt.timedelta(minutes=15).total_seconds())
+
+# Post decks individually up to this many per feed per cycle, as a single summary above it
+BATCH_THRESHOLD = 3
+# Battle ids remembered per feed for de-duplication
+SEEN_MAX = 200
+# Discord embed limits; total is kept below 6000 to leave room for title and footer
+EMBED_MAX_FIELDS = 25
+EMBED_MAX_CHARS = 5500
+
+FEEDS = {
+    'family_gc': dict(fam=True, cc=False, legacy_timestamp='family_timestamp'),
+    'family_cc': dict(fam=True, cc=True, legacy_timestamp='family_timestamp'),
+    'gc': dict(fam=False, cc=False, legacy_timestamp='gc_timestamp'),
+}
 # DELAY = 5
 DEBUG = False
 # DEBUG = True
@@ -55,6 +71,24 @@ def debug(*args):
         # logger.info(s)
         print(*args)
 
+def embed_chunks(fields, max_fields=EMBED_MAX_FIELDS, max_chars=EMBED_MAX_CHARS):
+    """Split (name, value) fields into lists that each fit in one embed."""
+    chunks = []
+    chunk = []
+    length = 0
+    for name, value in fields:
+        size = len(name) + len(value)
+        if chunk and (len(chunk) >= max_fields or length + size > max_chars):
+            chunks.append(chunk)
+            chunk = []
+            length = 0
+        chunk.append((name, value))
+        length += size
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
 def nested_dict():
     """Recursively nested defaultdict."""
     return defaultdict(nested_dict)
@@ -92,6 +126,7 @@ async def fetch_decks(time=None, fam=True, auth=None, cc=False, session=None):
         _source = hit.get('_source')
         team = _source.get('team')[0]
         deck = dict(
+            battle_id=hit.get('_id'),
             timestamp_epoch_millis=_source.get('battleTime_timestamp_epoch_millis', 0),
             deck_name=team.get('deck', {}).get('name'),
             player_name=team.get('name'),
@@ -116,6 +151,7 @@ class RACFDecks:
         self.settings.update(dataIO.load_json(JSON))
         self.task = None
         self.threadex = ThreadPoolExecutor(max_workers=2)
+        self.delay = DELAY
 
         self.loop = asyncio.get_event_loop()
         self.task = self.loop.create_task(self.update_decks())
@@ -144,6 +180,10 @@ class RACFDecks:
     @commands.command(no_pm=True, pass_context=True)
     async def rdecks_reset_timestamp(self, ctx):
         self.settings["family_timestamp"] = 1545709664
+        for feed in ['family_gc', 'family_cc']:
+            self.settings["watermarks"][feed] = 1545709664
+            self.settings["seen"][feed] = []
+        dataIO.save_json(JSON, self.settings)
         await self.bot.say("Reset family decks timestamp")
 
     @checks.mod_or_permissions()
@@ -192,69 +232,142 @@ class RACFDecks:
         dataIO.save_json(JSON, self.settings)
         await self.bot.say("Stopped automatic deck fetch.")
 
-    async def post_decks(self, channel: discord.Channel, show_empty=True, fam=True):
-        if fam:
-            time = self.settings.get('family_timestamp')
-        else:
-            time = self.settings.get('gc_timestamp')
-
-        gc_decks = await fetch_decks(time=time, fam=fam, auth=self.settings['auth'], session=self.session)
+    def watermark(self, feed):
+        """Timestamp of the newest deck posted for feed."""
+        watermark = self.settings["watermarks"].get(feed)
+        if watermark is None:
+            watermark = self.settings.get(FEEDS[feed]['legacy_timestamp'])
+        return watermark
+
+    async def poll_feed(self, feed):
+        """Fetch decks newer than the feed watermark which have not been seen."""
+        opts = FEEDS[feed]
+        decks = await fetch_decks(
+            time=self.watermark(feed), fam=opts['fam'], cc=opts['cc'],
+            auth=self.settings['auth'], session=self.session
+        )
 
-        cc_decks = []
-        if fam:
-            cc_decks = await fetch_decks(time=time, fam=fam, auth=self.settings['auth'], cc=True, session=self.session)
+        seen_set = set(self.settings["seen"].get(feed) or [])
+        new_decks = []
+        for deck in decks:
+            battle_id = deck.get('battle_id')
+            if battle_id is not None:
+                if battle_id in seen_set:
+                    continue
+                seen_set.add(battle_id)
+            new_decks.append(deck)
+
+        return new_decks
+
+    def mark_posted(self, feed, decks, complete=True):
+        """Record posted decks as seen.
+
+        The watermark is only advanced when every deck of the poll was posted,
+        so that failed decks are fetched again on the next run.
+        Caller is responsible for saving.
+        """
+        seen = self.settings["seen"].get(feed) or []
+        for deck in decks:
+            battle_id = deck.get('battle_id')
+            if battle_id is not None and battle_id not in seen:
+                seen.append(battle_id)
+        self.settings["seen"][feed] = seen[-SEEN_MAX:]
 
-        decks = gc_decks + cc_decks
+        if complete and decks:
+            self.settings["watermarks"][feed] = max(d['timestamp_epoch_millis'] for d in decks)
 
+    async def post_deck(self, channel: discord.Channel, deck):
+        """Post a single deck through the Deck cog. Return True if posted."""
         deck_cog = self.bot.get_cog("Deck")
-        timestamps = []
+        player_name = deck.get('player_name', '')
+        cc = deck.get('cc', False)
+        try:
+            await deck_cog.post_deck(
+                channel=channel,
+                title="12-win {} deck".format('CC' if cc else 'GC'),
+                description="**{}**, {}".format(player_name, deck.get('clan_name', '')),
+                card_keys=deck.get('deck_name').split(','),
+                deck_author=player_name,
+                timestamp=dt.datetime.utcfromtimestamp(deck.get('timestamp_epoch_millis') / 1000),
+                color=discord.Color.green() if cc else discord.Color.gold(),
+                player_tag=deck.get('player_tag'),
+                link='https://royaleapi.com/decks/winner/{}'.format('cc' if cc else 'gc')
+            )
+        except discord.DiscordException as e:
+            print(e)
+            return False
+        return True
 
-        if len(decks) == 0 and show_empty:
-            await self.bot.send_message(channel, "No more decks found.")
+    async def post_deck_batch(self, channel: discord.Channel, decks):
+        """Post many decks as summary embeds instead of one image each.
 
+        Return list of decks which were posted.
+        """
+        deck_cog = self.bot.get_cog("Deck")
+        cc = decks[0].get('cc', False)
+
+        fields = []
         for deck in decks:
             card_keys = deck.get('deck_name').split(',')
-            player_name = deck.get('player_name', '')
-            player_tag = deck.get('player_tag')
-            clan_name = deck.get('clan_name', '')
-            ts = deck.get('timestamp_epoch_millis')
-            timestamps.append(ts)
-            cc = deck.get('cc', False)
-
-            if cc:
-                color = discord.Color.green()
-            else:
-                color = discord.Color.gold()
-
-            try:
-                if cc:
-                    link = 'https://royaleapi.com/decks/winner/cc'
-                else:
-                    link = 'https://royaleapi.com/decks/winner/gc'
-                await deck_cog.post_deck(
-                    channel=channel,
-                    title="12-win {} deck".format('CC' if cc else 'GC'),
-                    description="**{}**, {}".format(player_name, clan_name),
-                    card_keys=card_keys,
-                    deck_author=player_name,
-                    timestamp=dt.datetime.utcfromtimestamp(ts / 1000),
-                    color=color,
-                    player_tag=player_tag,
-                    link=link
+            fields.append((
+                "{}, {}".format(deck.get('player_name', ''), deck.get('clan_name', '')),
+                "[Copy]({}) • [Stats]({})".format(
+                    await deck_cog.decklink_url(card_keys),
+                    'https://royaleapi.com/decks/stats/{}'.format(','.join(card_keys))
                 )
+            ))
+
+        posted = []
+        offset = 0
+        for chunk in embed_chunks(fields):
+            chunk_decks = decks[offset:offset + len(chunk)]
+            offset += len(chunk)
+            em = discord.Embed(
+                title="{} new 12-win {} decks".format(len(decks), 'CC' if cc else 'GC'),
+                url='https://royaleapi.com/decks/winner/{}'.format('cc' if cc else 'gc'),
+                color=discord.Color.green() if cc else discord.Color.gold(),
+                timestamp=dt.datetime.utcfromtimestamp(chunk_decks[-1].get('timestamp_epoch_millis') / 1000)
+            )
+            for name, value in chunk:
+                em.add_field(name=name, value=value, inline=False)
+            try:
+                await self.bot.send_message(channel, embed=em)
             except discord.DiscordException as e:
                 print(e)
-
-        # store latest timestamp
-        if len(decks) != 0:
-            max_time = max(timestamps)
-            if fam:
-                self.settings["family_timestamp"] = max_time
             else:
-                self.settings["gc_timestamp"] = max_time
-            dataIO.save_json(JSON, self.settings)
+                posted.extend(chunk_decks)
+        return posted
 
-        logger.info("Posted {count} decks to {channel}".format(count=len(decks), channel=channel.name))
+    async def post_decks(self, channel: discord.Channel, decks):
+        """Post decks from one feed to channel. Return list of decks which were posted."""
+        if len(decks) > BATCH_THRESHOLD:
+            posted = await self.post_deck_batch(channel, decks)
+        else:
+            posted = []
+            for deck in decks:
+                if await self.post_deck(channel, deck):
+                    posted.append(deck)
+
+        logger.info("Posted {count} of {total} decks to {channel}".format(
+            count=len(posted), total=len(decks), channel=channel.name))
+        return posted
+
+    async def run_feed(self, channel: discord.Channel, feed):
+        """Poll feed and post new decks to channel. Return number of decks posted."""
+        decks = await self.poll_feed(feed)
+        if not decks:
+            return 0
+        posted = await self.post_decks(channel, decks)
+        self.mark_posted(feed, posted, complete=len(posted) == len(decks))
+        return len(posted)
+
+    def next_delay(self, new_count):
+        """Poll faster while decks are coming in and back off when the feeds are quiet."""
+        if new_count:
+            self.delay = max(MIN_DELAY, self.delay // 2)
+        else:
+            self.delay = min(MAX_DELAY, int(self.delay * 1.5))
+        return self.delay
 
     async def update_decks(self):
         try:
@@ -271,46 +384,36 @@ class RACFDecks:
                         server = self.bot.get_server(server_id)
 
                     debug("RACF DECKS: update decks server:", server)
+                    new_count = 0
                     if server:
-                        try:
-                            tasks = []
-                            family_auto = self.settings.get('family_auto')
-                            family_channel_id = self.settings.get('family_channel_id')
-                            if family_auto and family_channel_id:
-                                channel = discord.utils.get(server.channels, id=family_channel_id)
-                                if channel:
-                                    # self.loop.create_task(
-                                    #     self.post_decks(channel, fam=True, show_empty=False)
-                                    # )
-                                    # await self.post_decks(channel, fam=True, show_empty=False)
-                                    tasks.append(
-                                        self.post_decks(channel, fam=True, show_empty=False)
-                                    )
-
-                            gc_auto = self.settings.get('gc_auto')
-                            gc_channel_id = self.settings.get('gc_channel_id')
-                            if gc_auto and gc_channel_id:
-                                channel = discord.utils.get(server.channels, id=gc_channel_id)
-                                if channel:
-                                    # self.loop.create_task(
-                                    #     self.post_decks(channel, fam=False, show_empty=False)
-                                    # )
-                                    # await self.post_decks(channel, fam=False, show_empty=False)
-                                    tasks.append(
-                                        self.post_decks(channel, fam=False, show_empty=False)
-                                    )
-
-                        except discord.DiscordException as e:
-                            print(e)
-                        else:
-                            debug("RACF DECKS: Task Length: {}".format(len(tasks)))
-                            await asyncio.gather(*tasks, return_exceptions=True)
-                            debug("RACF DECKS: Gather done")
-
+                        tasks = []
+                        family_auto = self.settings.get('family_auto')
+                        family_channel_id = self.settings.get('family_channel_id')
+                        if family_auto and family_channel_id:
+                            channel = discord.utils.get(server.channels, id=family_channel_id)
+                            if channel:
+                                tasks.append(self.run_feed(channel, 'family_gc'))
+                                tasks.append(self.run_feed(channel, 'family_cc'))
+
+                        gc_auto = self.settings.get('gc_auto')
+                        gc_channel_id = self.settings.get('gc_channel_id')
+                        if gc_auto and gc_channel_id:
+                            channel = discord.utils.get(server.channels, id=gc_channel_id)
+                            if channel:
+                                tasks.append(self.run_feed(channel, 'gc'))
+
+                        debug("RACF DECKS: Task Length: {}".format(len(tasks)))
+                        results = await asyncio.gather(*tasks, return_exceptions=True)
+                        debug("RACF DECKS: Gather done")
+
+                        new_count = sum(r for r in results if isinstance(r, int))
+                        if new_count:
+                            dataIO.save_json(JSON, self.settings)
 
                     # await asyncio.sleep(3)
-                    debug("RACF DECKS: sleep: ", DELAY)
-                    await asyncio.sleep(DELAY)
+                    delay = self.next_delay(new_count)
+                    debug("RACF DECKS: sleep: ", delay)
+                    await asyncio.sleep(delay)
         except asyncio.CancelledError:
             pass
 
@@ -113,9 +113,7 @@ class RACFTourney:
         """Get player tag by discord ID"""
         if discord_id is not None:
             cog = self.bot.get_cog("RACFAudit")
-            for tag, p in cog.players.items():
-                if p.get('user_id') == discord_id:
-                    return p
+            return cog.registry.get_by_user(discord_id)
 
         return None
 
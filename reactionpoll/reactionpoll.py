@@ -24,11 +24,14 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+from collections import OrderedDict
 from collections import defaultdict
 
+import asyncio
 import datetime as dt
 import discord
 import os
+import time
 from cogs.utils import checks
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
@@ -36,12 +39,66 @@ from discord.ext import commands
 PATH = os.path.join("data", "reactionpoll")
 JSON = os.path.join(PATH, "settings.json")
 
+# min seconds between edits of one poll embed
+EDIT_INTERVAL = 5
+# seconds between full refetches of poll reactions
+RECONCILE_INTERVAL = dt.timedelta(minutes=10).total_seconds()
+
 
 def nested_dict():
     """Recursively nested defaultdict."""
     return defaultdict(nested_dict)
 
 
+def emoji_str(emoji):
+    """Display string of reaction emoji."""
+    if isinstance(emoji, str):
+        return emoji
+    # <:emoji_name:emoji_id>
+    return '<:{}:{}>'.format(emoji.name, emoji.id)
+
+
+class PollTally:
+    """Voters by emoji of a tracked message, kept from reaction events."""
+
+    def __init__(self, message: discord.Message):
+        """Init."""
+        self.message_id = message.id
+        self.channel_name = message.channel.name
+        self.content = message.content
+        # emoji -> user id -> mention
+        self.votes = OrderedDict()
+
+    def add(self, emoji, user):
+        self.votes.setdefault(emoji_str(emoji), OrderedDict())[user.id] = user.mention
+
+    def remove(self, emoji, user):
+        users = self.votes.get(emoji_str(emoji))
+        if users is not None:
+            users.pop(user.id, None)
+            if not len(users):
+                self.votes.pop(emoji_str(emoji))
+
+    def embed(self):
+        """Discord Embed of the tally."""
+        em = discord.Embed(
+            title=self.channel_name,
+            description=self.content)
+
+        for emoji, users in self.votes.items():
+            value = '{}: {}'.format(len(users), ' '.join(users.values()))
+            # field values are limited to 1024 characters
+            if len(value) > 1024:
+                value = value[:1023] + '…'
+            em.add_field(name=emoji, value=value, inline=True)
+
+        em.set_footer(
+            text='ID: {} | Updated: {}'.format(
+                self.message_id,
+                dt.datetime.utcnow().isoformat()))
+        return em
+
+
 class ReactionPoll:
     """Archive activity.
 
@@ -54,6 +111,17 @@ class ReactionPoll:
         self.bot = bot
         self.settings = nested_dict()
         self.settings.update(dataIO.load_json(JSON))
+        # message id -> PollTally
+        self.tallies = {}
+        # message id -> call_later handle of pending embed edit
+        self._edit_handles = {}
+        self._last_edit = {}
+        self.task = self.bot.loop.create_task(self.reconcile_task())
+
+    def __unload(self):
+        self.task.cancel()
+        for handle in self._edit_handles.values():
+            handle.cancel()
 
     def check_server_settings(self, server):
         """Verify settings have all the keys."""
@@ -87,9 +155,9 @@ class ReactionPoll:
         server = ctx.message.server
         message = await self.bot.get_message(channel, message_id)
 
-        em = await self.reaction_embed(message)
+        tally = await self.reconcile(message)
 
-        embed_message = await self.bot.say(embed=em)
+        embed_message = await self.bot.say(embed=tally.embed())
 
         self.settings[server.id]["messages"][message_id] = {
             'channel_id': channel.id,
@@ -128,9 +196,9 @@ class ReactionPoll:
 
         message = await self.bot.get_message(channel, message_id)
 
-        em = await self.reaction_embed(message)
+        tally = await self.reconcile(message)
 
-        embed_message = await self.bot.say(embed=em)
+        embed_message = await self.bot.say(embed=tally.embed())
 
         self.settings[server.id]["messages"][message_id] = {
             'channel_id': channel.id,
@@ -149,80 +217,122 @@ class ReactionPoll:
 
         server = ctx.message.server
 
-        del self.settings[server.id]["messages"][message_id]
+        self.untrack(server, message_id)
+
+    def untrack(self, server, message_id):
+        """Stop tracking poll and drop its tally."""
+        self.settings[server.id]["messages"].pop(message_id, None)
         dataIO.save_json(JSON, self.settings)
+        self.tallies.pop(message_id, None)
+        self._last_edit.pop(message_id, None)
+        handle = self._edit_handles.pop(message_id, None)
+        if handle is not None:
+            handle.cancel()
 
     async def on_reaction_add(self, reaction, user):
         """Monitor reactions if tracked."""
-        message = reaction.message
-        server = message.server
-        # print('Reaction add: {}: {}'.format(server.id, message.id))
-        if message.id not in self.settings[server.id]['messages']:
-            return
-
-        await self.update_reation_embed(server, message)
+        await self.on_reaction(reaction, user, add=True)
 
     async def on_reaction_remove(self, reaction, user):
         """Monitor reactions if tracked."""
+        await self.on_reaction(reaction, user, add=False)
+
+    async def on_reaction(self, reaction, user, add=True):
+        """Update tally and schedule an embed edit."""
         message = reaction.message
         server = message.server
-        # print('Reaction remove: {}: {}'.format(server.id, message.id))
-        if message.id not in self.settings[server.id]['messages']:
+        if server is None or message.id not in self.settings[server.id]['messages']:
             return
 
-        await self.update_reation_embed(server, message)
+        tally = self.tallies.get(message.id)
+        if tally is None:
+            # first event since load: fetch all reactions once
+            tally = await self.reconcile(message)
+        elif add:
+            tally.add(reaction.emoji, user)
+        else:
+            tally.remove(reaction.emoji, user)
+
+        self.schedule_edit(server, message.id)
 
-    async def update_reation_embed(self, server, message):
-        """Update reation embeds."""
-        print('Reaction update: {}: {}'.format(server.id, message.id))
-        m = self.settings[server.id]['messages'][message.id]
+    def schedule_edit(self, server, message_id):
+        """Edit poll embed once per EDIT_INTERVAL, coalescing events in between."""
+        if message_id in self._edit_handles:
+            return
+        delay = max(0, self._last_edit.get(message_id, 0) + EDIT_INTERVAL - time.monotonic())
+        self._edit_handles[message_id] = self.bot.loop.call_later(
+            delay, lambda: self.bot.loop.create_task(self.update_reaction_embed(server, message_id)))
+
+    async def update_reaction_embed(self, server, message_id):
+        """Update reaction embed from tally."""
+        self._edit_handles.pop(message_id, None)
+        self._last_edit[message_id] = time.monotonic()
+        m = self.settings[server.id]['messages'].get(message_id)
+        tally = self.tallies.get(message_id)
+        if not m or tally is None:
+            return
 
+        embed_message = discord.utils.get(self.bot.messages, id=m["embed_message_id"])
         embed_channel = server.get_channel(m["embed_channel_id"])
-        embed_message = await self.bot.get_message(
-            embed_channel,
-            m["embed_message_id"])
-
-        reaction_channel = server.get_channel(m["channel_id"])
-        reaction_message = await self.bot.get_message(
-            reaction_channel,
-            m["message_id"])
-
-        em = await self.reaction_embed(reaction_message)
-        await self.bot.edit_message(
-            embed_message,
-            new_content=dt.datetime.utcnow().isoformat(),
-            embed=em)
-
-    async def reaction_embed(self, message: discord.Message):
-        """Discord Embed of a message reaction."""
-        title = message.channel.name
-        description = message.content
-        em = discord.Embed(
-            title=title,
-            description=description)
+        if embed_message is None and embed_channel is None:
+            # channel of the embed was deleted
+            self.untrack(server, message_id)
+            return
 
+        try:
+            if embed_message is None:
+                embed_message = await self.bot.get_message(
+                    embed_channel,
+                    m["embed_message_id"])
+
+            await self.bot.edit_message(
+                embed_message,
+                new_content=dt.datetime.utcnow().isoformat(),
+                embed=tally.embed())
+        except discord.NotFound:
+            # embed message was deleted
+            self.untrack(server, message_id)
+        except discord.HTTPException:
+            # retried with the next reaction
+            pass
+
+    async def reconcile(self, message: discord.Message):
+        """Rebuild tally of message from all its reactions."""
+        tally = PollTally(message)
         for reaction in message.reactions:
-            if reaction.custom_emoji:
-                # <:emoji_name:emoji_id>
-                emoji = '<:{}:{}>'.format(
-                    reaction.emoji.name,
-                    reaction.emoji.id)
-            else:
-                emoji = reaction.emoji
-
-            reaction_users = await self.bot.get_reaction_users(reaction)
-            users = ' '.join([m.mention for m in reaction_users])
-            name = emoji
-            count = reaction.count
-            value = '{}: {}'.format(count, users)
-
-            em.add_field(name=name, value=value, inline=True)
-
-        em.set_footer(
-            text='ID: {} | Updated: {}'.format(
-                message.id,
-                dt.datetime.utcnow().isoformat()))
-        return em
+            after = None
+            while True:
+                users = await self.bot.get_reaction_users(reaction, limit=100, after=after)
+                for user in users:
+                    tally.add(reaction.emoji, user)
+                if len(users) < 100:
+                    break
+                after = users[-1]
+        self.tallies[message.id] = tally
+        return tally
+
+    async def reconcile_task(self):
+        """Refetch reactions of tracked polls periodically to correct drift."""
+        try:
+            await self.bot.wait_until_ready()
+            while self == self.bot.get_cog("ReactionPoll"):
+                await asyncio.sleep(RECONCILE_INTERVAL)
+                for server_id, server_settings in list(self.settings.items()):
+                    server = self.bot.get_server(server_id)
+                    if server is None:
+                        continue
+                    for message_id, m in list(server_settings.get('messages', {}).items()):
+                        if message_id not in self.tallies:
+                            continue
+                        try:
+                            channel = server.get_channel(m["channel_id"])
+                            message = await self.bot.get_message(channel, message_id)
+                            await self.reconcile(message)
+                        except discord.HTTPException:
+                            continue
+                        self.schedule_edit(server, message_id)
+        except asyncio.CancelledError:
+            pass
 
 
 def check_folder():
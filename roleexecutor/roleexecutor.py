@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2019 SML
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import asyncio
+from collections import OrderedDict
+from collections import defaultdict
+
+import discord
+from cogs.utils.chat_formatting import box
+from cogs.utils.chat_formatting import pagify
+
+# role requests in flight across all batches
+CONCURRENCY = 5
+
+
+class RoleBatch:
+    """Queue role changes and apply them with one request per member.
+
+    Additions and removals for the same member are merged into a single
+    replace_roles call. Members are processed concurrently; discord.py
+    already waits out 429s per route, so the semaphore only bounds the
+    number of requests in flight. Batches from the RoleExecutor cog share
+    one semaphore.
+    """
+
+    def __init__(self, bot, semaphore=None):
+        """Init."""
+        self.bot = bot
+        self.semaphore = semaphore or asyncio.Semaphore(CONCURRENCY)
+        self._members = OrderedDict()
+        self._to_add = defaultdict(OrderedDict)
+        self._to_remove = defaultdict(OrderedDict)
+
+    def add_roles(self, member, *roles):
+        """Queue roles to add to member."""
+        for role in roles:
+            if role is None:
+                continue
+            self._to_remove[member.id].pop(role.id, None)
+            self._to_add[member.id][role.id] = role
+        self._members[member.id] = member
+
+    def remove_roles(self, member, *roles):
+        """Queue roles to remove from member."""
+        for role in roles:
+            if role is None:
+                continue
+            self._to_add[member.id].pop(role.id, None)
+            self._to_remove[member.id][role.id] = role
+        self._members[member.id] = member
+
+    def projected_roles(self, member):
+        """Return member roles as they will be after queued changes."""
+        to_add = self._to_add.get(member.id, {})
+        to_remove = self._to_remove.get(member.id, {})
+        roles = [r for r in member.roles if r.id not in to_remove]
+        roles += [r for r in to_add.values() if r not in roles]
+        return roles
+
+    async def _apply(self, member, semaphore):
+        """Apply queued changes to a member. Return a status line or None."""
+        member_role_ids = [r.id for r in member.roles]
+        to_add = [r for r in self._to_add[member.id].values() if r.id not in member_role_ids]
+        to_remove = [r for r in self._to_remove[member.id].values() if r.id in member_role_ids]
+        if not to_add and not to_remove:
+            return None
+
+        remove_ids = [r.id for r in to_remove]
+        roles = [r for r in member.roles if r.id not in remove_ids] + to_add
+
+        changes = []
+        if to_add:
+            changes.append("+{}".format(", +".join([r.name for r in to_add])))
+        if to_remove:
+            changes.append("-{}".format(", -".join([r.name for r in to_remove])))
+
+        async with semaphore:
+            try:
+                await self.bot.replace_roles(member, *roles)
+            except discord.DiscordException:
+                return "Failed: {} ({})".format(member, ", ".join(changes))
+        return "{}: {}".format(member, ", ".join(changes))
+
+    async def run(self):
+        """Apply all queued changes. Return list of status lines."""
+        tasks = [self._apply(member, self.semaphore) for member in self._members.values()]
+        results = await asyncio.gather(*tasks)
+        self._members.clear()
+        self._to_add.clear()
+        self._to_remove.clear()
+        return [r for r in results if r is not None]
+
+    async def run_and_report(self, channel=None):
+        """Apply all queued changes and post a paginated summary."""
+        lines = await self.run()
+        if channel is None:
+            return lines
+        if not lines:
+            await self.bot.send_message(channel, "No role changes.")
+            return lines
+        failed = len([line for line in lines if line.startswith("Failed:")])
+        lines.append("Updated {} members. Failed: {}.".format(len(lines) - failed, failed))
+        for page in pagify("\n".join(lines)):
+            await self.bot.send_message(channel, box(page))
+        return lines
+
+
+class RoleExecutor:
+    """Shared executor for batched role changes.
+
+    Audit cogs queue changes on a batch from bot.get_cog("RoleExecutor")
+    instead of making one request per change, and fall back to direct
+    role calls when this cog is not loaded.
+    """
+
+    def __init__(self, bot):
+        """Init."""
+        self.bot = bot
+        self.semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    def batch(self):
+        """Return a new RoleBatch limited by the shared semaphore."""
+        return RoleBatch(self.bot, semaphore=self.semaphore)
+
+
+def setup(bot):
+    """Setup."""
+    n = RoleExecutor(bot)
+    bot.add_cog(n)
@@ -24,16 +24,96 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import asyncio
+import json
+import os
+import datetime
+from collections import defaultdict
+
 import discord
 from discord.ext import commands
 from .utils import checks
 from .utils.dataIO import dataIO
-from .general import General
 from cogs.utils.chat_formatting import pagify
-import os
-import datetime
 
 settings_path = "data/rolehist/settings.json"
+logs_path = "data/rolehist/servers"
+
+# seconds between flushes of buffered history to disk
+FLUSH_INTERVAL = 10
+
+
+class RoleHistoryLog:
+    """Append-only role history of one server.
+
+    Each line of the file is a JSON record with the member id, a UTC time
+    key and the member data. Records are buffered and appended in batches.
+    Byte offsets of each member's records are indexed so that a single
+    member's history can be read without loading the whole file.
+    """
+
+    def __init__(self, path):
+        """Init."""
+        self.path = path
+        self.pending = []
+        self._index = None
+
+    @property
+    def index(self):
+        """Member id -> list of byte offsets. Built on first use."""
+        if self._index is None:
+            index = defaultdict(list)
+            if os.path.exists(self.path):
+                with open(self.path, 'rb') as f:
+                    offset = 0
+                    for line in f:
+                        try:
+                            index[json.loads(line.decode('utf-8'))['member_id']].append(offset)
+                        except (ValueError, KeyError):
+                            pass
+                        offset += len(line)
+            self._index = index
+        return self._index
+
+    def has_member(self, member_id):
+        """Return True if member has any history."""
+        if member_id in self.index:
+            return True
+        return any(r['member_id'] == member_id for r in self.pending)
+
+    def append(self, member_id, time_key, data):
+        """Buffer a history record."""
+        self.pending.append({
+            "member_id": member_id,
+            "time": time_key,
+            "data": data
+        })
+
+    def flush(self):
+        """Append buffered records to disk."""
+        if not self.pending:
+            return
+        index = self.index
+        with open(self.path, 'ab') as f:
+            for record in self.pending:
+                offset = f.tell()
+                f.write((json.dumps(record) + '\n').encode('utf-8'))
+                index[record['member_id']].append(offset)
+        self.pending = []
+
+    def history(self, member_id):
+        """Return sorted list of (time, data) for member."""
+        self.flush()
+        records = []
+        offsets = self.index.get(member_id, [])
+        if offsets:
+            with open(self.path, 'rb') as f:
+                for offset in offsets:
+                    f.seek(offset)
+                    record = json.loads(f.readline().decode('utf-8'))
+                    records.append((record['time'], record['data']))
+        return sorted(records, key=lambda r: r[0])
+
 
 class RoleHistory:
     """
@@ -46,20 +126,73 @@ class RoleHistory:
         self.bot = bot
         self.file_path = settings_path
         self.settings = dataIO.load_json(self.file_path)
+        self.logs = {}
+        self.migrate()
+        self.task = self.bot.loop.create_task(self.flush_task())
+
+    def __unload(self):
+        """Flush buffered history and stop task."""
+        self.task.cancel()
+        self.flush()
+
+    def migrate(self):
+        """Move history stored in settings.json to per-server logs."""
+        migrated = False
+        for server_id, server_settings in list(self.settings.items()):
+            if not isinstance(server_settings, dict) or "Members" not in server_settings:
+                continue
+            log = self.server_log(server_id)
+            for member_id, member_value in server_settings["Members"].items():
+                for time_key, data in sorted(member_value.get("History", {}).items()):
+                    log.append(member_id, time_key, data)
+            log.flush()
+            self.settings[server_id] = {
+                "ServerName": server_settings.get("ServerName"),
+                "ServerID": server_settings.get("ServerID", server_id)
+            }
+            migrated = True
+        if migrated:
+            dataIO.save_json(self.file_path, self.settings)
+
+    def server_log(self, server_id):
+        """Return history log of server."""
+        log = self.logs.get(server_id)
+        if log is None:
+            log = RoleHistoryLog(os.path.join(logs_path, "{}.jsonl".format(server_id)))
+            self.logs[server_id] = log
+        return log
+
+    def flush(self):
+        """Flush buffered history of all servers."""
+        for log in self.logs.values():
+            log.flush()
+
+    async def flush_task(self):
+        """Periodically flush buffered history."""
+        try:
+            while True:
+                await asyncio.sleep(FLUSH_INTERVAL)
+                self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    def init_server(self, server):
+        """Add server to settings if it does not exist."""
+        if server.id not in self.settings:
+            self.settings[server.id] = {
+                "ServerName": str(server),
+                "ServerID": str(server.id)
+            }
+            dataIO.save_json(self.file_path, self.settings)
 
     def save_member_data(self, server=None, member=None):
-        """Save member data to settings."""
+        """Add member data to history."""
         if server is None:
             return
         if member is None:
             return
-        self.settings[server.id]["Members"][member.id] = {
-            "MemberID": member.id,
-            "History": {
-                str(self.server_time()): self.get_member_data(member)
-            }
-        }
-        dataIO.save_json(self.file_path, self.settings)
+        self.server_log(server.id).append(
+            member.id, self.server_time(), self.get_member_data(member))
 
     @commands.command(pass_context=True, no_pm=True)
     async def rolehist(self, ctx, user: discord.Member=None):
@@ -80,49 +213,39 @@ class RoleHistory:
 
         if server.id in self.settings:
 
-            found_member = None
-
-            server_settings = self.settings[server.id]
-            for member_key, member_value in server_settings["Members"].items():
+            hist = self.server_log(server.id).history(user.id)
 
-                member = server.get_member(member_key)
+            if hist:
+                await self.bot.say("Found Member.")
+                out = []
 
-                if user == member:
-                    await self.bot.say("Found Member.")
-                    # await ctx.invoke(General.userinfo, user=member)
-                    out = []
+                prev_roles = []
 
-                    hist = sorted(member_value["History"].items())
+                for time_key, time_value in hist:
 
-                    prev_roles = []
+                    line = "• {}: ".format(time_key)
 
-                    for time_key, time_value in hist:
+                    curr_roles = time_value["Roles"]
+                    # display role changes if not the first item
+                    if len(prev_roles):
+                        prev_roles_set = set(prev_roles)
+                        curr_roles_set = set(curr_roles)
+                        if prev_roles_set < curr_roles_set:
+                            line += 'Added: {}'.format(
+                                list(curr_roles_set - prev_roles_set)[0])
+                        elif prev_roles_set > curr_roles_set:
+                            line += 'Removed: {}'.format(
+                                list(prev_roles_set - curr_roles_set)[0])
 
-                        line = "• {}: ".format(time_key)
+                    out.append(line)
 
-                        curr_roles = time_value["Roles"]
-                        # display role changes if not the first item
-                        if len(prev_roles):
-                            prev_roles_set = set(prev_roles)
-                            curr_roles_set = set(curr_roles)
-                            if prev_roles_set < curr_roles_set:
-                                line += 'Added: {}'.format(
-                                    list(curr_roles_set - prev_roles_set)[0])
-                            elif prev_roles_set > curr_roles_set:
-                                line += 'Removed: {}'.format(
-                                    list(prev_roles_set - curr_roles_set)[0])
+                    prev_roles = curr_roles
 
-                        out.append(line)
-
-                        prev_roles = curr_roles
-
-                    for page in pagify("\n".join(out)):
-                        await self.bot.say(page)
-
-                    found_member = member
+                for page in pagify("\n".join(out)):
+                    await self.bot.say(page)
 
             # if no data found, add record
-            if found_member is None:
+            else:
 
                 await self.bot.say("Member not found in database.")
 
@@ -142,17 +265,14 @@ class RoleHistory:
         server = ctx.message.server
         members = server.members
 
-        if server.id not in self.settings:
-            self.settings[server.id] = {
-                "ServerName": str(server),
-                "ServerID": str(server.id),
-                "Members": {}
-            }
+        self.init_server(server)
 
+        log = self.server_log(server.id)
         for member in members:
-            if member.id not in self.settings[server.id]["Members"]:
+            if not log.has_member(member.id):
                 # init member only if not found
                 self.save_member_data(server, member)
+        log.flush()
 
         await self.bot.say("Added all member roles to database.")
 
@@ -160,18 +280,11 @@ class RoleHistory:
         """Add member records when new user join."""
         server = member.server
 
-        if server.id not in self.settings:
-            self.settings[server.id] = {
-                "ServerName": str(server),
-                "ServerID": str(server.id),
-                "Members": {}
-            }
+        self.init_server(server)
 
-        if member.id not in self.settings[server.id]["Members"]:
+        if not self.server_log(server.id).has_member(member.id):
             self.save_member_data(server, member)
 
-        dataIO.save_json(self.file_path, self.settings)
-
     async def on_member_update(self, before, after):
         """Member update event."""
         server = before.server
@@ -179,27 +292,18 @@ class RoleHistory:
         # process only on role changes
         if before.roles != after.roles:
 
-            if server.id not in self.settings:
-                self.settings[server.id] = {
-                    "ServerName": str(server),
-                    "ServerID": str(server.id),
-                    "Members": {}
-                }
+            self.init_server(server)
 
-            self.settings[server.id]["ServerName"] = str(server)
+            log = self.server_log(server.id)
 
-            # add member settings if it does not exist
+            # add member history if it does not exist
             # initialize with before data
             # using server time as unique id for role changes
-            if before.id not in self.settings[server.id]["Members"]:
+            if not log.has_member(before.id):
                 self.save_member_data(server, before)
 
-            # create values for timestamp as unique key
-            history = self.settings[server.id]["Members"][after.id]["History"]
-            history[self.server_time()] = self.get_member_data(after)
-
-            # save data
-            dataIO.save_json(self.file_path, self.settings)
+            # buffered; written by flush_task
+            self.save_member_data(server, after)
 
     def server_time(self):
         """Get UTC time instead of server time so data can be ported."""
@@ -218,6 +322,8 @@ def check_folder():
     if not os.path.exists("data/rolehist"):
         print("Creating data/rolehist folder...")
         os.makedirs("data/rolehist")
+    if not os.path.exists(logs_path):
+        os.makedirs(logs_path)
 
 
 def check_file():
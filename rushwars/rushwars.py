@@ -37,6 +37,7 @@ import discord
 import yaml
 from box import Box
 from cogs.utils import checks
+from cogs.utils.chat_formatting import pagify
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 from discord.ext.commands import MemberConverter
@@ -333,6 +334,9 @@ class RushWars:
         await self.bot.send_message(channel, "RushWarsAPI Error. Please try again later…")
 
     def get_emoji(self, name):
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(name)
         for emoji in self.bot.get_all_emojis():
             if emoji.name == str(name):
                 return '<:{}:{}>'.format(emoji.name, emoji.id)
@@ -657,6 +661,7 @@ class RushWars:
         except RushWarsAuditException:
             await self.bot.say("Audit failed because of API error.")
 
+
 class RushWarsAuditException(Exception):
     pass
 
@@ -667,44 +672,38 @@ class BrawlStarsAudit:
     def __init__(self, cog: RushWars = None):
         """Init."""
         self.cog = cog
-
-    async def exec_add_roles(self, d_member, roles, channel=None):
-        try:
-            await self.cog.bot.add_roles(d_member, *roles)
-        except Exception as e:
-            pass
-        else:
-            if channel is not None:
-                await self.cog.bot.send_message(
-                    channel,
-                    "Add {} to {}".format(
-                        ", ".join(
-                            [r.name for r in roles]
-                        ),
-                        d_member
-                    )
-                )
-
-    async def exec_remove_roles(self, d_member, roles, channel=None):
-        try:
-            await self.cog.bot.remove_roles(d_member, *roles)
-        except Exception as e:
-            pass
-        else:
-            if channel is not None:
-                await self.cog.bot.send_message(
-                    channel,
-                    "Remove {} from {}".format(
-                        ", ".join(
-                            [r.name for r in roles]
-                        ),
-                        d_member
-                    )
-                )
+        # batched role changes, or None to apply them directly
+        role_executor = cog.bot.get_cog("RoleExecutor")
+        self.batch = role_executor.batch() if role_executor is not None else None
+
+    async def add_roles(self, member, *roles):
+        """Queue roles to add, or add them now if the RoleExecutor cog is not loaded."""
+        if self.batch is not None:
+            self.batch.add_roles(member, *roles)
+            return
+        roles = [r for r in roles if r is not None]
+        if roles:
+            try:
+                await self.cog.bot.add_roles(member, *roles)
+            except discord.DiscordException:
+                pass
+
+    async def remove_roles(self, member, *roles):
+        """Queue roles to remove, or remove them now if the RoleExecutor cog is not loaded."""
+        if self.batch is not None:
+            self.batch.remove_roles(member, *roles)
+            return
+        roles = [r for r in roles if r is not None]
+        if roles:
+            try:
+                await self.cog.bot.remove_roles(member, *roles)
+            except discord.DiscordException:
+                pass
 
     async def run(self, server: discord.Server = None, exec=False, status_channel=None):
         """Run audit against server."""
         results = dict()
+        out = []
         # Fetch club info
         teams = await self.cog._get_teams(server.id)
         for r, team_tag, in zip(teams.results, teams.team_tags):
@@ -752,17 +751,17 @@ class BrawlStarsAudit:
                 user = server.get_member(member_id)
                 if user is not None:
                     if rw_member_role in user.roles:
-                        await self.cog.bot.send_message(status_channel, "{} is not in our teams".format(user))
+                        out.append("{} is not in our teams".format(user))
                         if exec:
-                            await self.exec_remove_roles(user, rw_members_roles, channel=status_channel)
+                            await self.remove_roles(user, *rw_members_roles)
 
             for member_id in member_ids:
                 user = server.get_member(member_id)
                 if user is not None:
                     if rw_member_role not in user.roles:
-                        await self.cog.bot.send_message(status_channel, "{} is in our teams".format(user))
+                        out.append("{} is in our teams".format(user))
                         if exec:
-                            await self.exec_add_roles(user, [rw_member_role], channel=status_channel)
+                            await self.add_roles(user, rw_member_role)
 
         # teams
         for team_tag, team in results.items():
@@ -782,23 +781,25 @@ class BrawlStarsAudit:
                 user = server.get_member(user_id)
                 if user is not None:
                     if team_role not in user.roles:
-                        await self.cog.bot.send_message(
-                            status_channel,
-                            "{} is in {}".format(user, team.name))
+                        out.append("{} is in {}".format(user, team.name))
                         if exec:
-                            await self.exec_add_roles(user, [team_role], channel=status_channel)
+                            await self.add_roles(user, team_role)
 
             for user_id in non_team_member_ids:
                 user = server.get_member(user_id)
                 if user is not None:
                     if team_role in user.roles:
-                        await self.cog.bot.send_message(
-                            status_channel,
-                            "{} is not in {}".format(user, team.name))
+                        out.append("{} is not in {}".format(user, team.name))
                         if exec:
-                            await self.exec_remove_roles(user, [team_role], channel=status_channel)
+                            await self.remove_roles(user, team_role)
+
+        if status_channel is not None and out:
+            for page in pagify("\n".join(out)):
+                await self.cog.bot.send_message(status_channel, page)
+
+        if exec and self.batch is not None:
+            await self.batch.run_and_report(channel=status_channel)
 
-        # print_json(results)
         await self.cog.bot.send_message(status_channel, "Audit finished")
 
 
@@ -69,6 +69,9 @@ class Timer:
         return True
 
     def get_emoji(self, name):
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(name)
         for emoji in self.bot.get_all_emojis():
             if emoji.name == str(name):
                 return '<:{}:{}>'.format(emoji.name, emoji.id)
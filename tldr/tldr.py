@@ -31,6 +31,7 @@ import discord
 
 import operator
 import string
+from collections import deque
 
 from discord import Message
 from discord import Server
@@ -55,6 +56,12 @@ PATH = os.path.join(*PATH_LIST)
 JSON = os.path.join(*PATH_LIST, "settings.json")
 HOST = '127.0.0.1'
 INTERVAL = 5
+# tokenised messages kept per channel
+WINDOW_SIZE = 1000
+# channels with a window; least recently summarised are dropped first
+MAX_WINDOWS = 50
+# windows not summarised for this many seconds stop being fed
+WINDOW_IDLE = datetime.timedelta(hours=6).total_seconds()
 
 
 
@@ -80,6 +87,14 @@ class RakeKeywordExtractor:
         self.stopwords = set(nltk.corpus.stopwords.words())
         self.top_fraction = 1 # consider top third candidate keywords by score
 
+    def candidates(self, text):
+        """Tokenise text into candidate phrases."""
+        return self._generate_candidate_keywords(nltk.sent_tokenize(text))
+
+    def candidates_list(self, texts):
+        """Tokenise each text into candidate phrases."""
+        return [self.candidates(text) for text in texts]
+
     def _generate_candidate_keywords(self, sentences):
         phrase_list = []
         for sentence in sentences:
@@ -126,8 +141,10 @@ class RakeKeywordExtractor:
         return phrase_scores
 
     def extract(self, text, incl_scores=False):
-        sentences = nltk.sent_tokenize(text)
-        phrase_list = self._generate_candidate_keywords(sentences)
+        return self.score(self.candidates(text), incl_scores=incl_scores)
+
+    def score(self, phrase_list, incl_scores=False):
+        """Rank already tokenised candidate phrases."""
         word_scores = self._calculate_word_scores(phrase_list)
         phrase_scores = self._calculate_phrase_scores(
             phrase_list, word_scores)
@@ -141,6 +158,32 @@ class RakeKeywordExtractor:
                 sorted_phrase_scores[0:int(n_phrases/self.top_fraction)])
 
 
+class ChannelWindow:
+    """Candidate phrases of the recent messages of a channel, oldest first."""
+
+    def __init__(self):
+        self.phrases = deque(maxlen=WINDOW_SIZE)
+        # number of channel messages, including empty ones, the window covers
+        self.covered = 0
+        # True if the seeding fetch reached the start of the channel
+        self.exhausted = False
+        self.last_used = 0
+
+    def covers(self, count):
+        return self.exhausted or self.covered >= count
+
+
+_extractor = None
+
+
+def get_extractor():
+    """Process-wide extractor so stopwords are only loaded once."""
+    global _extractor
+    if _extractor is None:
+        _extractor = RakeKeywordExtractor()
+    return _extractor
+
+
 class TLDR:
     """Too Lazy; Didn’t Read.
 
@@ -150,6 +193,40 @@ class TLDR:
         self.bot = bot
         self.tags = []
         self.settings = dataIO.load_json(JSON)
+        # channel id -> ChannelWindow, only for channels summarised with tldr
+        self.windows = {}
+        self.bot.loop.run_in_executor(None, get_extractor)
+
+    async def run_extractor(self, method, *args):
+        """Run extractor method in the default executor."""
+        rake = get_extractor()
+        return await self.bot.loop.run_in_executor(None, getattr(rake, method), *args)
+
+    async def on_message(self, message: Message):
+        """Tokenise new messages into the channel window, if the channel has one."""
+        if message.server is None:
+            return
+        window = self.windows.get(message.channel.id)
+        if window is None:
+            return
+        if self.bot.loop.time() - window.last_used > WINDOW_IDLE:
+            self.windows.pop(message.channel.id, None)
+            return
+        window.covered += 1
+        if message.content:
+            phrases = await self.run_extractor("candidates", message.content)
+            window.phrases.append(phrases)
+
+    def get_window(self, channel_id):
+        """Window of channel, created if needed and marked as used."""
+        window = self.windows.get(channel_id)
+        if window is None:
+            window = self.windows[channel_id] = ChannelWindow()
+            if len(self.windows) > MAX_WINDOWS:
+                oldest = min(self.windows, key=lambda k: self.windows[k].last_used)
+                self.windows.pop(oldest, None)
+        window.last_used = self.bot.loop.time()
+        return window
 
     def save(self):
         dataIO.save_json(JSON, self.settings)
@@ -170,8 +247,7 @@ class TLDR:
         channel = ctx.message.channel
         message = await self.bot.get_message(channel, message_id)
 
-        rake = RakeKeywordExtractor()
-        keywords = rake.extract(message.content, incl_scores=True)
+        keywords = await self.run_extractor("extract", message.content, True)
 
         await self.bot.say("original")
         await self.bot.say(message.content)
@@ -183,12 +259,28 @@ class TLDR:
     async def tldr_messages(self, ctx, count: int, top=10):
         """Extract keywords from last X messages."""
         channel = ctx.message.channel
-        messages = []
-        async for message in self.bot.logs_from(channel, limit=count + 1):
-            messages.append(message.content)
-
-        rake = RakeKeywordExtractor()
-        keywords = rake.extract(" ".join(messages), incl_scores=True)
+        if count > WINDOW_SIZE - 1:
+            await self.bot.say("Can only process up to {} messages.".format(WINDOW_SIZE - 1))
+            return
+        window = self.get_window(channel.id)
+        if not window.covers(count + 1):
+            # seed the window once; later calls are fed from on_message
+            fetched = 0
+            messages = []
+            async for message in self.bot.logs_from(channel, limit=count + 1):
+                fetched += 1
+                if message.content:
+                    messages.append(message.content)
+            messages.reverse()
+            candidates = await self.run_extractor("candidates_list", messages)
+            window.phrases.clear()
+            window.phrases.extend(candidates)
+            window.covered = fetched
+            window.exhausted = fetched < count + 1
+        candidates = list(window.phrases)[-(count + 1):]
+
+        phrase_list = [p for phrases in candidates for p in phrases]
+        keywords = await self.run_extractor("score", phrase_list, True)
 
         out = []
         out.append("Keywords found in last {} messages: ".format(count))
@@ -139,6 +139,9 @@ class ToggleRole:
             title="Toggleable Roles"
         )
         for actor_role, v in self.settings[server.id].items():
+            # ignore special AUTO key
+            if actor_role == 'AUTO':
+                continue
             toggleable_roles = v.keys()
             toggleable_roles = sorted(toggleable_roles, key=lambda x: x.lower())
             if len(toggleable_roles):
@@ -271,7 +274,11 @@ class ToggleRole:
         return em
 
     async def post_togglerole_embeds(self, server, channel):
-        """Post embeds for user to self-toggle via reactions."""
+        """Post embeds for user to self-toggle via reactions.
+
+        Posted messages are kept in a registry under AUTO so later runs only
+        edit embeds whose actor roles changed and add missing reactions.
+        """
         self.check_server_settings(server)
 
         # create list of toggleable roles
@@ -287,26 +294,57 @@ class ToggleRole:
                     toggleables[t_role] = []
                 toggleables[t_role].append(actor_role)
 
-        # delete channel messages
-        if channel is not None:
-            await self.bot.purge_from(channel, limit=100)
+        auto = self.settings[server.id]["AUTO"]
+        registry = auto.get("messages")
 
-        message = None
-        for t_role, actor_roles in toggleables.items():
+        # delete channel messages on first post only
+        if registry is None:
+            if channel is not None:
+                await self.bot.purge_from(channel, limit=100)
+            registry = auto["messages"] = dict()
+
+        # remove messages of roles no longer toggleable
+        for t_role in list(registry.keys()):
+            if t_role not in toggleables:
+                msg = await self.registry_message(channel, registry.pop(t_role))
+                if msg is not None:
+                    await self.bot.delete_message(msg)
+
+        for t_role, actor_roles in sorted(toggleables.items()):
+            actor_roles = sorted(actor_roles)
             em = self.role_embed(server, t_role, actor_roles)
             if em is None:
                 continue
 
-            msg = await self.bot.send_message(channel, embed=em)
+            entry = registry.get(t_role)
+            msg = await self.registry_message(channel, entry)
+            if msg is None:
+                msg = await self.bot.send_message(channel, embed=em)
+            elif entry.get("actor_roles") != actor_roles:
+                msg = await self.bot.edit_message(msg, embed=em)
 
-            await self.bot.add_reaction(msg, "✅")
-            await self.bot.add_reaction(msg, "❌")
+            registry[t_role] = dict(message_id=msg.id, actor_roles=actor_roles)
 
-            # save first message
-            if message is None:
-                message = msg
+            # only add reactions the bot is missing
+            reacted = [r.emoji for r in msg.reactions if r.me]
+            for emoji in ["✅", "❌"]:
+                if emoji not in reacted:
+                    await self.bot.add_reaction(msg, emoji)
 
+        dataIO.save_json(SETTINGS_JSON, self.settings)
 
+    async def registry_message(self, channel, entry):
+        """Return registered message, or None if it no longer exists."""
+        if channel is None or entry is None:
+            return None
+        message_id = entry.get("message_id")
+        msg = discord.utils.get(self.bot.messages, id=message_id)
+        if msg is not None:
+            return msg
+        try:
+            return await self.bot.get_message(channel, message_id)
+        except discord.NotFound:
+            return None
 
     async def post_togglerole_task(self):
         """Auto post tasks."""
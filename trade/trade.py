@@ -23,6 +23,7 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import asyncio
+import heapq
 from collections import Counter
 from collections import defaultdict
 from collections import namedtuple
@@ -48,6 +49,11 @@ JSON = os.path.join(PATH, "settings.json")
 CARDS_AKA_YML_URL = 'https://raw.githubusercontent.com/smlbiobot/SML-Cogs/master/deck/data/cards_aka.yaml'
 CARDS_JSON_URL = 'https://royaleapi.github.io/cr-api-data/json/cards.json'
 
+# trades expire after this many seconds
+TRADE_TTL = dt.timedelta(days=2).total_seconds()
+# seconds to wait before writing settings after a change
+SAVE_DELAY = 5
+
 
 def nested_dict():
     """Recursively nested defaultdict."""
@@ -125,51 +131,6 @@ class Settings(Dict):
         self[server_id].trades = dict()
         self.save()
 
-    def remove_old_trades(self, server_id):
-        """Look for trade items that’s older than 24 hours and remove them."""
-        now = get_now_timestamp()
-        limit = dt.timedelta(days=2).total_seconds()
-        for k, v in self[server_id].trades.copy().items():
-            if abs(now - v.get('timestamp')) > limit:
-                self[server_id].trades.pop(k)
-        self.save()
-
-    def add_trade_item(self, item: TradeItem):
-        """Add trade item if valid."""
-        self.check_server(item.server_id)
-        id_ = str(item.timestamp)
-        if all([item.give_card, item.get_card, item.rarity]):
-            self[item.server_id].trades[id_] = item._asdict()
-            self.save()
-            return True
-        return False
-
-    def remove_trade_item(self, item: TradeItem):
-        self.check_server(item.server_id)
-
-        removed = False
-
-        trades = self[item.server_id].trades
-        for k, v in trades.copy().items():
-            if all([
-                v.get('get_card') == item.get_card,
-                v.get('give_card') == item.give_card,
-                v.get('clan_tag') == item.clan_tag,
-            ]):
-                trades.pop(k)
-                removed = True
-
-        self.save()
-
-        return removed
-
-    def get_trades(self, server_id):
-        """Return list of trades"""
-        self.check_server(server_id)
-        self.remove_old_trades(server_id)
-        trades = [TradeItem(**v) for k, v in self[server_id].trades.items()]
-        return trades
-
     def enable_auto(self, server_id, channel_id):
         """Enable auto posting"""
         self.check_server(server_id)
@@ -185,6 +146,93 @@ class Settings(Dict):
         self.save()
 
 
+class TradeBook:
+    """Trades of a server, indexed by give card, get card, rarity and clan.
+
+    The trades dict in settings stays the source of truth for persistence;
+    the book mirrors it and keeps a heap of (timestamp, id) for expiry.
+    """
+
+    def __init__(self, trades):
+        """Init with the server trades dict from settings."""
+        self.trades = trades
+        self.items = {}
+        self.by_give = defaultdict(set)
+        self.by_get = defaultdict(set)
+        self.by_rarity = defaultdict(set)
+        self.by_clan = defaultdict(set)
+        self.expiry = []
+        for id_, v in trades.items():
+            self._index(id_, TradeItem(**v))
+
+    @staticmethod
+    def rarity_key(rarity):
+        return rarity[0].lower()
+
+    def _index(self, id_, item: TradeItem):
+        if not all([item.give_card, item.get_card, item.rarity]):
+            return
+        self.items[id_] = item
+        self.by_give[item.give_card].add(id_)
+        self.by_get[item.get_card].add(id_)
+        self.by_rarity[self.rarity_key(item.rarity)].add(id_)
+        self.by_clan[item.clan_tag].add(id_)
+        heapq.heappush(self.expiry, (item.timestamp, id_))
+
+    def _unindex(self, id_):
+        item = self.items.pop(id_, None)
+        if item is None:
+            return
+        self.by_give[item.give_card].discard(id_)
+        self.by_get[item.get_card].discard(id_)
+        self.by_rarity[self.rarity_key(item.rarity)].discard(id_)
+        self.by_clan[item.clan_tag].discard(id_)
+
+    def add(self, item: TradeItem):
+        """Add trade item if valid."""
+        if not all([item.give_card, item.get_card, item.rarity]):
+            return False
+        id_ = str(item.timestamp)
+        self._unindex(id_)
+        self.trades[id_] = item._asdict()
+        self._index(id_, item)
+        return True
+
+    def remove(self, id_):
+        self._unindex(id_)
+        self.trades.pop(id_, None)
+
+    def expire(self, now):
+        """Remove trades older than TRADE_TTL. Return True if any were removed."""
+        removed = False
+        while self.expiry and now - self.expiry[0][0] > TRADE_TTL:
+            timestamp, id_ = heapq.heappop(self.expiry)
+            item = self.items.get(id_)
+            # skip stale heap entries of replaced items
+            if item is not None and item.timestamp == timestamp:
+                self.remove(id_)
+                removed = True
+        return removed
+
+    def query(self, rarity=None, give_card=None, get_card=None, clan_tag=None):
+        """Return trade items matching all given filters."""
+        sets = []
+        if rarity is not None:
+            sets.append(self.by_rarity.get(self.rarity_key(rarity), set()))
+        if give_card is not None:
+            sets.append(self.by_give.get(give_card, set()))
+        if get_card is not None:
+            sets.append(self.by_get.get(get_card, set()))
+        if clan_tag is not None:
+            sets.append(self.by_clan.get(clan_tag, set()))
+
+        if sets:
+            ids = set.intersection(*sorted(sets, key=len))
+        else:
+            ids = self.items.keys()
+        return [self.items[id_] for id_ in ids]
+
+
 class Trade:
     """Clash Royale Trading"""
 
@@ -195,6 +243,58 @@ class Trade:
         self._cards_aka = None
         self._aka_to_card = None
         self._cards_constants = None
+        self._cards_by_key = None
+        self._books = {}
+        self._save_handle = None
+
+    def __unload(self):
+        """Write pending changes."""
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self.settings.save()
+
+    def schedule_save(self):
+        """Save settings after SAVE_DELAY, coalescing changes made in between."""
+        if self._save_handle is None:
+            self._save_handle = self.bot.loop.call_later(SAVE_DELAY, self._save)
+
+    def _save(self):
+        self._save_handle = None
+        self.settings.save()
+
+    def get_book(self, server_id):
+        """Return the trade book of a server with expired trades removed."""
+        self.settings.check_server(server_id)
+        trades = self.settings[server_id].trades
+        book = self._books.get(server_id)
+        # rebuild if the trades dict was replaced, e.g. by reset_server
+        if book is None or book.trades is not trades:
+            book = TradeBook(trades)
+            self._books[server_id] = book
+        if book.expire(get_now_timestamp()):
+            self.schedule_save()
+        return book
+
+    def add_trade_item(self, item: TradeItem):
+        """Add trade item if valid."""
+        if self.get_book(item.server_id).add(item):
+            self.schedule_save()
+            return True
+        return False
+
+    def remove_trade_item(self, item: TradeItem):
+        """Remove trades matching give card, get card and clan tag."""
+        book = self.get_book(item.server_id)
+        items = book.query(give_card=item.give_card, get_card=item.get_card, clan_tag=item.clan_tag)
+        for i in items:
+            book.remove(str(i.timestamp))
+        if items:
+            self.schedule_save()
+        return len(items) > 0
+
+    def get_trades(self, server_id):
+        """Return list of trades"""
+        return list(self.get_book(server_id).items.values())
 
     async def get_cards_aka(self):
         if self._cards_aka is None:
@@ -204,8 +304,17 @@ class Trade:
                     self._cards_aka = yaml.load(data)
         return self._cards_aka
 
+    @property
+    def card_constants(self):
+        """Card constants store of the Deck cog, if loaded."""
+        deck = self.bot.get_cog("Deck")
+        return getattr(deck, 'card_constants', None)
+
     async def aka_to_card(self, abbreviation):
         """Go through all abbreviation to find card dict"""
+        card_constants = self.card_constants
+        if card_constants is not None:
+            return card_constants.by_alias.get(abbreviation)
         if self._aka_to_card is None:
             akas = await self.get_cards_aka()
             self._aka_to_card = dict()
@@ -226,26 +335,35 @@ class Trade:
                     self._cards_constants = await resp.json()
         return self._cards_constants
 
+    async def get_cards_by_key(self):
+        """Card key -> card dict."""
+        if self._cards_by_key is None:
+            self._cards_by_key = {c.get('key'): c for c in await self.get_cards_constants()}
+        return self._cards_by_key
+
     async def check_cards(self, cards=None):
         """Make sure all cards have the same rarity."""
-        rarities = []
-        for c in await self.get_cards_constants():
-            for card in cards:
-                if c.get('key') == card:
-                    rarities.append(c.get('rarity'))
+        rarities = [await self.get_rarity(card) for card in cards]
+        rarities = [r for r in rarities if r is not None]
         if len(set(rarities)) == 1:
             return True
         return False
 
     async def get_rarity(self, card):
-        for c in await self.get_cards_constants():
-            if c.get('key') == card:
-                return c.get('rarity')
-        return None
+        card_constants = self.card_constants
+        if card_constants is not None:
+            return card_constants.rarity(card)
+        c = (await self.get_cards_by_key()).get(card)
+        if c is None:
+            return None
+        return c.get('rarity')
 
     def get_emoji(self, name):
         """Return emoji by name."""
         name = name.replace('-', '')
+        emoji_index = self.bot.get_cog("EmojiIndex")
+        if emoji_index is not None:
+            return emoji_index.tag(name)
         for emoji in self.bot.get_all_emojis():
             if emoji.name == name:
                 return '<:{name}:{id}>'.format(name=emoji.name, id=emoji.id)
@@ -316,14 +434,13 @@ class Trade:
 
         rarity = rarities[0]
 
-        self.settings.add_trade_item(TradeItem(server_id=server.id,
-                                               author_id=author.id,
-                                               give_card=give_card,
-                                               get_card=get_card,
-                                               clan_tag=clan_tag,
-                                               rarity=rarity,
-                                               timestamp=get_now_timestamp()))
-        self.settings.save()
+        self.add_trade_item(TradeItem(server_id=server.id,
+                                      author_id=author.id,
+                                      give_card=give_card,
+                                      get_card=get_card,
+                                      clan_tag=clan_tag,
+                                      rarity=rarity,
+                                      timestamp=get_now_timestamp()))
         await self.bot.say(
             "Give: {give_card}, Get: {get_card}, {clan_tag}, {rarity}".format(
                 give_card=give_card,
@@ -342,13 +459,22 @@ class Trade:
         get_card = await self.aka_to_card(get)
         clan_tag = clean_tag(clan_tag)
 
+        # unknown aliases resolve to None, which would match every trade
+        if give_card is None:
+            await self.bot.say("Card not found: {}".format(give))
+            return
+
+        if get_card is None:
+            await self.bot.say("Card not found: {}".format(get))
+            return
+
         trade_item = TradeItem(
             server_id=server.id,
             give_card=give_card,
             get_card=get_card,
             clan_tag=clan_tag
         )
-        if self.settings.remove_trade_item(trade_item):
+        if self.remove_trade_item(trade_item):
             await self.bot.say('Trade removed')
         else:
             await self.bot.say("Cannot find your trade.")
@@ -421,9 +547,7 @@ class Trade:
                 )
 
         for item in trade_items:
-            self.settings.add_trade_item(item)
-
-        self.settings.save()
+            self.add_trade_item(item)
 
         o = ["Give: {give_card}, Get: {get_card}, {clan_tag}".format(**item._asdict()) for item in trade_items]
         for page in pagify("\n".join(o)):
@@ -458,47 +582,35 @@ class Trade:
             give_card=pa.give or None,
             get_card=pa.get or None
         )
+        if included_items is None:
+            await self.bot.say("Card not found.")
+            return
 
         channel = ctx.message.channel
         await self.send_trade_list(channel, included_items)
 
     async def get_filtered_list(self, server: discord.Server = None, rarity=None, give_card=None, get_card=None,
                                 clan_tag=None):
-        """Return filtered list items"""
-        items = self.settings.get_trades(server.id)
-
-        included_items = []
-
-        for item in items:
-            # skip invalid items
-            if not all([item.give_card, item.get_card, item.rarity]):
-                continue
-
-            # filter rarities
-            if rarity is not None:
-                if item.rarity[0].lower() != rarity.lower():
-                    continue
-
-            # filter give
-            if give_card is not None:
-                card = await self.aka_to_card(give_card)
-                if item.give_card != card:
-                    continue
-
-            # filter get
-            if get_card is not None:
-                card = await self.aka_to_card(get_card)
-                if item.get_card != card:
-                    continue
+        """Return filtered list items.
 
-            # filter clan_tag
-            if clan_tag is not None:
-                if item.clan_tag != clan_tag:
-                    continue
-
-            included_items.append(item)
+        Return None if a card alias cannot be resolved.
+        """
+        # resolve aliases once per query
+        if give_card is not None:
+            give_card = await self.aka_to_card(give_card)
+            if give_card is None:
+                return None
+        if get_card is not None:
+            get_card = await self.aka_to_card(get_card)
+            if get_card is None:
+                return None
 
-        return included_items
+        return self.get_book(server.id).query(
+            rarity=rarity,
+            give_card=give_card,
+            get_card=get_card,
+            clan_tag=clan_tag
+        )
 
     @trade.command(name="get", aliases=['gt'], pass_context=True)
     async def list_get_card(self, ctx, card):
@@ -508,6 +620,9 @@ class Trade:
             server=server,
             get_card=card
         )
+        if included_items is None:
+            await self.bot.say("Card not found: {}".format(card))
+            return
         channel = ctx.message.channel
         await self.send_trade_list(channel, included_items)
 
@@ -519,6 +634,9 @@ class Trade:
             server=server,
             give_card=card
         )
+        if included_items is None:
+            await self.bot.say("Card not found: {}".format(card))
+            return
         channel = ctx.message.channel
         await self.send_trade_list(channel, included_items)
 
@@ -550,7 +668,7 @@ class Trade:
     async def trade_info(self, ctx):
         """List DB info."""
         server = ctx.message.server
-        items = self.settings.get_trades(server.id)
+        items = self.get_trades(server.id)
 
         author_ids = [item.author_id for item in items]
         o = []
@@ -613,12 +731,11 @@ class Trade:
     async def auto_post_trades(self):
         """Post trades to channel."""
         for server_id, v in self.settings.items():
-            self.settings.remove_old_trades(server_id)
             if v.auto and v.auto.enabled:
                 channel_id = v.auto.channel_id
                 channel = self.bot.get_channel(channel_id)
                 if channel is not None:
-                    msg = await self.send_trade_list(channel, self.settings.get_trades(server_id))
+                    msg = await self.send_trade_list(channel, self.get_trades(server_id))
 
                     # delete channel messages
                     await self.bot.purge_from(channel, limit=100, before=msg)